@@ -5,8 +5,12 @@ setup(
     version="0.1",
     packages=find_packages(),
     install_requires=[
-        'flask',
+        'fastapi',
+        'uvicorn',
         'aiohttp',
         'pydantic'
-    ]
+    ],
+    extras_require={
+        'fast': ['orjson']  # 安装后自动启用更快的JSON编解码
+    }
 )
\ No newline at end of file
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import math
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+import uvicorn
+from fastapi import HTTPException
+from ..mock_agents.base import MockAgentBase, MessageRequest
+from ..mock_agents.agents import SessionAgent, CalculatorAgent, CheckerAgent
+
+@dataclass
+class LatencyProfile:
+    """模拟智能体的延迟与故障注入配置"""
+    distribution: str = 'lognormal'   # fixed / uniform / lognormal
+    mean: float = 0.02                # 平均延迟(秒)
+    spread: float = 0.5               # uniform为±比例，lognormal为sigma
+    error_rate: float = 0.0           # 返回500的概率
+    slow_rate: float = 0.0            # 慢尾请求的概率
+    slow_factor: float = 20.0         # 慢尾请求的延迟倍数
+
+    def sample(self) -> float:
+        """采样一次请求延迟"""
+        if self.distribution == 'fixed':
+            delay = self.mean
+        elif self.distribution == 'uniform':
+            delay = random.uniform(self.mean * (1 - self.spread), self.mean * (1 + self.spread))
+        else:
+            # 使lognormal的均值等于mean
+            mu = _lognormal_mu(self.mean, self.spread)
+            delay = random.lognormvariate(mu, self.spread)
+        if random.random() < self.slow_rate:
+            delay *= self.slow_factor
+        return max(0.0, delay)
+
+def _lognormal_mu(mean: float, sigma: float) -> float:
+    return math.log(max(mean, 1e-6)) - sigma ** 2 / 2
+
+@dataclass
+class FleetConfig:
+    """模拟智能体集群配置"""
+    replicas: int = 2                 # SESSION/MISSION/CHECKER每种类型的副本数
+    functions: int = 3                # 每个请求调用的FUNCTION智能体数量
+    base_port: int = 9100
+    profiles: Dict[str, LatencyProfile] = field(default_factory=lambda: {
+        'SESSION': LatencyProfile(mean=0.01),
+        'MISSION': LatencyProfile(mean=0.03),
+        'FUNCTION': LatencyProfile(mean=0.05, slow_rate=0.01),
+        'CHECKER': LatencyProfile(mean=0.02),
+    })
+
+class FleetMissionAgent(MockAgentBase):
+    """返回固定FUNCTION列表的任务分发智能体"""
+
+    def __init__(self, name: str, port: int, function_names: List[str]):
+        super().__init__(name, port)
+        self.function_names = function_names
+
+    async def process(self, request: MessageRequest):
+        return {
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": json.dumps({"target_agents": self.function_names, "dependencies": {}})
+                },
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}
+        }
+
+class FaultInjectingAgent(MockAgentBase):
+    """在被包装的模拟智能体前注入延迟、错误与慢尾"""
+
+    def __init__(self, name: str, port: int, delegate: MockAgentBase, profile: LatencyProfile):
+        self.delegate = delegate
+        self.profile = profile
+        self.requests = 0
+        self.errors = 0
+        super().__init__(name, port)
+
+    async def process(self, request: MessageRequest):
+        self.requests += 1
+        await asyncio.sleep(self.profile.sample())
+        if random.random() < self.profile.error_rate:
+            self.errors += 1
+            raise HTTPException(status_code=500, detail="injected failure")
+        return await self.delegate.process(request)
+
+@dataclass
+class Fleet:
+    """运行中的模拟智能体集群"""
+    agents: List[Dict[str, Any]]
+    servers: List[uvicorn.Server]
+    tasks: List[asyncio.Task]
+
+    def registrations(self) -> List[Dict[str, Any]]:
+        """/agent/register请求体列表"""
+        return [
+            {
+                "name": agent['name'],
+                "type": agent['type'],
+                "endpoints": {
+                    "health": f"http://127.0.0.1:{agent['port']}/health",
+                    "service": f"http://127.0.0.1:{agent['port']}/service"
+                },
+                "properties": agent['properties']
+            }
+            for agent in self.agents
+        ]
+
+    async def stop(self) -> None:
+        """停止集群中的所有服务"""
+        for server in self.servers:
+            server.should_exit = True
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+async def start_fleet(config: Optional[FleetConfig] = None) -> Fleet:
+    """按配置启动模拟智能体集群"""
+    config = config or FleetConfig()
+    function_names = [f"function-{i}" for i in range(config.functions)]
+    port = config.base_port
+    agents = []
+
+    def add(name: str, agent_type: str, delegate: MockAgentBase, properties: Dict[str, Any]):
+        nonlocal port
+        agent = FaultInjectingAgent(name, port, delegate, config.profiles[agent_type])
+        agents.append({'name': name, 'type': agent_type, 'port': port, 'properties': properties, 'agent': agent})
+        port += 1
+
+    for i in range(config.replicas):
+        add(f"session-{i}", "SESSION", SessionAgent(f"session-{i}", 0), {})
+        add(f"mission-{i}", "MISSION", FleetMissionAgent(f"mission-{i}", 0, function_names), {})
+        add(f"checker-{i}", "CHECKER", CheckerAgent(f"checker-{i}", 0), {})
+    for name in function_names:
+        add(name, "FUNCTION", CalculatorAgent(name, 0), {"capability": "math"})
+
+    servers, tasks = [], []
+    for agent in agents:
+        server = uvicorn.Server(uvicorn.Config(
+            agent['agent'].app,
+            host="127.0.0.1",
+            port=agent['port'],
+            log_level="warning",
+            lifespan="off"
+        ))
+        servers.append(server)
+        tasks.append(asyncio.create_task(server.serve()))
+
+    while not all(server.started for server in servers):
+        if any(task.done() for task in tasks):
+            await asyncio.gather(*tasks)  # 抛出启动失败的异常
+        await asyncio.sleep(0.05)
+    return Fleet(agents, servers, tasks)
@@ -0,0 +1,120 @@
+import asyncio
+import random
+import resource
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+@dataclass
+class LoadResult:
+    """压测原始结果"""
+    duration: float
+    latencies: List[float] = field(default_factory=list)   # 成功请求延迟(秒)
+    failures: int = 0
+    errors: Dict[str, int] = field(default_factory=dict)
+    py_alloc_peak: Optional[int] = None                    # tracemalloc峰值(字节)
+
+    @property
+    def completed(self) -> int:
+        return len(self.latencies) + self.failures
+
+def percentile(samples: List[float], q: float) -> Optional[float]:
+    """计算分位数（最近秩法）"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+def summarize(result: LoadResult) -> Dict[str, Any]:
+    """汇总吞吐、延迟分位数、失败率与内存"""
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 2)
+
+    summary = {
+        'requests': result.completed,
+        'throughput_rps': round(len(result.latencies) / result.duration, 2) if result.duration else 0.0,
+        'failure_rate': round(result.failures / result.completed, 4) if result.completed else 0.0,
+        'p50_ms': ms(percentile(result.latencies, 0.50)),
+        'p95_ms': ms(percentile(result.latencies, 0.95)),
+        'p99_ms': ms(percentile(result.latencies, 0.99)),
+        'max_ms': ms(max(result.latencies) if result.latencies else None),
+        # Linux下ru_maxrss单位为KB
+        'rss_peak_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'errors': result.errors,
+    }
+    if result.py_alloc_peak is not None:
+        summary['py_alloc_peak_mb'] = round(result.py_alloc_peak / 1024 / 1024, 2)
+    return summary
+
+async def run_open_loop(
+    target: Callable[[], Awaitable[Any]],
+    rate: float,
+    duration: float,
+    trace_memory: bool = False
+) -> LoadResult:
+    """
+    开环压测：按泊松过程以rate请求/秒发起请求，持续duration秒。
+
+    发起请求不等待之前的请求完成，因此系统变慢时在途请求会累积，
+    能够反映真实的排队延迟（避免闭环压测的coordinated omission）。
+    """
+    if trace_memory:
+        tracemalloc.start()
+    result = LoadResult(duration=duration)
+
+    async def one() -> None:
+        started = time.perf_counter()
+        try:
+            await target()
+            result.latencies.append(time.perf_counter() - started)
+        except Exception as e:
+            result.failures += 1
+            name = type(e).__name__
+            result.errors[name] = result.errors.get(name, 0) + 1
+
+    tasks = []
+    started = time.perf_counter()
+    next_at = started
+    while True:
+        next_at += random.expovariate(rate)
+        if next_at - started >= duration:
+            break
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(one()))
+    await asyncio.gather(*tasks)
+    result.duration = time.perf_counter() - started
+
+    if trace_memory:
+        result.py_alloc_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+# 与基线比较时各指标允许的劣化比例，以及数值越大越好的指标
+REGRESSION_TOLERANCE = {
+    'throughput_rps': 0.10,
+    'p50_ms': 0.20,
+    'p95_ms': 0.25,
+    'p99_ms': 0.30,
+    'failure_rate': 0.01,   # 失败率为绝对值容忍：允许上升1个百分点
+}
+HIGHER_IS_BETTER = {'throughput_rps'}
+
+def compare_to_baseline(summary: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """与基线结果比较，返回超出容忍范围的劣化说明"""
+    regressions = []
+    for metric, tolerance in REGRESSION_TOLERANCE.items():
+        current, expected = summary.get(metric), baseline.get(metric)
+        if current is None or expected is None:
+            continue
+        if metric in HIGHER_IS_BETTER:
+            regressed = current < expected * (1 - tolerance)
+        elif metric == 'failure_rate':
+            regressed = current > expected + tolerance
+        else:
+            regressed = current > expected * (1 + tolerance)
+        if regressed:
+            regressions.append(f"{metric}: {current} (baseline {expected}, tolerance {tolerance:.0%})")
+    return regressions
@@ -0,0 +1,156 @@
+"""
+端到端压测入口。
+
+    python -m tests.benchmark.run --target service --rate 50 --duration 10
+    python -m tests.benchmark.run --target http --save-baseline
+
+target=service直接驱动WorkflowService.process_message；target=http通过uvicorn
+启动ASGI前端并经由/agent/register与/message完成注册和调用。
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+from dataclasses import asdict
+from typing import Any, Dict, Optional
+import aiohttp
+import uvicorn
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from workflow_manager.agent_registry import AgentRegistry
+from workflow_manager.models.agent import Agent
+from workflow_manager.models.message import Message
+from workflow_manager.services.workflow import WorkflowService
+from .fleet import FleetConfig, start_fleet
+from .loadgen import run_open_loop, summarize, compare_to_baseline
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+async def _bench_service(fleet, rate: float, duration: float, trace_memory: bool):
+    registry = AgentRegistry()
+    for registration in fleet.registrations():
+        await registry.register(Agent(**registration))
+    workflow = WorkflowService(registry)
+    await workflow.start()
+    try:
+        message = lambda: Message(user_id="bench_user", content="1+1等于几", session_id=None)
+        return await run_open_loop(lambda: workflow.process_message(message()), rate, duration, trace_memory)
+    finally:
+        await workflow.close()
+
+async def _bench_http(fleet, rate: float, duration: float, trace_memory: bool, port: int):
+    from workflow_manager.app import app
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as session:
+            for registration in fleet.registrations():
+                async with session.post(f"{base_url}/agent/register", json=registration) as response:
+                    response.raise_for_status()
+
+            # 每个请求使用不同的用户，避免并发的相同请求被single-flight合并为一次执行
+            request_ids = itertools.count()
+
+            async def send():
+                async with session.post(f"{base_url}/message", json={
+                    "user_id": f"bench_user_{next(request_ids)}",
+                    "content": "1+1等于几",
+                    "session_id": None
+                }) as response:
+                    body = await response.read()
+                    if response.status != 200:
+                        raise RuntimeError(f"HTTP {response.status}: {body[:200]!r}")
+
+            return await run_open_loop(send, rate, duration, trace_memory)
+    finally:
+        server.should_exit = True
+        await serve_task
+
+async def run_benchmark(
+    target: str = 'service',
+    rate: float = 50,
+    duration: float = 10,
+    fleet_config: Optional[FleetConfig] = None,
+    trace_memory: bool = False,
+    http_port: int = 9099
+) -> Dict[str, Any]:
+    """启动模拟集群并执行一次压测，返回汇总结果"""
+    fleet_config = fleet_config or FleetConfig()
+    fleet = await start_fleet(fleet_config)
+    try:
+        if target == 'http':
+            result = await _bench_http(fleet, rate, duration, trace_memory, http_port)
+        else:
+            result = await _bench_service(fleet, rate, duration, trace_memory)
+    finally:
+        await fleet.stop()
+
+    summary = summarize(result)
+    summary['scenario'] = {
+        'target': target,
+        'rate': rate,
+        'duration': duration,
+        'replicas': fleet_config.replicas,
+        'functions': fleet_config.functions,
+        'profiles': {k: asdict(v) for k, v in fleet_config.profiles.items()},
+    }
+    return summary
+
+def _scenario_key(summary: Dict[str, Any]) -> str:
+    scenario = summary['scenario']
+    return f"{scenario['target']}-r{scenario['rate']}-n{scenario['replicas']}-f{scenario['functions']}"
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="工作流端到端压测")
+    parser.add_argument('--target', choices=['service', 'http'], default='service')
+    parser.add_argument('--rate', type=float, default=50, help="每秒请求数（泊松到达）")
+    parser.add_argument('--duration', type=float, default=10, help="压测时长(秒)")
+    parser.add_argument('--replicas', type=int, default=2, help="SESSION/MISSION/CHECKER副本数")
+    parser.add_argument('--functions', type=int, default=3, help="每个请求调用的FUNCTION数量")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="所有模拟智能体的错误注入概率")
+    parser.add_argument('--slow-rate', type=float, default=None, help="所有模拟智能体的慢尾概率")
+    parser.add_argument('--trace-memory', action='store_true', help="使用tracemalloc统计Python内存分配峰值")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="基线文件路径")
+    parser.add_argument('--save-baseline', action='store_true', help="将本次结果写入基线")
+    args = parser.parse_args(argv)
+
+    fleet_config = FleetConfig(replicas=args.replicas, functions=args.functions)
+    for profile in fleet_config.profiles.values():
+        profile.error_rate = args.error_rate
+        if args.slow_rate is not None:
+            profile.slow_rate = args.slow_rate
+
+    summary = asyncio.run(run_benchmark(
+        args.target, args.rate, args.duration, fleet_config, args.trace_memory
+    ))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baselines = json.load(f)
+    key = _scenario_key(summary)
+
+    if args.save_baseline:
+        baselines[key] = {k: v for k, v in summary.items() if k not in ('errors',)}
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baselines, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存: {key}")
+        return 0
+
+    if key not in baselines:
+        print(f"没有场景{key}的基线，跳过回归比较")
+        return 0
+    regressions = compare_to_baseline(summary, baselines[key])
+    for regression in regressions:
+        print(f"性能回归 | {regression}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+import pytest
+from .fleet import FleetConfig, LatencyProfile
+from .loadgen import compare_to_baseline, percentile
+from .run import run_benchmark
+
+@pytest.mark.asyncio
+async def test_benchmark_smoke():
+    """压测工具冒烟测试：小规模集群短时间运行"""
+    config = FleetConfig(replicas=1, functions=2, base_port=9200, profiles={
+        agent_type: LatencyProfile(distribution='fixed', mean=0.005)
+        for agent_type in ('SESSION', 'MISSION', 'FUNCTION', 'CHECKER')
+    })
+    summary = await run_benchmark('service', rate=20, duration=1, fleet_config=config)
+    assert summary['requests'] > 0
+    assert summary['failure_rate'] == 0.0
+    assert summary['p50_ms'] <= summary['p99_ms']
+
+@pytest.mark.asyncio
+async def test_benchmark_error_injection():
+    """注入错误时失败率被正确统计"""
+    profiles = {
+        agent_type: LatencyProfile(distribution='fixed', mean=0.001)
+        for agent_type in ('SESSION', 'MISSION', 'FUNCTION', 'CHECKER')
+    }
+    profiles['MISSION'].error_rate = 1.0
+    config = FleetConfig(replicas=1, functions=1, base_port=9300, profiles=profiles)
+    summary = await run_benchmark('service', rate=10, duration=0.5, fleet_config=config)
+    assert summary['requests'] > 0
+    assert summary['failure_rate'] == 1.0
+
+def test_compare_to_baseline():
+    """回归判定"""
+    baseline = {'throughput_rps': 100, 'p50_ms': 10, 'p95_ms': 20, 'p99_ms': 40, 'failure_rate': 0.0}
+    assert compare_to_baseline(dict(baseline), baseline) == []
+    regressions = compare_to_baseline({**baseline, 'throughput_rps': 80, 'p99_ms': 60}, baseline)
+    assert [r.split(':')[0] for r in regressions] == ['throughput_rps', 'p99_ms']
+    assert percentile([0.3, 0.1, 0.2], 0.5) == 0.2
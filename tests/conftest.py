@@ -1,4 +1,14 @@
+import os
+import shutil
+import tempfile
 import pytest
 
+# 测试日志写入临时目录，避免在仓库的logs/下留下运行日志（须在导入workflow_manager之前设置）
+_log_dir = tempfile.mkdtemp(prefix='workflow-test-logs-')
+os.environ.setdefault('LOG_DIR', _log_dir)
+
 def pytest_configure(config):
-    config.option.asyncio_mode = "auto"
\ No newline at end of file
+    config.option.asyncio_mode = "auto"
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_log_dir, ignore_errors=True)
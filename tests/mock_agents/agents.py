@@ -1,4 +1,5 @@
 from .base import MockAgentBase, MessageRequest
+from fastapi.responses import StreamingResponse
 import uvicorn
 from typing import Dict, Any
 import asyncio
@@ -60,7 +61,8 @@ class MissionAgent(MockAgentBase):
                     "role": "assistant",
                     "content": json.dumps({
                         "target_agents": ["calculator", "translator"],
-                        "priority": ["calculator", "translator"]
+                        "priority": ["calculator", "translator"],
+                        "dependencies": {}
                     })
                 },
                 "finish_reason": "stop"
@@ -96,6 +98,22 @@ class CalculatorAgent(MockAgentBase):
             }
         }
 
+async def local_calculator(data: Dict[str, Any]) -> Dict[str, Any]:
+    """进程内计算器智能体（通过local://tests.mock_agents.agents:local_calculator注册）"""
+    return {
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "choices": [{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": json.dumps({"result": "1 + 1 = 2", "transport": "local"})
+            },
+            "finish_reason": "stop"
+        }],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 20, "total_tokens": 30}
+    }
+
 class TranslatorAgent(MockAgentBase):
     async def process(self, request: MessageRequest):
         """翻译智能体"""
@@ -130,6 +148,13 @@ class CheckerAgent(MockAgentBase):
             f"| 工作流步骤: {request.current_step}"
         )
 
+        content = json.dumps({
+            "quality_score": 0.95,
+            "suggestions": ["翻译结果准确", "响应时间符合要求"]
+        })
+        if request.stream:
+            return StreamingResponse(self._stream(content), media_type="text/event-stream")
+
         # 生成质量评分和建议
         return {
             "object": "chat.completion",
@@ -152,10 +177,35 @@ class CheckerAgent(MockAgentBase):
             }
         }
 
+    async def _stream(self, content: str):
+        """按OpenAI chat.completion.chunk格式分片输出"""
+        created = int(time.time())
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)]
+        for index, piece in enumerate(pieces):
+            delta = {"content": piece}
+            if index == 0:
+                delta["role"] = "assistant"
+            chunk = {
+                "object": "chat.completion.chunk",
+                "created": created,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": None}]
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        final = {
+            "object": "chat.completion.chunk",
+            "created": created,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
 def run_agent(agent: MockAgentBase):
     """运行单个智能体服务"""
     uvicorn.run(agent.app, host="127.0.0.1", port=agent.port)
 
+# 已启动的模拟智能体，按名称索引，供测试检查其收到的请求
+MOCK_AGENTS = {}
+
 async def start_mock_agents():
     """启动所有模拟智能体"""
     agents = [
@@ -165,6 +215,8 @@ async def start_mock_agents():
         TranslatorAgent("translator", 8004),
         CheckerAgent("checker", 8005)
     ]
+    MOCK_AGENTS.clear()
+    MOCK_AGENTS.update((agent.name, agent) for agent in agents)
 
     servers = []
     for agent in agents:
@@ -14,6 +14,7 @@ class MessageRequest(BaseModel):
     # 工作流上下文
     workflow_data: Dict[str, Any] = {}
     current_step: int = 0
+    stream: bool = False
 
 class OpenAIResponse(BaseModel):
     """OpenAI兼容响应格式"""
@@ -33,6 +34,8 @@ class MockAgentBase:
         # 注册路由
         self.app.get("/health")(self.health_check)
         self.app.post("/service")(self.process)
+        self.app.post("/batch")(self.process_batch)
+        self.batch_sizes = []  # 收到的批量请求大小
 
     async def health_check(self):
         """健康检查接口"""
@@ -48,6 +51,12 @@ class MockAgentBase:
         self.logger.debug(f"工作流数据: {request.workflow_data}")
         raise NotImplementedError()
 
+    async def process_batch(self, request: Dict[str, Any]):
+        """批量接口：逐条调用process并按顺序返回"""
+        self.batch_sizes.append(len(request['requests']))
+        responses = [await self.process(MessageRequest(**item)) for item in request['requests']]
+        return {"object": "batch", "responses": responses}
+
     def get_app(self):
         """获取FastAPI应用实例"""
         from fastapi import Request
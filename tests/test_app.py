@@ -0,0 +1,201 @@
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pytest
+import httpx
+import json
+from workflow_manager import app as app_module
+from workflow_manager.models.agent import Agent
+from workflow_manager.config import API_CONFIG
+from .mock_agents.agents import start_mock_agents, stop_mock_agents
+
+AGENTS = [
+    ("session", "SESSION", 8001, {}),
+    ("mission", "MISSION", 8002, {}),
+    ("calculator", "FUNCTION", 8003, {"capability": "math"}),
+    ("translator", "FUNCTION", 8004, {"capability": "translation"}),
+    ("checker", "CHECKER", 8005, {}),
+]
+
+@pytest.fixture
+async def api_client():
+    """启动模拟智能体并在lifespan内创建ASGI测试客户端"""
+    servers = await start_mock_agents()
+    app = app_module.app
+    try:
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                for name, agent_type, port, properties in AGENTS:
+                    response = await client.post("/agent/register", json={
+                        "name": name,
+                        "type": agent_type,
+                        "endpoints": {
+                            "health": f"http://127.0.0.1:{port}/health",
+                            "service": f"http://127.0.0.1:{port}/service"
+                        },
+                        "properties": properties
+                    })
+                    assert response.status_code == 200
+                yield client
+                for name, *_ in AGENTS:
+                    await client.post("/agent/unregister", json={"name": name})
+    finally:
+        await stop_mock_agents(servers)
+
+@pytest.mark.asyncio
+async def test_message_reuses_worker_session(api_client):
+    """测试多次请求复用同一个worker级连接池"""
+    session = app_module.workflow_service.agent_client.session
+    assert session is not None and not session.closed
+
+    for _ in range(2):
+        response = await api_client.post("/message", json={
+            "user_id": "api_user",
+            "content": "请将'你好'翻译成英语",
+            "session_id": None
+        })
+        assert response.status_code == 200
+        body = response.json()
+        assert body["status"] == "success"
+        assert "CHECKER" in body["data"]["system"]
+
+    assert app_module.workflow_service.agent_client.session is session
+    assert not session.closed
+
+@pytest.mark.asyncio
+async def test_register_duplicate_agent(api_client):
+    """测试重复注册返回400"""
+    response = await api_client.post("/agent/register", json={
+        "name": "session",
+        "type": "SESSION",
+        "endpoints": {"health": "http://x/health", "service": "http://x/service"}
+    })
+    assert response.status_code == 400
+    assert response.json()["status"] == "error"
+
+@pytest.mark.asyncio
+async def test_register_local_agent(api_client, monkeypatch):
+    """测试通过导入路径注册进程内智能体，模块不在允许列表中或导入失败返回400"""
+    monkeypatch.setitem(API_CONFIG, 'local_agent_modules', ['tests'])
+    endpoint = "local://tests.mock_agents.agents:local_calculator"
+    response = await api_client.post("/agent/register", json={
+        "name": "local_calculator",
+        "type": "FUNCTION",
+        "endpoints": {"health": endpoint, "service": endpoint}
+    })
+    assert response.status_code == 200
+    assert app_module.agent_registry.get_agent("local_calculator").is_local
+    await api_client.post("/agent/unregister", json={"name": "local_calculator"})
+
+    response = await api_client.post("/agent/register", json={
+        "name": "missing",
+        "type": "FUNCTION",
+        "endpoints": {"health": "local://tests.no_such_module:f", "service": "local://tests.no_such_module:f"}
+    })
+    assert response.status_code == 400
+
+    response = await api_client.post("/agent/register", json={
+        "name": "shell",
+        "type": "FUNCTION",
+        "endpoints": {"health": "local://os:system", "service": "local://os:system"}
+    })
+    assert response.status_code == 400
+    assert "local_agent_modules" in response.json()["message"]
+
+@pytest.mark.asyncio
+async def test_message_stream(api_client):
+    """测试SSE流式返回步骤事件、CHECKER分片与最终结果"""
+    registry = app_module.agent_registry
+    checker = registry.get_agent("checker")
+    await registry.unregister("checker")
+    await registry.register(Agent(
+        name="checker", type="CHECKER", endpoints=checker.endpoints, properties={"stream": True}
+    ))
+
+    events = []
+    async with api_client.stream("POST", "/message/stream", json={
+        "user_id": "api_user",
+        "content": "请将'你好'翻译成英语"
+    }) as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                payload = line[len("data:"):].strip()
+                events.append((event, payload if payload == "[DONE]" else json.loads(payload)))
+                event = None
+
+    steps = [data["step"] for event, data in events if event == "step"]
+    assert steps == ["SESSION", "MISSION", "FUNCTION", "FUNCTION", "CHECKER"]
+    chunks = [data for event, data in events if event == "chunk"]
+    assert chunks and all(chunk["object"] == "chat.completion.chunk" for chunk in chunks)
+    assert events[-2][0] == "completion"
+    assert events[-1] == (None, "[DONE]")
+
+    completion = events[-2][1]
+    checker_content = json.loads(completion["choices"][0]["message"]["content"])
+    assert checker_content["quality_score"] == 0.95
+    assert app_module.admission.inflight == 0
+
+@pytest.mark.asyncio
+async def test_stream_releases_admission_when_send_fails():
+    """测试流式响应未开始发送即失败时仍归还准入名额"""
+    released = []
+
+    async def body():
+        yield b"data: [DONE]\n\n"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise RuntimeError("send failed")
+
+    response = app_module._AdmittedStreamingResponse(body(), lambda: released.append(True))
+    with pytest.raises(RuntimeError):
+        await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+    assert released == [True]
+
+@pytest.mark.asyncio
+async def test_message_overloaded(api_client, monkeypatch):
+    """测试准入队列已满时快速返回503与Retry-After"""
+    admission = app_module.AdmissionController({'initial_limit': 1, 'queue_size': 0, 'adaptive': False})
+    await admission.acquire()
+    monkeypatch.setattr(app_module, "admission", admission)
+
+    response = await api_client.post("/message", json={"user_id": "api_user", "content": "hi", "session_id": None})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    stats = (await api_client.get("/stats/admission")).json()["data"]
+    assert stats["rejected"] == 1
+
+@pytest.mark.asyncio
+async def test_message_unknown_workflow(api_client):
+    """测试请求未定义的命名工作流返回400"""
+    response = await api_client.post("/message", json={
+        "user_id": "api_user", "content": "hi", "session_id": None, "workflow": "missing"
+    })
+    assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_message_tenant_weighting(api_client, monkeypatch):
+    """测试通过请求体tenant字段或X-Tenant请求头指定的租户按配置权重调度"""
+    scheduler = app_module.workflow_service.scheduler
+    monkeypatch.setitem(scheduler.config, "weights", {"vip": 4})
+    dispatched = []
+    acquire = scheduler.acquire
+
+    async def recording_acquire(tenant, timeout=None):
+        await acquire(tenant, timeout)
+        dispatched.append((tenant, scheduler.stats()["tenants"][tenant]["weight"]))
+    monkeypatch.setattr(scheduler, "acquire", recording_acquire)
+
+    message = {"user_id": "api_user", "content": "请计算1+1", "session_id": None}
+    assert (await api_client.post("/message", json={**message, "tenant": "vip"})).status_code == 200
+    assert (await api_client.post("/message", json=message, headers={"X-Tenant": "vip"})).status_code == 200
+    assert (await api_client.post("/message", json=message)).status_code == 200
+    assert dispatched == [("vip", 4), ("vip", 4), ("api_user", 1)]
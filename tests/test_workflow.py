@@ -4,14 +4,35 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 import pytest
 import asyncio
+import logging
+import queue
+import time
+from types import SimpleNamespace
 from workflow_manager.models.message import Message
 from workflow_manager.models.agent import Agent
-from workflow_manager.agent_registry import AgentRegistry
+from workflow_manager.agent_registry import AgentRegistry, SQLiteAgentRegistry, create_agent_registry
 from workflow_manager.services.workflow import WorkflowService
-from .mock_agents.agents import start_mock_agents, stop_mock_agents
+from workflow_manager.services.agent_client import AgentClient
+from workflow_manager.services import health
+from workflow_manager.services.balancer import create_balancer
+from workflow_manager.services.routing_cache import RoutingCache
+from workflow_manager.services.projection import project_payload, resolve_projection
+from workflow_manager.services.session_store import MemorySessionStore, SQLiteSessionStore, create_session_store
+from workflow_manager.services.admission import AdmissionController
+from workflow_manager.services.scheduler import FairScheduler
+from workflow_manager.services.plan import compile_workflow
+from workflow_manager.services.speculation import Speculator
+from workflow_manager.services.deferred_store import create_deferred_store
+from workflow_manager.services.workflow_store import create_workflow_store
+from .mock_agents.agents import MOCK_AGENTS, start_mock_agents, stop_mock_agents
 import pytest_asyncio
-from workflow_manager.utils.exceptions import AgentCallError
-from workflow_manager.utils.logger import logger  # 新增导入
+from workflow_manager.utils.exceptions import AgentAlreadyExistsError, AgentCallError, WorkflowConfigError, DeadlineExceededError, IdempotencyConflictError, OverloadedError
+from workflow_manager.utils.deadline import Deadline
+from workflow_manager.utils.retry import RetryBudget, backoff_delay
+from workflow_manager.utils import codec, tracing
+from workflow_manager.utils import sqlite as sqlite_utils
+from workflow_manager.utils.logger import logger, DeferredQueueHandler  # 新增导入
+from workflow_manager.config import API_CONFIG, ADMISSION_CONFIG, WORKFLOW_CONFIG
 import json
 
 @pytest.fixture
@@ -28,7 +49,7 @@ async def mock_environment():
         registry = AgentRegistry()
 
         # 注册智能体
-        registry.register(Agent(
+        await registry.register(Agent(
             name="session",
             type="SESSION",
             endpoints={
@@ -38,7 +59,7 @@ async def mock_environment():
             properties={}
         ))
 
-        registry.register(Agent(
+        await registry.register(Agent(
             name="mission",
             type="MISSION",
             endpoints={
@@ -48,7 +69,7 @@ async def mock_environment():
             properties={}
         ))
 
-        registry.register(Agent(
+        await registry.register(Agent(
             name="calculator",
             type="FUNCTION",
             endpoints={
@@ -58,7 +79,7 @@ async def mock_environment():
             properties={"capability": "math"}
         ))
 
-        registry.register(Agent(
+        await registry.register(Agent(
             name="translator",
             type="FUNCTION",
             endpoints={
@@ -68,7 +89,7 @@ async def mock_environment():
             properties={"capability": "translation"}
         ))
 
-        registry.register(Agent(
+        await registry.register(Agent(
             name="checker",
             type="CHECKER",
             endpoints={
@@ -128,7 +149,7 @@ async def test_workflow_error_handling(mock_environment):
     workflow = WorkflowService(registry)
     try:
         # 注销一个必需的智能体
-        registry.unregister("session")
+        await registry.unregister("session")
 
         message = Message(
             user_id="test_user",
@@ -171,4 +192,1064 @@ async def test_dynamic_routing(mock_environment):
         assert any("翻译结果准确" in suggestion for suggestion in checker_content.get("suggestions", []))
 
     finally:
-        await workflow.close()
\ No newline at end of file
+        await workflow.close()
+
+def test_plan_function_waves():
+    """测试按依赖关系划分并发批次"""
+    workflow = WorkflowService(AgentRegistry())
+    waves = workflow._plan_function_waves(
+        ["calculator", "translator", "summarizer"],
+        {"summarizer": ["calculator", "translator"], "translator": ["unknown"]}
+    )
+    assert waves == [["calculator", "translator"], ["summarizer"]]
+
+    with pytest.raises(WorkflowConfigError):
+        workflow._plan_function_waves(["a", "b"], {"a": ["b"], "b": ["a"]})
+
+@pytest.mark.asyncio
+async def test_parallel_function_latency():
+    """测试并发执行时FUNCTION步骤耗时约为最慢智能体的耗时，而不是各智能体耗时之和"""
+    def reply(content):
+        return {"object": "chat.completion", "choices": [{"message": {"role": "assistant", "content": content}}]}
+
+    async def mission(payload):
+        return reply(json.dumps({"target_agents": ["slow_a", "slow_b"], "dependencies": {}}))
+
+    def slow(name):
+        async def handler(payload):
+            await asyncio.sleep(0.3)
+            return reply(name)
+        return handler
+
+    registry = AgentRegistry()
+    await registry.register(Agent(name="mission", type="MISSION", endpoints={}, properties={}, handler=mission))
+    for name in ("slow_a", "slow_b"):
+        await registry.register(Agent(name=name, type="FUNCTION", endpoints={}, properties={}, handler=slow(name)))
+    workflow = WorkflowService(registry)
+    await workflow.reload_plans({
+        execution: [{'agent_type': 'MISSION'}, {'agent_type': 'FUNCTION', 'dynamic_routing': True, 'execution': execution}]
+        for execution in ('parallel', 'sequential')
+    })
+    elapsed = {}
+    try:
+        for execution in ('parallel', 'sequential'):
+            started = time.perf_counter()
+            result = await workflow.process_message(
+                Message(user_id="test_user", content="测试消息", session_id=None, metadata={'workflow': execution})
+            )
+            elapsed[execution] = time.perf_counter() - started
+            assert set(result["system"]["FUNCTION"]) == {"slow_a", "slow_b"}
+        assert 0.3 <= elapsed['parallel'] < 0.5
+        assert elapsed['sequential'] >= 0.6
+    finally:
+        await workflow.close()
+
+@pytest.mark.asyncio
+async def test_agent_dedicated_pool(mock_environment):
+    """测试声明pool属性的智能体使用独立连接池"""
+    registry = mock_environment
+    calculator = registry.get_agent("calculator")
+    await registry.unregister("calculator")
+    await registry.register(Agent(
+        name="calculator",
+        type="FUNCTION",
+        endpoints=calculator.endpoints,
+        properties={"capability": "math", "pool": {"limit_per_host": 2, "connect_timeout": 1}}
+    ))
+    workflow = WorkflowService(registry)
+    try:
+        message = Message(user_id="test_user", content="1+1等于几", session_id=None)
+        await workflow.process_message(message)
+
+        stats = workflow.agent_client.get_pool_stats()
+        assert set(stats) == {"default", "calculator"}
+        assert stats["calculator"] == {"in_use": 0, "limit": 100, "limit_per_host": 2}
+        session = workflow.agent_client._agent_sessions["calculator"][1]
+
+        # 重新注册并修改连接池配置后，旧的独立连接池被关闭并替换
+        await registry.unregister("calculator")
+        await registry.register(Agent(
+            name="calculator",
+            type="FUNCTION",
+            endpoints=calculator.endpoints,
+            properties={"capability": "math", "pool": {"limit_per_host": 4}}
+        ))
+        await workflow.process_message(message)
+        await asyncio.sleep(0)
+        assert session.closed
+        assert workflow.agent_client.get_pool_stats()["calculator"]["limit_per_host"] == 4
+
+        # 注销后独立连接池被回收
+        await registry.unregister("calculator")
+        await registry.register(calculator)
+        await workflow.process_message(message)
+        assert set(workflow.agent_client.get_pool_stats()) == {"default"}
+    finally:
+        await workflow.close()
+
+@pytest.mark.asyncio
+async def test_registry_snapshot_isolation():
+    """测试注册表索引与快照隔离"""
+    registry = AgentRegistry()
+    endpoints = {"health": "http://x/health", "service": "http://x/service"}
+    await registry.register(Agent(name="calculator", type="FUNCTION", endpoints=endpoints, properties={"capability": "math"}))
+    snapshot = registry.snapshot()
+
+    await registry.register(Agent(name="translator", type="FUNCTION", endpoints=endpoints, properties={"capability": ["translation", "math"]}))
+    await registry.unregister("calculator")
+
+    assert [a.name for a in snapshot.get_agents_by_type("FUNCTION")] == ["calculator"]
+    assert snapshot.find_agent("calculator", "FUNCTION") is not None
+    assert snapshot.find_agent("calculator", "SESSION") is None
+    assert registry.version == snapshot.version + 2
+    assert [a.name for a in registry.get_agents_by_type("FUNCTION")] == ["translator"]
+    assert [a.name for a in registry.get_agents_by_capability("math")] == ["translator"]
+
+@pytest.mark.asyncio
+async def test_sqlite_registry_shared(tmp_path, monkeypatch):
+    """测试多个worker通过SQLite共享注册表，重启后保留"""
+    path = str(tmp_path / "registry.db")
+    worker1 = SQLiteAgentRegistry(path, check_interval=0)
+    worker2 = SQLiteAgentRegistry(path, check_interval=0)
+    endpoints = {"health": "http://x/health", "service": "http://x/service"}
+    try:
+        await worker1.register(Agent(name="calculator", type="FUNCTION", endpoints=endpoints, properties={"capability": "math"}))
+        # 请求路径上只触发后台检查，不等待数据库读取
+        assert worker2.snapshot().find_agent("calculator") is None
+        await worker2._refresh_task
+        snapshot = worker2.snapshot()
+        assert [a.name for a in snapshot.get_agents_by_capability("math")] == ["calculator"]
+        await worker2.refresh()
+        assert worker2.snapshot() is snapshot  # 版本未变化时不重新加载
+        with pytest.raises(AgentAlreadyExistsError):
+            await worker2.register(Agent(name="calculator", type="FUNCTION", endpoints=endpoints, properties={}))
+
+        async def handler(payload):
+            return {}
+        await worker1.register(Agent(name="inline", type="FUNCTION", endpoints={}, properties={}, handler=handler))
+        assert worker1.snapshot().find_agent("inline") is not None
+        # 直接传入的处理函数只在本worker可用，也不递增共享版本
+        reloads = []
+        monkeypatch.setattr(worker2, "_apply", lambda *args: reloads.append(args))
+        await worker2.refresh()
+        assert reloads == [] and worker2.snapshot().find_agent("inline") is None
+        monkeypatch.undo()
+
+        await worker2.unregister("calculator")
+        await worker1.refresh()
+        assert worker1.snapshot().find_agent("calculator") is None
+        assert worker1.snapshot().find_agent("inline") is not None
+        await worker2.register(Agent(name="translator", type="FUNCTION", endpoints=endpoints, properties={}))
+    finally:
+        await worker1.close()
+        await worker2.close()
+
+    restarted = SQLiteAgentRegistry(path)
+    try:
+        await restarted.refresh()
+        assert [a.name for a in restarted.get_all_agents()] == ["translator"]
+    finally:
+        await restarted.close()
+
+    # 多个worker时默认使用sqlite，拒绝每个worker独立的memory注册表
+    monkeypatch.setattr(sqlite_utils, "WORKERS", 4)
+    with pytest.raises(WorkflowConfigError):
+        create_agent_registry({'backend': 'memory'})
+
+def test_load_balancers():
+    """测试负载均衡策略"""
+    client = AgentClient()
+    endpoints = {"health": "http://x/health", "service": "http://x/service"}
+    agents = [Agent(name=f"checker{i}", type="CHECKER", endpoints=endpoints, properties={}) for i in range(3)]
+
+    round_robin = create_balancer("round_robin")
+    assert [round_robin.choose(agents, client).name for _ in range(4)] == ["checker0", "checker1", "checker2", "checker0"]
+
+    client.get_stats(agents[0]).inflight = 2
+    client.get_stats(agents[1]).inflight = 1
+    client.get_stats(agents[2]).inflight = 3
+    assert create_balancer("least_outstanding").choose(agents, client).name == "checker1"
+
+    client.get_stats(agents[0]).ewma_latency = 0.5
+    client.get_stats(agents[1]).ewma_latency = 5.0
+    client.get_stats(agents[2]).ewma_latency = 5.0
+    p2c = create_balancer("p2c_ewma")
+    assert "checker0" in {p2c.choose(agents, client).name for _ in range(20)}
+    assert p2c.choose(agents[1:], client).name in {"checker1", "checker2"}
+    assert p2c.choose([agents[1], agents[0]], client).name == "checker0"
+
+    with pytest.raises(WorkflowConfigError):
+        create_balancer("unknown")
+
+@pytest.mark.asyncio
+async def test_health_monitor_circuit_breaker(mock_environment, monkeypatch):
+    """测试健康探测熔断不可用智能体并在恢复后重新纳入路由"""
+    registry = mock_environment
+    await registry.register(Agent(
+        name="checker_dead",
+        type="CHECKER",
+        endpoints={
+            "health": "http://127.0.0.1:8099/health",
+            "service": "http://127.0.0.1:8099/service"
+        },
+        properties={}
+    ))
+    workflow = WorkflowService(registry)
+    monitor = workflow.health_monitor
+    monitor.config.update(failure_threshold=1, recovery_timeout=60)
+    try:
+        await monitor.probe_all()
+        states = monitor.get_states()
+        assert states["checker_dead"] == "open"
+        assert states["checker"] == "closed"
+
+        # 熔断期间CHECKER步骤只会路由到健康的副本
+        for _ in range(3):
+            result = await workflow.process_message(
+                Message(user_id="test_user", content="测试消息", session_id=None)
+            )
+            assert "CHECKER" in result["system"]
+
+        # 熔断器时钟前进超过恢复时间，进入半开状态
+        now = time.monotonic()
+        monkeypatch.setattr(health, "time", SimpleNamespace(monotonic=lambda: now + 61))
+        assert monitor.get_states()["checker_dead"] == "half_open"
+        await monitor.probe_all()
+        assert monitor.get_states()["checker_dead"] == "open"
+    finally:
+        await workflow.close()
+
+@pytest.mark.asyncio
+async def test_half_open_allows_single_trial(mock_environment, monkeypatch):
+    """测试半开状态只放行一个试探请求，并发的其他请求在试探结束前被拒绝"""
+    breaker = health.CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half_open" and breaker.acquire()
+    assert not breaker.allow_request() and not breaker.acquire()
+    breaker.release()
+    assert breaker.allow_request()
+
+    registry = mock_environment
+    recovered = asyncio.Event()
+
+    async def recovering(payload):
+        await recovered.wait()
+        return {"object": "chat.completion", "choices": [{"message": {"role": "assistant", "content": "ok"}}]}
+
+    await registry.register(Agent(name="recovering", type="RECOVERING", endpoints={}, properties={}, handler=recovering))
+    workflow = WorkflowService(registry)
+    monitor = workflow.health_monitor
+    monitor.config.update(failure_threshold=1, recovery_timeout=60)
+    await workflow.reload_plans({'recovering': [{'agent_type': 'RECOVERING'}]})
+    monitor.record_failure(registry.get_agent("recovering"))
+    now = time.monotonic()
+    monkeypatch.setattr(health, "time", SimpleNamespace(monotonic=lambda: now + 61))
+    message = lambda user: Message(user_id=user, content="测试消息", session_id=None, metadata={'workflow': 'recovering'})
+    try:
+        trial = asyncio.create_task(workflow.process_message(message("u1")))
+        await asyncio.sleep(0.05)
+        with pytest.raises(Exception, match="No healthy agent"):
+            await workflow.process_message(message("u2"))
+        recovered.set()
+        await trial
+        assert monitor.get_states()["recovering"] == "closed"
+        await workflow.process_message(message("u3"))
+    finally:
+        await workflow.close()
+
+def test_retry_budget_and_deadline():
+    """测试重试预算与截止时间预算"""
+    budget = RetryBudget(ratio=0.1, min_per_second=0)
+    for _ in range(20):
+        budget.record_call()
+    assert budget.try_acquire() and budget.try_acquire()
+    assert not budget.try_acquire()
+    assert budget.rejected == 1
+
+    assert all(0 <= backoff_delay(attempt, 0.1, 1) <= 1 for attempt in range(10))
+
+    deadline = Deadline.after(0.5)
+    assert deadline.budget(10) <= 0.5
+    assert deadline.budget(0.1) <= 0.1
+    with pytest.raises(DeadlineExceededError):
+        Deadline.after(0).budget(5)
+
+@pytest.mark.asyncio
+async def test_workflow_deadline_exceeded(mock_environment):
+    """测试请求截止时间耗尽后不再调用后续步骤"""
+    registry = mock_environment
+    workflow = WorkflowService(registry)
+    try:
+        message = Message(user_id="test_user", content="测试消息", session_id=None)
+        with pytest.raises(DeadlineExceededError):
+            await workflow.process_message(message, deadline=Deadline.after(0))
+    finally:
+        await workflow.close()
+
+@pytest.mark.asyncio
+async def test_deadline_does_not_trip_breaker(mock_environment):
+    """测试调用方截止时间耗尽不计入熔断，智能体自身超时仍计入"""
+    registry = mock_environment
+
+    async def slow(payload):
+        await asyncio.sleep(0.5)
+        return {"object": "chat.completion", "choices": [{"message": {"role": "assistant", "content": "ok"}}]}
+
+    await registry.register(Agent(name="slow", type="SLOW", endpoints={}, properties={}, handler=slow))
+    workflow = WorkflowService(registry)
+    workflow.health_monitor.config.update(failure_threshold=1, recovery_timeout=60)
+    await workflow.reload_plans({'slow': [{'agent_type': 'SLOW', 'timeout': 0.1}]})
+    message = lambda user: Message(user_id=user, content="测试消息", session_id=None, metadata={'workflow': 'slow'})
+    try:
+        for i in range(3):
+            with pytest.raises(DeadlineExceededError):
+                await workflow.process_message(message(f"u{i}"), deadline=Deadline.after(0.02))
+        assert workflow.health_monitor.get_states().get("slow", "closed") == "closed"
+
+        with pytest.raises(Exception) as excinfo:
+            await workflow.process_message(message("u3"))
+        assert not isinstance(excinfo.value, DeadlineExceededError)
+        assert workflow.health_monitor.get_states()["slow"] == "open"
+    finally:
+        await workflow.close()
+
+@pytest.mark.asyncio
+async def test_hedged_request():
+    """测试主请求慢于p95时发送对冲副本并取消落后的请求"""
+    client = AgentClient()
+    client.hedge_config.update(enabled=True, min_samples=1)
+    client.hedge_budget = RetryBudget(ratio=1.0, min_per_second=0)
+    endpoints = {"health": "http://x/health", "service": "http://x/service"}
+    slow = Agent(name="checker_slow", type="CHECKER", endpoints=endpoints, properties={})
+    fast = Agent(name="checker_fast", type="CHECKER", endpoints=endpoints, properties={})
+    client.get_stats(slow).latencies.append(0.05)
+    cancelled = []
+
+    async def fake_call_service(agent, data, timeout=None, deadline=None):
+        try:
+            await asyncio.sleep(1 if agent is slow else 0.01)
+        except asyncio.CancelledError:
+            cancelled.append(agent.name)
+            raise
+        return {"object": "chat.completion", "choices": [], "agent": agent.name}
+
+    client.call_service = fake_call_service
+    winner, result = await client.call_hedged(slow, [fast], {}, timeout=5)
+    assert winner is fast
+    assert result["agent"] == "checker_fast"
+    await asyncio.sleep(0)
+    assert cancelled == ["checker_slow"]
+    assert client.get_stats(fast).hedges == 1
+
+    # 对冲预算耗尽时只等待主请求
+    client.hedge_budget = RetryBudget(ratio=0, min_per_second=0)
+    client.get_stats(slow).latencies.append(0.001)
+    winner, _ = await client.call_hedged(slow, [fast], {}, timeout=5)
+    assert winner is slow
+
+@pytest.mark.asyncio
+async def test_routing_cache(mock_environment):
+    """测试MISSION路由缓存命中及FUNCTION智能体变化后自动失效"""
+    registry = mock_environment
+    workflow = WorkflowService(registry)
+    workflow.routing_cache = RoutingCache(max_size=16, ttl=60)
+    mission = registry.get_agent("mission")
+    try:
+        await workflow.process_message(Message(user_id="u1", content="请将'你好'翻译成英语", session_id=None))
+        await workflow.process_message(Message(user_id="u2", content="  请将'你好'翻译成英语 ", session_id=None))
+        assert workflow.routing_cache.stats()["hits"] == 1
+        assert workflow.agent_client.get_stats(mission).calls == 1
+
+        await registry.register(Agent(
+            name="summarizer",
+            type="FUNCTION",
+            endpoints={"health": "http://x/health", "service": "http://x/service"},
+            properties={"capability": "summary"}
+        ))
+        await workflow.process_message(Message(user_id="u1", content="请将'你好'翻译成英语", session_id=None))
+        assert workflow.routing_cache.stats()["hits"] == 1
+        assert workflow.agent_client.get_stats(mission).calls == 2
+    finally:
+        await workflow.close()
+
+def test_project_payload():
+    """测试按规则裁剪智能体上下文"""
+    endpoints = {"health": "http://x/health", "service": "http://x/service"}
+    checker = Agent(name="checker", type="CHECKER", endpoints=endpoints, properties={"projection": {"max_messages": 2}})
+    projection = resolve_projection(checker, {"CHECKER": {"workflow_data": ["FUNCTION"], "max_messages": 5}})
+    assert projection == {"workflow_data": ["FUNCTION"], "max_messages": 2}
+
+    payload = {
+        "messages": [{"role": "user", "content": str(i) * 100} for i in range(5)],
+        "workflow_data": {"SESSION": {"x": "s" * 500}, "MISSION": {}, "FUNCTION": {"calculator": {}}}
+    }
+    projected = project_payload(payload, projection)
+    assert list(projected["workflow_data"]) == ["FUNCTION"]
+    assert [m["content"][0] for m in projected["messages"]] == ["3", "4"]
+    assert len(payload["messages"]) == 5 and "SESSION" in payload["workflow_data"]
+
+    limited = project_payload(payload, {"max_bytes": 300})
+    assert [m["content"][0] for m in limited["messages"]] == ["4"]
+    assert list(limited["workflow_data"]) == ["MISSION", "FUNCTION"]
+    assert len(codec.dumps(limited)) <= 300
+
+    # 逐项扣减的长度与重新编码一致：上限恰好等于丢弃一条消息后的大小时只丢弃一条
+    exact = len(codec.dumps({**payload, "messages": payload["messages"][1:]}))
+    assert len(project_payload(payload, {"max_bytes": exact})["messages"]) == 4
+    exact = len(codec.dumps({"messages": payload["messages"][-1:], "workflow_data": {"FUNCTION": {"calculator": {}}}}))
+    trimmed = project_payload(payload, {"max_bytes": exact})
+    assert len(trimmed["messages"]) == 1 and list(trimmed["workflow_data"]) == ["FUNCTION"]
+
+def test_codec_raw_passthrough():
+    """测试智能体原始响应字节直接拼接进最终输出"""
+    raw = b'{"object":"chat.completion","choices":[{"index":0}]}'
+    response = codec.loads_raw(raw)
+    assert isinstance(response, codec.RawJSON) and response.raw == raw
+
+    encoded = codec.encode({"id": "chatcmpl-1", "system": {"CHECKER": response, "FUNCTION": {"calculator": response}}})
+    assert raw in encoded
+    assert json.loads(encoded)["system"]["FUNCTION"]["calculator"] == json.loads(raw)
+
+    response["object"] = "changed"
+    assert response.raw is None
+    assert json.loads(codec.encode({"CHECKER": response}))["CHECKER"]["object"] == "changed"
+
+    # 取出嵌套容器后原地修改，raw同样失效
+    nested = codec.loads_raw(raw)
+    assert nested["object"] == "chat.completion" and nested.raw == raw
+    nested["choices"][0]["index"] = 1
+    assert nested.raw is None
+    assert json.loads(codec.encode(nested))["choices"][0]["index"] == 1
+
+    for mutate in (lambda r: r.__ior__({"x": 1}), lambda r: r.pop("object"), lambda r: r.popitem(),
+                   lambda r: r.setdefault("x", 1), lambda r: r.get("choices").append({})):
+        response = codec.loads_raw(raw)
+        mutate(response)
+        assert response.raw is None
+        assert json.loads(codec.encode(response)) == dict(response)
+
+@pytest.mark.asyncio
+async def test_request_timings(mock_environment):
+    """测试请求时间线记录与最慢请求查询"""
+    registry = mock_environment
+    workflow = WorkflowService(registry)
+    try:
+        message = Message(user_id="test_user", content="测试消息", session_id=None, metadata={"timings": True})
+        result = await workflow.process_message(message)
+
+        timings = result["system"]["timings"]
+        names = [span["name"] for span in timings["spans"]]
+        assert names[:2] == ["scheduler.wait", "registry.snapshot"]
+        for step in ("step.SESSION", "step.MISSION", "step.FUNCTION", "step.CHECKER", "agent.attempt", "agent.parse"):
+            assert step in names
+        assert timings["duration_ms"] >= max(span["duration_ms"] for span in timings["spans"])
+
+        await workflow.process_message(Message(user_id="test_user", content="测试消息", session_id=None))
+        slowest = workflow.trace_buffer.slowest(1)
+        assert len(slowest) == 1 and len(workflow.trace_buffer) == 2
+    finally:
+        await workflow.close()
+
+def test_traceparent_header():
+    """测试W3C traceparent请求头格式"""
+    client = AgentClient()
+    assert "traceparent" not in client._headers(Deadline.after(1))
+    with tracing.start_trace() as trace:
+        with tracing.span("agent.attempt") as span:
+            header = client._headers(Deadline.after(1), span.span_id)["traceparent"]
+    version, trace_id, span_id, flags = header.split("-")
+    assert (version, trace_id, span_id, flags) == ("00", trace.trace_id, span.span_id, "01")
+    assert len(trace_id) == 32 and len(span_id) == 16
+
+@pytest.mark.asyncio
+async def test_local_agent_transport(mock_environment, monkeypatch):
+    """测试进程内智能体与远程智能体混合的工作流"""
+    monkeypatch.setitem(API_CONFIG, 'local_agent_modules', ['tests.mock_agents', 'json'])
+    registry = mock_environment
+    await registry.unregister("calculator")
+    await registry.register(Agent(
+        name="calculator",
+        type="FUNCTION",
+        endpoints={
+            "health": "local://tests.mock_agents.agents:local_calculator",
+            "service": "local://tests.mock_agents.agents:local_calculator"
+        },
+        properties={"capability": "math"}
+    ))
+    workflow = WorkflowService(registry)
+    try:
+        result = await workflow.process_message(Message(user_id="test_user", content="1+1等于几", session_id=None))
+        calculator = result["system"]["FUNCTION"]["calculator"]
+        assert json.loads(calculator["choices"][0]["message"]["content"])["transport"] == "local"
+        assert "translator" in result["system"]["FUNCTION"]
+        assert workflow.agent_client.get_stats(registry.get_agent("calculator")).calls == 1
+        assert "calculator" not in workflow.agent_client.get_pool_stats()
+
+        # 健康探测不会重置调用失败打开的进程内智能体熔断器
+        monitor = workflow.health_monitor
+        calculator_agent = registry.get_agent("calculator")
+        for _ in range(monitor.breaker(calculator_agent).failure_threshold):
+            monitor.record_failure(calculator_agent)
+        await monitor.probe_all()
+        assert monitor.get_states()["calculator"] == "open"
+    finally:
+        await workflow.close()
+
+    with pytest.raises(ValueError):
+        Agent(name="bad", type="FUNCTION", properties={},
+              endpoints={"health": "local://json:dumps", "service": "local://json:dumps"})
+    # 不在允许列表中的模块不会被导入
+    for module in ("os", "tests.mock_agents_extra", "tests"):
+        with pytest.raises(ValueError, match="local_agent_modules"):
+            Agent(name="bad", type="FUNCTION", properties={},
+                  endpoints={"health": f"local://{module}:f", "service": f"local://{module}:f"})
+
+@pytest.mark.asyncio
+async def test_local_agent_timeout_and_validation():
+    """测试进程内智能体沿用超时、重试与响应校验"""
+    calls = 0
+
+    async def flaky(data):
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("boom")
+        return {"object": "chat.completion", "choices": [], "echo": data}
+
+    async def slow(data):
+        await asyncio.sleep(1)
+
+    async def invalid(data):
+        return {"choices": []}
+
+    client = AgentClient()
+    client.config.update(max_retries=2, retry_base_delay=0.01)
+    try:
+        result = await client.call_service(Agent("flaky", "FUNCTION", {}, {}, handler=flaky), {"n": 1}, timeout=1)
+        assert calls == 2 and result["echo"] == {"n": 1}
+        with pytest.raises(asyncio.TimeoutError):
+            await client.call_service(Agent("slow", "FUNCTION", {}, {}, handler=slow), {}, timeout=0.2)
+        with pytest.raises(ValueError):
+            await client.call_service(Agent("invalid", "FUNCTION", {}, {}, handler=invalid), {}, timeout=1)
+    finally:
+        await client.close()
+
+@pytest.mark.asyncio
+async def test_micro_batching(mock_environment):
+    """测试并发调用合并为批量请求并按顺序分发响应"""
+    client = AgentClient()
+    agent = Agent(
+        name="calculator_batch",
+        type="FUNCTION",
+        endpoints={
+            "health": "http://127.0.0.1:8003/health",
+            "service": "http://127.0.0.1:8003/service",
+            "batch": "http://127.0.0.1:8003/batch"
+        },
+        properties={"batch": {"max_size": 4, "window_ms": 50}}
+    )
+    payload = {"messages": [{"role": "user", "content": "1+1"}]}
+    calculator = MOCK_AGENTS["calculator"]
+    calculator.batch_sizes.clear()
+    try:
+        results = await asyncio.gather(*[client.call_service(agent, payload, timeout=5) for _ in range(6)])
+        assert all(result["object"] == "chat.completion" for result in results)
+        # 6次调用只向智能体发送了2个批量请求
+        assert calculator.batch_sizes == [4, 2]
+        assert client.get_batch_stats()["calculator_batch"]["batches"] == 2
+        assert client.get_stats(agent).calls == 2
+    finally:
+        await client.close()
+
+    sizes = []
+
+    async def handler(batch):
+        sizes.append(len(batch["requests"]))
+        return {"object": "batch", "responses": [
+            {"object": "chat.completion", "choices": [], "n": item["n"]} if item["n"] else {"bad": True}
+            for item in batch["requests"]
+        ]}
+
+    client = AgentClient()
+    agent = Agent("local_batch", "FUNCTION", {}, {"batch": True}, handler=handler)
+    try:
+        results = await asyncio.gather(
+            *[client.call_service(agent, {"n": n}, timeout=1) for n in range(3)],
+            return_exceptions=True
+        )
+        assert sizes == [3]
+        assert isinstance(results[0], ValueError)
+        assert [r["n"] for r in results[1:]] == [1, 2]
+    finally:
+        await client.close()
+
+@pytest.mark.asyncio
+async def test_batcher_rebuilt_on_reregistration():
+    """测试智能体重新注册后批量请求发往新的处理函数，注销后合并器被移除"""
+    calls = []
+
+    def make_handler(tag):
+        async def handler(batch):
+            calls.append(tag)
+            return {"object": "batch", "responses": [
+                {"object": "chat.completion", "choices": [], "tag": tag} for _ in batch["requests"]
+            ]}
+        return handler
+
+    client = AgentClient()
+    old = Agent("rebatch", "FUNCTION", {}, {"batch": True}, handler=make_handler("old"))
+    new = Agent("rebatch", "FUNCTION", {}, {"batch": True}, handler=make_handler("new"))
+    try:
+        assert (await client.call_service(old, {}, timeout=1))["tag"] == "old"
+        client.sync_agents({"rebatch": new})
+        assert "rebatch" not in client.get_batch_stats()
+        assert (await client.call_service(new, {}, timeout=1))["tag"] == "new"
+        assert calls == ["old", "new"]
+        client.sync_agents({})
+        assert client.get_batch_stats() == {}
+    finally:
+        await client.close()
+
+@pytest.mark.asyncio
+async def test_session_store_history(mock_environment):
+    """测试会话历史本地保存，SESSION只接收新一轮消息"""
+    registry = mock_environment
+    workflow = WorkflowService(registry, session_store=MemorySessionStore(100, 60, 10))
+    payloads = []
+    call_hedged = workflow.agent_client.call_hedged
+
+    async def spy(agent, backups, data, **kwargs):
+        payloads.append((agent.type, data))
+        return await call_hedged(agent, backups, data, **kwargs)
+
+    workflow.agent_client.call_hedged = spy
+    try:
+        for content in ("第一轮", "第二轮"):
+            await workflow.process_message(Message(user_id="test_user", content=content, session_id="s1"))
+
+        history = await workflow.session_store.get("s1")
+        assert [m["content"] for m in history if m["role"] == "user"] == ["第一轮", "第二轮"]
+        assert len(history) == 4
+
+        session_payload = [data for agent_type, data in payloads if agent_type == "SESSION"][-1]
+        assert session_payload["messages"] == [{"role": "user", "content": "第二轮"}]
+        assert session_payload["session_history"] == "local"
+        checker_payload = [data for agent_type, data in payloads if agent_type == "CHECKER"][-1]
+        assert any(m.get("content") == "第一轮" for m in checker_payload["messages"])
+
+        # 不含SESSION步骤的工作流同样带上已读取的会话历史
+        await workflow.reload_plans({'no_session': [{'agent_type': 'CHECKER'}]})
+        await workflow.process_message(
+            Message(user_id="test_user", content="第三轮", session_id="s1", metadata={'workflow': 'no_session'})
+        )
+        checker_payload = [data for agent_type, data in payloads if agent_type == "CHECKER"][-1]
+        assert [m["content"] for m in checker_payload["messages"] if m["role"] == "user"] == ["第一轮", "第二轮", "第三轮"]
+    finally:
+        await workflow.close()
+
+@pytest.mark.asyncio
+async def test_sqlite_session_store(tmp_path, monkeypatch):
+    """测试SQLite会话存储的追加、截断、过期与删除"""
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl=60, max_messages=3)
+    try:
+        await store.append("s1", [{"role": "user", "content": str(i)} for i in range(2)])
+        await store.append("s1", [{"role": "user", "content": str(i)} for i in range(2, 4)])
+        assert [m["content"] for m in await store.get("s1")] == ["1", "2", "3"]
+        await store.clear("s1")
+        assert await store.get("s1") == []
+
+        store.ttl = 0.05
+        await store.append("s2", [{"role": "user", "content": "x"}])
+        await asyncio.sleep(0.1)
+        assert await store.get("s2") == []
+    finally:
+        await store.close()
+
+    # 两个worker并发追加同一会话不会丢失更新
+    workers = [SQLiteSessionStore(str(tmp_path / "shared.db"), ttl=60, max_messages=0) for _ in range(2)]
+    try:
+        await asyncio.gather(*[
+            worker.append("s3", [{"role": "user", "content": f"{n}-{i}"}])
+            for i in range(20) for n, worker in enumerate(workers)
+        ])
+        assert len(await workers[0].get("s3")) == 40
+    finally:
+        for worker in workers:
+            await worker.close()
+
+    # 多个worker时拒绝进程内存储
+    monkeypatch.setattr(sqlite_utils, "WORKERS", 4)
+    with pytest.raises(WorkflowConfigError):
+        create_session_store({'enabled': True, 'backend': 'memory', 'max_sessions': 10, 'ttl': 60, 'max_messages': 10})
+
+@pytest.mark.asyncio
+async def test_single_flight_and_idempotency(mock_environment):
+    """测试相同请求并发共享执行，幂等键重试返回缓存结果"""
+    registry = mock_environment
+    workflow = WorkflowService(registry)
+    executions = 0
+    execute = workflow._execute_workflow
+
+    async def counting(*args, **kwargs):
+        nonlocal executions
+        executions += 1
+        return await execute(*args, **kwargs)
+
+    workflow._execute_workflow = counting
+    try:
+        message = lambda content="1+1等于几": Message(user_id="test_user", content=content, session_id="s1")
+        results = await asyncio.gather(*[workflow.submit_message(message()) for _ in range(3)])
+        assert executions == 1
+        assert results[0] is results[1] is results[2]
+        assert workflow.get_dedup_stats()["single_flight"]["shared"] == 2
+
+        first = await workflow.submit_message(message(), idempotency_key="k1")
+        retried = await workflow.submit_message(message(), idempotency_key="k1")
+        assert executions == 2
+        assert retried["id"] == first["id"]
+        with pytest.raises(IdempotencyConflictError):
+            await workflow.submit_message(message("其他内容"), idempotency_key="k1")
+
+        # 幂等键对应的请求仍在执行时，内容不同的并发请求同样返回冲突
+        pending = asyncio.create_task(workflow.submit_message(message(), idempotency_key="k2"))
+        await asyncio.sleep(0)
+        with pytest.raises(IdempotencyConflictError):
+            await workflow.submit_message(message("其他内容"), idempotency_key="k2")
+        assert (await pending)["id"] == (await workflow.submit_message(message(), idempotency_key="k2"))["id"]
+    finally:
+        await workflow.close()
+
+@pytest.mark.asyncio
+async def test_admission_control():
+    """测试并发上限、有界排队、快速拒绝与AIMD调整"""
+    admission = AdmissionController({
+        'initial_limit': 2, 'queue_size': 1, 'queue_timeout': 0.1, 'adaptive': False
+    })
+    await admission.acquire()
+    await admission.acquire()
+
+    waiter = asyncio.create_task(admission.acquire())
+    await asyncio.sleep(0)
+    with pytest.raises(OverloadedError):
+        await admission.acquire()  # 队列已满，立即拒绝
+    admission.release(0.01)
+    await waiter  # 释放的名额交给排队的请求
+    assert admission.stats()['inflight'] == 2
+
+    with pytest.raises(OverloadedError) as excinfo:
+        await admission.acquire()  # 排队超时
+    assert excinfo.value.retry_after >= 1
+    stats = admission.stats()
+    assert (stats['rejected'], stats['timed_out'], stats['queue_depth']) == (1, 1, 0)
+
+    aimd = AdmissionController({'initial_limit': 10, 'min_limit': 2, 'target_latency': 0.5})
+    await aimd.acquire()
+    aimd.release(1.0)
+    assert aimd.current_limit == 9
+    for _ in range(20):
+        await aimd.acquire()
+        aimd.release(0.01)
+    assert aimd.current_limit == 11
+
+@pytest.mark.asyncio
+async def test_fair_scheduler():
+    """测试按租户加权公平派发"""
+    scheduler = FairScheduler({'max_concurrency': 1, 'weights': {'vip': 3}, 'default_cost': 1.0})
+    assert scheduler.tenant_of(Message(user_id="u1", content="", session_id=None, metadata={"tenant": "vip"})) == "vip"
+    assert scheduler.tenant_of(Message(user_id="u1", content="", session_id=None)) == "u1"
+
+    await scheduler.acquire("noisy")
+    order = []
+
+    async def job(tenant):
+        await scheduler.acquire(tenant)
+        order.append(tenant)
+
+    tasks = [asyncio.create_task(job("noisy")) for _ in range(6)]
+    tasks += [asyncio.create_task(job("vip")) for _ in range(4)]
+    await asyncio.sleep(0)
+    assert scheduler.stats()["queue_depth"] == 10
+
+    current = "noisy"
+    for _ in range(10):
+        scheduler.release(current, 1.0)
+        await asyncio.sleep(0)
+        current = order[-1]
+    await asyncio.gather(*tasks)
+
+    # 后到的vip插队到积压的noisy之前，并按权重获得约3倍的派发机会
+    assert order[:5] == ["vip", "vip", "vip", "noisy", "vip"]
+    assert scheduler.stats()["running"] == 1
+
+@pytest.mark.asyncio
+async def test_fair_scheduler_releases_idle_tenants():
+    """测试空闲租户状态立即释放，派发后取消不计入耗时EWMA"""
+    assert FairScheduler().max_concurrency == ADMISSION_CONFIG['initial_limit']
+
+    scheduler = FairScheduler({'max_concurrency': 2, 'default_cost': 1.0})
+    for i in range(1000):
+        await scheduler.acquire(f"user{i}")
+        scheduler.release(f"user{i}", 1.5)  # 耗时超过预扣值，虚拟时间超过时钟
+    assert scheduler.stats()["tenants"] == {}
+
+    await scheduler.acquire("a")
+    await scheduler.acquire("a")
+    scheduler.release("a", 2.0)
+    await scheduler.acquire("b")
+    vtime = scheduler.stats()["tenants"]["a"]["vtime"]
+    waiter = asyncio.create_task(scheduler.acquire("a"))
+    await asyncio.sleep(0)
+    scheduler.release("b", 1.0)     # 派发给排队的a，随后a的调用方在恢复执行前被取消
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert scheduler._tenants["a"].cost_ewma == 2.0
+    assert scheduler.stats()["tenants"]["a"]["vtime"] == vtime
+    assert scheduler.stats()["running"] == 1
+    scheduler.release("a", 2.0)
+    assert scheduler.stats() == {'max_concurrency': 2, 'running': 0, 'queue_depth': 0, 'tenants': {}}
+
+def test_compile_workflow():
+    """测试工作流编译与配置校验"""
+    plan = compile_workflow("demo", [
+        {'agent_type': 'SESSION', 'timeout': 2},
+        {'agent_type': 'MISSION'},
+        {'agent_type': 'FUNCTION', 'dynamic_routing': True, 'execution': 'parallel'},
+        {'parallel': [{'agent_type': 'CHECKER', 'is_final': True, 'policy': 'inline'}, {'agent_type': 'AUDIT', 'required': False}]}
+    ], default_timeout=5)
+    assert [len(stage) for stage in plan.stages] == [1, 1, 1, 2]
+    assert [step.kind for step in plan.steps] == ['session', 'mission', 'function', 'agent', 'agent']
+    assert plan.step('MISSION').timeout == 5
+    assert plan.final_step.agent_type == 'CHECKER' and plan.final_step.options['policy'] == 'inline'
+    with pytest.raises(TypeError):
+        plan.final_step.options['policy'] = 'async'
+
+    invalid = [
+        [],
+        [{'agent_type': 'FUNCTION', 'dynamic_routing': True}],
+        [{'parallel': [{'agent_type': 'SESSION'}, {'agent_type': 'CHECKER'}]}],
+        [{'agent_type': 'CHECKER'}, {'agent_type': 'CHECKER'}],
+        [{'agent_type': 'CHECKER', 'timeout': 0}],
+        [{'agent_type': 'MISSION', 'policy': 'async'}],
+        [{'agent_type': 'CHECKER', 'policy': 'sampled', 'sample_rate': 2}],
+    ]
+    for steps in invalid:
+        with pytest.raises(WorkflowConfigError):
+            compile_workflow("bad", steps, default_timeout=5)
+
+@pytest.mark.asyncio
+async def test_named_workflows_and_optional_steps(mock_environment):
+    """测试按请求选择命名工作流、跳过可选步骤与并发阶段"""
+    registry = mock_environment
+    await registry.register(Agent(
+        name="auditor",
+        type="AUDIT",
+        endpoints={"health": "http://127.0.0.1:8005/health", "service": "http://127.0.0.1:8005/service"},
+        properties={}
+    ))
+    workflow = WorkflowService(registry)
+    await workflow.reload_plans({
+        'fast': [
+            {'agent_type': 'SESSION', 'timeout': 2},
+            {'agent_type': 'MISSION', 'timeout': 5},
+            {'agent_type': 'FUNCTION', 'timeout': 5, 'dynamic_routing': True, 'execution': 'parallel'}
+        ],
+        'audited': [
+            {'agent_type': 'SESSION'},
+            {'parallel': [{'agent_type': 'CHECKER', 'is_final': True}, {'agent_type': 'AUDIT'}]}
+        ]
+    })
+    message = lambda **metadata: Message(user_id="test_user", content="1+1等于几", session_id=None, metadata=metadata)
+    try:
+        result = await workflow.process_message(message(workflow='fast'))
+        assert set(result["system"]) == {"SESSION", "MISSION", "FUNCTION"}
+        # 没有最终步骤时取最后完成的FUNCTION响应
+        assert result["choices"] == result["system"]["FUNCTION"]["translator"]["choices"]
+
+        # 选择不同工作流的并发请求不会被合并为同一次执行
+        default, fast = await asyncio.gather(
+            workflow.submit_message(message()), workflow.submit_message(message(workflow='fast'))
+        )
+        assert "CHECKER" in default["system"] and "CHECKER" not in fast["system"]
+
+        result = await workflow.process_message(message(workflow='audited'))
+        assert {"CHECKER", "AUDIT"} <= set(result["system"])
+
+        result = await workflow.process_message(message(skip_steps=['CHECKER', 'SESSION']))
+        assert "CHECKER" not in result["system"] and "SESSION" in result["system"]
+
+        await registry.unregister("checker")
+        result = await workflow.process_message(message())
+        assert "CHECKER" not in result["system"]
+
+        with pytest.raises(WorkflowConfigError):
+            await workflow.process_message(message(workflow='missing'))
+        with pytest.raises(WorkflowConfigError):
+            await workflow.reload_plans({'bad': []})
+        assert 'fast' in workflow.plans
+    finally:
+        await workflow.close()
+
+@pytest.mark.asyncio
+async def test_shared_workflow_store(tmp_path, monkeypatch):
+    """测试/workflow/reload保存的工作流通过共享存储同步到其他worker并在重启后保留"""
+    path = str(tmp_path / "workflows.db")
+    monkeypatch.setitem(WORKFLOW_CONFIG, 'workflow_store', {'backend': 'sqlite', 'path': path, 'check_interval': 0})
+    registry = AgentRegistry()
+    worker1, worker2 = WorkflowService(registry), WorkflowService(registry)
+    try:
+        await worker1.reload_plans({'fast': [{'agent_type': 'MISSION'}]})
+        # 请求路径上只触发后台检查，不等待数据库读取
+        assert 'fast' not in worker2.get_plans()
+        await worker2._plans_refresh
+        assert 'fast' in worker2.get_plans()
+        await worker2.reload_plans({})
+        await worker1.refresh_plans()
+        assert 'fast' not in worker1.get_plans()
+        await worker2.reload_plans({'slow': [{'agent_type': 'CHECKER'}]})
+    finally:
+        for worker in (worker1, worker2):
+            await worker.workflow_store.close()
+
+    restarted = WorkflowService(registry)
+    try:
+        await restarted.refresh_plans()
+        assert 'slow' in restarted.get_plans()
+    finally:
+        await restarted.workflow_store.close()
+
+    monkeypatch.setattr(sqlite_utils, "WORKERS", 4)
+    with pytest.raises(WorkflowConfigError):
+        create_workflow_store({'backend': 'memory'})
+
+@pytest.mark.asyncio
+async def test_speculative_function_calls(mock_environment):
+    """测试MISSION执行期间推测调用FUNCTION智能体，确认后采用结果"""
+    registry = mock_environment
+    workflow = WorkflowService(registry)
+    workflow.speculator = Speculator({'budget_ratio': 2, 'max_agents': 3})
+    await workflow.reload_plans({
+        'fast': [{'agent_type': 'MISSION'}, {'agent_type': 'FUNCTION', 'dynamic_routing': True, 'execution': 'parallel'}],
+        'ordered': [{'agent_type': 'MISSION'}, {'agent_type': 'FUNCTION', 'dynamic_routing': True, 'execution': 'sequential'}]
+    })
+    message = lambda **metadata: Message(user_id="test_user", content="1+1等于几", session_id=None, metadata=metadata)
+    try:
+        result = await workflow.process_message(message(workflow='fast', predicted_agents=['calculator', 'missing']))
+        assert set(result["system"]["FUNCTION"]) == {"calculator", "translator"}
+        assert (workflow.speculator.launched, workflow.speculator.confirmed) == (1, 1)
+
+        # 相同内容按上次MISSION的路由结果预测
+        result = await workflow.process_message(message(workflow='fast'))
+        assert set(result["system"]["FUNCTION"]) == {"calculator", "translator"}
+        assert (workflow.speculator.launched, workflow.speculator.confirmed) == (3, 3)
+
+        # 顺序执行时只有第一个智能体可以采用推测结果
+        await workflow.process_message(message(workflow='ordered'))
+        stats = workflow.speculator.stats()
+        assert (stats['launched'], stats['confirmed'], stats['wasted']) == (5, 4, 1)
+    finally:
+        await workflow.close()
+
+@pytest.mark.asyncio
+async def test_speculation_skipped_on_routing_cache_hit(mock_environment):
+    """测试命中路由缓存时不发起推测调用"""
+    registry = mock_environment
+    workflow = WorkflowService(registry)
+    workflow.routing_cache = RoutingCache(max_size=16, ttl=60)
+    workflow.speculator = Speculator({'budget_ratio': 2, 'max_agents': 3})
+    await workflow.reload_plans({
+        'fast': [{'agent_type': 'MISSION'}, {'agent_type': 'FUNCTION', 'dynamic_routing': True, 'execution': 'parallel'}]
+    })
+    message = Message(user_id="test_user", content="1+1等于几", session_id=None,
+                      metadata={'workflow': 'fast', 'predicted_agents': ['calculator']})
+    try:
+        await workflow.process_message(message)
+        assert workflow.speculator.launched == 1
+        result = await workflow.process_message(message)
+        assert set(result["system"]["FUNCTION"]) == {"calculator", "translator"}
+        assert workflow.routing_cache.stats()["hits"] == 1
+        assert workflow.speculator.launched == 1
+    finally:
+        await workflow.close()
+
+@pytest.mark.asyncio
+async def test_deferred_and_sampled_checker(mock_environment):
+    """测试CHECKER的async与sampled策略"""
+    registry = mock_environment
+    workflow = WorkflowService(registry)
+    routed = [{'agent_type': 'MISSION'}, {'agent_type': 'FUNCTION', 'dynamic_routing': True, 'execution': 'parallel'}]
+    await workflow.reload_plans({
+        'async': routed + [{'agent_type': 'CHECKER', 'is_final': True, 'policy': 'async'}],
+        'by_route': routed + [{'agent_type': 'CHECKER', 'is_final': True, 'policy': 'sampled',
+                               'sample_routes': ['translator'], 'sample_policy': 'inline'}],
+        'never': routed + [{'agent_type': 'CHECKER', 'is_final': True, 'policy': 'sampled', 'sample_rate': 0}]
+    })
+    message = lambda name: Message(user_id="test_user", content="1+1等于几", session_id=None, metadata={'workflow': name})
+    try:
+        result = await workflow.process_message(message('async'))
+        # 不等待CHECKER，直接返回FUNCTION结果
+        assert result["deferred"] == ["CHECKER"] and "CHECKER" not in result["system"]
+        assert result["choices"] == result["system"]["FUNCTION"]["translator"]["choices"]
+        for _ in range(50):
+            deferred = await workflow.get_deferred_results(result["id"])
+            if deferred["CHECKER"]["status"] != "pending":
+                break
+            await asyncio.sleep(0.05)
+        assert deferred["CHECKER"]["status"] == "completed"
+        assert "choices" in deferred["CHECKER"]["result"]
+
+        result = await workflow.process_message(message('by_route'))
+        assert "CHECKER" in result["system"] and "deferred" not in result
+
+        result = await workflow.process_message(message('never'))
+        assert "CHECKER" not in result["system"] and "deferred" not in result
+        stats = await workflow.get_deferred_stats()
+        assert (stats['worker']['completed'], stats['worker']['sampled_out'], stats['worker']['pending']) == (1, 1, 0)
+        assert stats['store']['completed'] == 1
+        assert await workflow.get_deferred_results("unknown") is None
+    finally:
+        await workflow.close()
+
+@pytest.mark.asyncio
+async def test_sqlite_deferred_store_shared(tmp_path, monkeypatch):
+    """测试后台步骤结果通过SQLite在worker间共享，多个worker时拒绝进程内存储"""
+    path = str(tmp_path / "deferred.db")
+    config = {'backend': 'sqlite', 'path': path, 'max_results': 100, 'result_ttl': 60}
+    worker1, worker2 = create_deferred_store(config), create_deferred_store(config)
+    try:
+        await worker1.put("req-1", "CHECKER", {'status': 'pending'})
+        assert await worker2.get("req-1") == {"CHECKER": {'status': 'pending'}}
+        await worker2.put("req-1", "CHECKER", {'status': 'completed', 'result': {'ok': True}})
+        assert (await worker1.get("req-1"))["CHECKER"]["result"] == {'ok': True}
+        assert (await worker1.stats())['completed'] == 1
+        assert await worker1.get("req-2") is None
+    finally:
+        await worker1.close()
+        await worker2.close()
+
+    # 与进程内存储一样最多保留max_results个请求的结果
+    capped = create_deferred_store({**config, 'path': str(tmp_path / "capped.db"), 'max_results': 2})
+    try:
+        for request_id in ("req-1", "req-2", "req-3"):
+            await capped.put(request_id, "CHECKER", {'status': 'completed', 'result': {}})
+        assert await capped.get("req-1") is None
+        assert await capped.get("req-2") is not None and await capped.get("req-3") is not None
+    finally:
+        await capped.close()
+
+    monkeypatch.setattr(sqlite_utils, "WORKERS", 4)
+    with pytest.raises(WorkflowConfigError):
+        create_deferred_store({**config, 'backend': 'memory'})
+
+def test_queue_handler_snapshots_arguments():
+    """日志参数在调用线程中取值，之后修改参数对象不影响已入队的消息"""
+    log_queue = queue.Queue()
+    handler = DeferredQueueHandler(log_queue)
+    payload = {'step': 'SEARCH'}
+    record = logging.LogRecord("test", logging.DEBUG, __file__, 1, "元数据: %s", (payload,), None)
+    handler.emit(record)
+    payload['step'] = 'CHECKER'
+
+    queued = log_queue.get_nowait()
+    assert queued.getMessage() == "元数据: {'step': 'SEARCH'}"
+    assert queued.args is None
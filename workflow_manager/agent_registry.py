@@ -1,33 +1,297 @@
-from typing import Dict, List
-from .models.agent import Agent
-from .utils.exceptions import AgentNotFoundError, AgentAlreadyExistsError
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from .config import REGISTRY_CONFIG
+from .models.agent import Agent, LOCAL_SCHEME
+from .utils.exceptions import AgentNotFoundError, AgentAlreadyExistsError, WorkflowConfigError
+from .utils.logger import logger
+from .utils.sqlite import SQLiteExecutor, prepare_path, require_shared_backend
+from .utils import codec
+
+def _agent_capabilities(agent: Agent) -> Tuple[str, ...]:
+    """解析智能体声明的能力，capability属性支持字符串或列表"""
+    capability = agent.properties.get('capability')
+    if not capability:
+        return ()
+    if isinstance(capability, str):
+        return (capability,)
+    return tuple(capability)
+
+@dataclass(frozen=True)
+class RegistrySnapshot:
+    """注册表的不可变快照，请求开始时读取一次，后续注册/注销不会影响已获取的快照"""
+    version: int
+    agents: Mapping[str, Agent]
+    by_type: Mapping[str, Tuple[Agent, ...]]
+    by_capability: Mapping[str, Tuple[Agent, ...]]
+    _memo: Dict[str, str] = field(default_factory=dict, compare=False, repr=False)
+
+    @classmethod
+    def empty(cls) -> 'RegistrySnapshot':
+        """创建空快照"""
+        return cls(0, MappingProxyType({}), MappingProxyType({}), MappingProxyType({}))
+
+    def get_agent(self, agent_name: str) -> Agent:
+        """获取指定智能体"""
+        agent = self.agents.get(agent_name)
+        if agent is None:
+            raise AgentNotFoundError(f"Agent {agent_name} not found")
+        return agent
+
+    def find_agent(self, agent_name: str, agent_type: Optional[str] = None) -> Optional[Agent]:
+        """按名称（及可选类型）查找智能体，不存在时返回None"""
+        agent = self.agents.get(agent_name)
+        if agent is None or (agent_type is not None and agent.type != agent_type):
+            return None
+        return agent
+
+    def get_agents_by_type(self, agent_type: str) -> Tuple[Agent, ...]:
+        """获取指定类型的所有智能体"""
+        return self.by_type.get(agent_type, ())
+
+    def get_agents_by_capability(self, capability: str) -> Tuple[Agent, ...]:
+        """获取具备指定能力的所有智能体"""
+        return self.by_capability.get(capability, ())
+
+    def fingerprint(self, agent_type: str) -> str:
+        """指定类型智能体集合（名称与能力）的指纹，同一快照内只计算一次"""
+        fingerprint = self._memo.get(agent_type)
+        if fingerprint is None:
+            members = sorted(
+                f"{agent.name}:{','.join(_agent_capabilities(agent))}"
+                for agent in self.get_agents_by_type(agent_type)
+            )
+            fingerprint = hashlib.sha1("\n".join(members).encode('utf-8')).hexdigest()
+            self._memo[agent_type] = fingerprint
+        return fingerprint
 
 class AgentRegistry:
     def __init__(self):
-        self._agents: Dict[str, Agent] = {}
+        # 写操作串行化并整体替换快照（copy-on-write），读操作无锁
+        self._lock = threading.Lock()
+        self._snapshot = RegistrySnapshot.empty()
+
+    def _publish(self, agents: Dict[str, Agent]) -> None:
+        """基于新的智能体集合重建索引并发布新版本快照"""
+        by_type: Dict[str, List[Agent]] = {}
+        by_capability: Dict[str, List[Agent]] = {}
+        for agent in agents.values():
+            by_type.setdefault(agent.type, []).append(agent)
+            for capability in _agent_capabilities(agent):
+                by_capability.setdefault(capability, []).append(agent)
+
+        self._snapshot = RegistrySnapshot(
+            version=self._snapshot.version + 1,
+            agents=MappingProxyType(agents),
+            by_type=MappingProxyType({k: tuple(v) for k, v in by_type.items()}),
+            by_capability=MappingProxyType({k: tuple(v) for k, v in by_capability.items()})
+        )
+
+    def snapshot(self) -> RegistrySnapshot:
+        """获取当前注册表快照"""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        """当前注册表版本号，每次注册/注销递增"""
+        return self._snapshot.version
 
-    def register(self, agent: Agent) -> None:
+    async def refresh(self) -> None:
+        """与共享存储同步，worker内注册表无需同步"""
+
+    async def register(self, agent: Agent) -> None:
         """注册新的智能体"""
-        if agent.name in self._agents:
-            raise AgentAlreadyExistsError(f"Agent {agent.name} already exists")
-        self._agents[agent.name] = agent
+        with self._lock:
+            if agent.name in self._snapshot.agents:
+                raise AgentAlreadyExistsError(f"Agent {agent.name} already exists")
+            agents = dict(self._snapshot.agents)
+            agents[agent.name] = agent
+            self._publish(agents)
 
-    def unregister(self, agent_name: str) -> None:
+    async def unregister(self, agent_name: str) -> None:
         """注销智能体"""
-        if agent_name not in self._agents:
-            raise AgentNotFoundError(f"Agent {agent_name} not found")
-        del self._agents[agent_name]
+        with self._lock:
+            if agent_name not in self._snapshot.agents:
+                raise AgentNotFoundError(f"Agent {agent_name} not found")
+            agents = dict(self._snapshot.agents)
+            del agents[agent_name]
+            self._publish(agents)
 
     def get_agent(self, agent_name: str) -> Agent:
         """获取指定智能体"""
-        if agent_name not in self._agents:
-            raise AgentNotFoundError(f"Agent {agent_name} not found")
-        return self._agents[agent_name]
+        return self.snapshot().get_agent(agent_name)
 
     def get_agents_by_type(self, agent_type: str) -> List[Agent]:
         """获取指定类型的所有智能体"""
-        return [agent for agent in self._agents.values() if agent.type == agent_type]
+        return list(self.snapshot().get_agents_by_type(agent_type))
+
+    def get_agents_by_capability(self, capability: str) -> List[Agent]:
+        """获取具备指定能力的所有智能体"""
+        return list(self.snapshot().get_agents_by_capability(capability))
 
     def get_all_agents(self) -> List[Agent]:
         """获取所有注册的智能体"""
-        return list(self._agents.values())
\ No newline at end of file
+        return list(self.snapshot().agents.values())
+
+    async def close(self) -> None:
+        """释放注册表资源"""
+
+class SQLiteAgentRegistry(AgentRegistry):
+    """
+    同一主机上多个worker共享的注册表，保存在SQLite（WAL模式）中，重启后仍然可用。
+
+    注册/注销在写事务中修改智能体表并递增版本计数器。读取快照时最多每check_interval秒
+    在后台检查一次版本计数器，只有版本变化时才从数据库重建内存快照，请求路径上只有
+    内存读取；所有数据库操作在SQLiteExecutor的后台线程中执行，不阻塞事件循环。
+    直接传入处理函数的进程内智能体无法跨进程共享，只保存在注册它的worker内，注册/注销时
+    不递增共享版本；local://模块路径形式的进程内智能体在各worker内分别导入。
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        super().__init__()
+        self.path = path
+        self.check_interval = check_interval
+        self.logger = logger.getChild('AgentRegistry')
+        self._lock = asyncio.Lock()
+        self._shared_agents: Dict[str, Agent] = {}  # 从数据库加载的智能体
+        self._local_agents: Dict[str, Agent] = {}   # 只在本worker内可用的智能体
+        self._shared_version = -1                   # 已应用的共享版本计数器，-1表示尚未加载
+        self._checked_at = float('-inf')
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._db = SQLiteExecutor(path, (
+            "CREATE TABLE IF NOT EXISTS agents ("
+            "name TEXT PRIMARY KEY, type TEXT NOT NULL, endpoints BLOB NOT NULL, properties BLOB NOT NULL)",
+            "CREATE TABLE IF NOT EXISTS registry_meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+            "INSERT OR IGNORE INTO registry_meta (key, value) VALUES ('version', 0)",
+        ), thread_name_prefix='agent-registry')
+
+    @staticmethod
+    def _read_version(conn: sqlite3.Connection) -> int:
+        return conn.execute("SELECT value FROM registry_meta WHERE key = 'version'").fetchone()[0]
+
+    @staticmethod
+    def _read_agents(conn: sqlite3.Connection) -> List[Tuple[str, str, bytes, bytes]]:
+        return conn.execute("SELECT name, type, endpoints, properties FROM agents ORDER BY rowid").fetchall()
+
+    def _apply(self, version: int, rows: List[Tuple[str, str, bytes, bytes]]) -> None:
+        """按数据库内容重建快照；本worker无法加载的智能体（如导入失败）记录日志后跳过"""
+        if version < self._shared_version:
+            return  # 已应用更新的版本
+        agents = {}
+        for name, agent_type, endpoints, properties in rows:
+            try:
+                agents[name] = Agent(
+                    name=name, type=agent_type, endpoints=codec.loads(endpoints), properties=codec.loads(properties)
+                )
+            except ValueError as e:
+                self.logger.error("加载智能体失败 | 名称: %s | 错误: %s", name, e)
+        self._shared_agents = agents
+        self._shared_version = version
+        self._publish({**agents, **self._local_agents})
+        self.logger.debug("注册表已重新加载 | 版本: %s | 智能体数: %d", version, len(self._snapshot.agents))
+
+    async def refresh(self) -> None:
+        """检查共享版本计数器，其他worker修改了注册表时从数据库重建快照"""
+        try:
+            def read(conn: sqlite3.Connection) -> Tuple[int, Optional[List[Tuple[str, str, bytes, bytes]]]]:
+                version = self._read_version(conn)
+                return version, self._read_agents(conn) if version != self._shared_version else None
+            version, rows = await self._db.run(read)
+            if rows is not None:
+                self._apply(version, rows)
+        finally:
+            if self._refresh_task is asyncio.current_task():
+                self._refresh_task = None
+
+    async def _refresh_in_background(self) -> None:
+        try:
+            await self.refresh()
+        except Exception as e:
+            self.logger.error("检查注册表版本失败 | 错误: %s", e)
+
+    def snapshot(self) -> RegistrySnapshot:
+        """获取当前注册表快照，其他worker修改注册表后约check_interval秒内可见"""
+        now = time.monotonic()
+        if self._refresh_task is None and now - self._checked_at >= self.check_interval:
+            try:
+                self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_in_background())
+                self._checked_at = now
+            except RuntimeError:
+                pass    # 不在事件循环内，下次在事件循环内读取快照时再检查
+        return self._snapshot
+
+    @staticmethod
+    def _is_shareable(agent: Agent) -> bool:
+        """智能体能否由其他worker从数据库重建：HTTP智能体或local://模块路径形式的进程内智能体"""
+        return not agent.is_local or ':' in agent.service_endpoint[len(LOCAL_SCHEME):]
+
+    async def register(self, agent: Agent) -> None:
+        """注册新的智能体"""
+        def exists(conn: sqlite3.Connection) -> bool:
+            return conn.execute("SELECT 1 FROM agents WHERE name = ?", (agent.name,)).fetchone() is not None
+
+        def write(conn: sqlite3.Connection) -> Tuple[int, List[Tuple[str, str, bytes, bytes]]]:
+            with SQLiteExecutor.transaction(conn):
+                if exists(conn):
+                    raise AgentAlreadyExistsError(f"Agent {agent.name} already exists")
+                conn.execute(
+                    "INSERT INTO agents (name, type, endpoints, properties) VALUES (?, ?, ?, ?)",
+                    (agent.name, agent.type, codec.dumps(agent.endpoints), codec.dumps(agent.properties))
+                )
+                conn.execute("UPDATE registry_meta SET value = value + 1 WHERE key = 'version'")
+                return self._read_version(conn), self._read_agents(conn)
+
+        async with self._lock:
+            if agent.name in self._local_agents:
+                raise AgentAlreadyExistsError(f"Agent {agent.name} already exists")
+            if self._is_shareable(agent):
+                self._apply(*await self._db.run(write))
+                return
+            if await self._db.run(exists):
+                raise AgentAlreadyExistsError(f"Agent {agent.name} already exists")
+            # 只在本worker内可用，不递增共享版本，其他worker无需重新加载
+            self._local_agents[agent.name] = agent
+            self._publish({**self._shared_agents, **self._local_agents})
+
+    async def unregister(self, agent_name: str) -> None:
+        """注销智能体"""
+        async with self._lock:
+            if self._local_agents.pop(agent_name, None) is not None:
+                self._publish({**self._shared_agents, **self._local_agents})
+                return
+
+            def write(conn: sqlite3.Connection) -> Tuple[int, List[Tuple[str, str, bytes, bytes]]]:
+                with SQLiteExecutor.transaction(conn):
+                    if not conn.execute("DELETE FROM agents WHERE name = ?", (agent_name,)).rowcount:
+                        raise AgentNotFoundError(f"Agent {agent_name} not found")
+                    conn.execute("UPDATE registry_meta SET value = value + 1 WHERE key = 'version'")
+                    return self._read_version(conn), self._read_agents(conn)
+            self._apply(*await self._db.run(write))
+
+    async def close(self) -> None:
+        task = self._refresh_task
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await self._db.close()
+
+def create_agent_registry(config: Optional[Dict[str, Any]] = None) -> AgentRegistry:
+    """
+    按配置创建注册表：memory为worker内注册表，sqlite为同一主机上各worker共享的持久化注册表。
+
+    Raises:
+        WorkflowConfigError: 未知后端，或多个worker时使用memory后端
+    """
+    config = {**REGISTRY_CONFIG, **(config or {})}
+    backend = config['backend']
+    require_shared_backend('Registry', backend)
+    if backend == 'memory':
+        return AgentRegistry()
+    if backend == 'sqlite':
+        return SQLiteAgentRegistry(prepare_path(config['path']), config['check_interval'])
+    raise WorkflowConfigError(f"Unknown registry backend: {backend}")
@@ -1,66 +1,297 @@
-from flask import Flask, request, jsonify
-from .agent_registry import AgentRegistry
+import time
+from contextlib import asynccontextmanager, nullcontext
+from typing import Any, Callable, Dict
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from .agent_registry import create_agent_registry
 from .services.workflow import WorkflowService
+from .services.admission import AdmissionController
 from .models.message import Message
 from .models.agent import Agent
-from contextlib import asynccontextmanager
-import asyncio
+from .config import WORKFLOW_CONFIG, ADMISSION_CONFIG
+from .utils.deadline import Deadline
+from .utils.exceptions import DeadlineExceededError, IdempotencyConflictError, OverloadedError
+from .utils.logger import logger
+from .utils import codec
 
-app = Flask(__name__)
-agent_registry = AgentRegistry()
+# 每个worker进程持有一个注册表与一个工作流服务（含AgentClient连接池）；
+# 注册表为sqlite后端时各worker共享同一份注册数据
+agent_registry = create_agent_registry()
 workflow_service = WorkflowService(agent_registry)
+admission = AdmissionController() if ADMISSION_CONFIG['enabled'] else None
 
-@app.route('/message', methods=['POST'])
-def handle_message():
-    """处理用户消息"""
-    data = request.json
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """worker生命周期：启动时加载注册表并建立连接池，退出时统一关闭"""
+    await agent_registry.refresh()
+    await workflow_service.start()
+    logger.info("工作流服务已启动")
+    try:
+        yield
+    finally:
+        await workflow_service.close()
+        await agent_registry.close()
+        logger.info("工作流服务已关闭")
+
+app = FastAPI(lifespan=lifespan)
+
+def _parse_message(data: Dict[str, Any], request: Request) -> Message:
+    """
+    解析消息请求体，?timings=true时在响应中附带耗时时间线。
+
+    workflow（请求体字段或查询参数）选择命名工作流，skip_steps列出本次跳过的可选步骤。
+    tenant（请求体字段或X-Tenant请求头）指定公平调度的租户，未指定时按user_id调度。
+    """
     message = Message(
         user_id=data['user_id'],
         content=data['content'],
         session_id=data.get('session_id')
     )
+    if request.query_params.get('timings', '').lower() in ('1', 'true'):
+        message.metadata['timings'] = True
+    workflow = data.get('workflow') or request.query_params.get('workflow')
+    if workflow:
+        if workflow not in workflow_service.get_plans():
+            raise ValueError(f"Unknown workflow: {workflow}")
+        message.metadata['workflow'] = workflow
+    if data.get('skip_steps'):
+        message.metadata['skip_steps'] = list(data['skip_steps'])
+    scheduler_config = WORKFLOW_CONFIG['scheduler']
+    tenant = data.get('tenant') or request.headers.get(scheduler_config['tenant_header'])
+    if tenant:
+        message.metadata[scheduler_config['tenant_key']] = str(tenant)
+    return message
+
+def _request_deadline(request: Request) -> Deadline:
+    """在API入口确定请求截止时间，客户端可通过X-Request-Timeout(秒)进一步缩短"""
+    timeout = WORKFLOW_CONFIG['request_timeout']
+    try:
+        timeout = min(timeout, float(request.headers.get('X-Request-Timeout', timeout)))
+    except ValueError:
+        pass
+    return Deadline.after(timeout)
+
+def _overloaded_response(e: OverloadedError) -> JSONResponse:
+    """过载拒绝响应，Retry-After告知客户端重试等待时间"""
+    return JSONResponse(
+        {"status": "error", "message": str(e)},
+        status_code=ADMISSION_CONFIG['reject_status'],
+        headers={'Retry-After': str(e.retry_after)}
+    )
+
+@app.post('/message')
+async def handle_message(request: Request):
+    """处理用户消息"""
+    data = await request.json()
+    try:
+        message = _parse_message(data, request)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    deadline = _request_deadline(request)
 
     try:
-        result = workflow_service.process_message(message)
-        return jsonify({"status": "success", "data": result})
+        async with admission.admit() if admission is not None else nullcontext():
+            result = await workflow_service.submit_message(
+                message,
+                deadline=deadline,
+                idempotency_key=request.headers.get('Idempotency-Key')
+            )
+        # 智能体原始响应字节直接拼接进最终输出，不再重复编码
+        return Response(codec.encode({"status": "success", "data": result}), media_type='application/json')
+    except OverloadedError as e:
+        return _overloaded_response(e)
+    except IdempotencyConflictError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=422)
+    except DeadlineExceededError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=504)
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=500)
 
-@app.route('/agent/register', methods=['POST'])
-def register_agent():
-    """注册智能体"""
-    data = request.json
-    agent = Agent(
-        name=data['name'],
-        type=data['type'],
-        endpoints=data['endpoints'],
-        properties=data.get('properties', {})
+class _AdmittedStreamingResponse(StreamingResponse):
+    """
+    在响应生命周期结束时归还准入名额的流式响应。
+
+    名额在响应发送结束后归还，包括客户端断开、发送失败或流尚未开始即中止的情况；
+    只在生成器的finally中归还时，生成器未被启动会导致名额永久泄漏。
+    """
+
+    def __init__(self, content: Any, release: Callable[[], None], **kwargs: Any):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+@app.post('/message/stream')
+async def handle_message_stream(request: Request):
+    """以Server-Sent Events流式返回工作流进度与最终结果"""
+    data = await request.json()
+    try:
+        message = _parse_message(data, request)
+    except ValueError as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+    deadline = _request_deadline(request)
+
+    # 在开始推流前完成准入，被拒绝时仍可返回普通的错误响应
+    if admission is not None:
+        try:
+            await admission.acquire()
+        except OverloadedError as e:
+            return _overloaded_response(e)
+    started = time.monotonic()
+
+    async def event_stream():
+        async for event, payload in workflow_service.stream_message(message, deadline=deadline):
+            yield b"event: " + event.encode() + b"\ndata: " + codec.encode(payload) + b"\n\n"
+        yield b"data: [DONE]\n\n"
+
+    def release() -> None:
+        if admission is not None:
+            admission.release(time.monotonic() - started)
+
+    return _AdmittedStreamingResponse(
+        event_stream(),
+        release,
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
     )
 
+@app.get('/message/{request_id}/deferred')
+async def get_deferred_results(request_id: str):
+    """查询请求中后台执行步骤（如async/sampled策略的CHECKER）的状态与结果"""
+    results = await workflow_service.get_deferred_results(request_id)
+    if results is None:
+        return JSONResponse({"status": "error", "message": f"No deferred results for {request_id}"}, status_code=404)
+    return JSONResponse({"status": "success", "data": results})
+
+@app.post('/agent/register')
+async def register_agent(request: Request):
+    """注册智能体"""
+    data = await request.json()
+    try:
+        agent = Agent(
+            name=data['name'],
+            type=data['type'],
+            endpoints=data['endpoints'],
+            properties=data.get('properties', {})
+        )
+        await agent_registry.register(agent)
+        return JSONResponse({"status": "success", "message": "Agent registered successfully"})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+@app.post('/workflow/reload')
+async def reload_workflows(request: Request):
+    """重新编译工作流，请求体为命名工作流配置（为空时按当前配置重新编译）"""
+    body = await request.body()
     try:
-        agent_registry.register(agent)
-        return jsonify({"status": "success", "message": "Agent registered successfully"})
+        await workflow_service.reload_plans(codec.loads(body)['workflows'] if body else None)
+        return JSONResponse({"status": "success", "data": list(workflow_service.get_plans())})
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 400
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
 
-@app.route('/agent/unregister', methods=['POST'])
-def unregister_agent():
+@app.post('/agent/unregister')
+async def unregister_agent(request: Request):
     """注销智能体"""
-    data = request.json
+    data = await request.json()
     agent_name = data['name']
 
     try:
-        agent_registry.unregister(agent_name)
-        return jsonify({"status": "success", "message": "Agent unregistered successfully"})
+        await agent_registry.unregister(agent_name)
+        return JSONResponse({"status": "success", "message": "Agent unregistered successfully"})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+def _session_store():
+    store = workflow_service.session_store
+    if store is None:
+        raise ValueError("Session store is not enabled")
+    return store
+
+@app.get('/session/{session_id}')
+async def get_session_history(session_id: str):
+    """查询会话历史"""
+    try:
+        history = await _session_store().get(session_id)
+        return JSONResponse({"status": "success", "data": history})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+@app.post('/session/{session_id}/messages')
+async def append_session_history(session_id: str, request: Request):
+    """向会话历史追加消息（如从外部系统导入已有对话）"""
+    data = await request.json()
+    try:
+        await _session_store().append(session_id, data['messages'])
+        return JSONResponse({"status": "success", "message": "Session history appended"})
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 400
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+@app.delete('/session/{session_id}')
+async def clear_session_history(session_id: str):
+    """清空会话历史"""
+    try:
+        await _session_store().clear(session_id)
+        return JSONResponse({"status": "success", "message": "Session history cleared"})
+    except Exception as e:
+        return JSONResponse({"status": "error", "message": str(e)}, status_code=400)
+
+@app.get('/stats/pools')
+async def pool_stats():
+    """查询智能体连接池统计"""
+    return JSONResponse({"status": "success", "data": workflow_service.agent_client.get_pool_stats()})
+
+@app.get('/stats/batching')
+async def batching_stats():
+    """查询智能体微批合并统计"""
+    return JSONResponse({"status": "success", "data": workflow_service.agent_client.get_batch_stats()})
+
+@app.get('/stats/dedup')
+async def dedup_stats():
+    """查询请求去重（single-flight与幂等缓存）统计"""
+    return JSONResponse({"status": "success", "data": workflow_service.get_dedup_stats()})
+
+@app.get('/stats/admission')
+async def admission_stats():
+    """查询准入控制的并发上限、队列深度与拒绝统计"""
+    return JSONResponse({"status": "success", "data": admission.stats() if admission is not None else None})
+
+@app.get('/stats/scheduler')
+async def scheduler_stats():
+    """查询租户公平调度的并发与各租户排队统计"""
+    scheduler = workflow_service.scheduler
+    return JSONResponse({"status": "success", "data": scheduler.stats() if scheduler is not None else None})
+
+@app.get('/stats/speculation')
+async def speculation_stats():
+    """查询FUNCTION推测执行的发起、采用与浪费统计"""
+    speculator = workflow_service.speculator
+    return JSONResponse({"status": "success", "data": speculator.stats() if speculator is not None else None})
+
+@app.get('/stats/deferred')
+async def deferred_stats():
+    """查询后台执行步骤的进行中、完成、失败与跳过统计"""
+    return JSONResponse({"status": "success", "data": await workflow_service.get_deferred_stats()})
+
+@app.get('/stats/health')
+async def health_stats():
+    """查询智能体熔断器状态"""
+    return JSONResponse({"status": "success", "data": workflow_service.health_monitor.get_states()})
+
+@app.get('/stats/routing_cache')
+async def routing_cache_stats():
+    """查询MISSION路由缓存命中统计"""
+    cache = workflow_service.routing_cache
+    return JSONResponse({"status": "success", "data": cache.stats() if cache else None})
 
-@app.teardown_appcontext
-def shutdown_session(exception=None):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_until_complete(workflow_service.close())
-    loop.close()
+@app.get('/debug/traces')
+async def slowest_traces(limit: int = 10):
+    """查询最近请求中耗时最长的limit个时间线"""
+    return JSONResponse({"status": "success", "data": workflow_service.trace_buffer.slowest(limit)})
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=5000)
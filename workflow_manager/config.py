@@ -1,3 +1,11 @@
+import os
+
+# gunicorn worker数量（WEB_CONCURRENCY）。多个worker时，需要跨worker一致的状态不能只保存在进程内存中
+WORKERS = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+# 本地数据目录，存放各SQLite数据库文件
+DATA_DIR = os.getenv('DATA_DIR', '.')
+
 # 智能体类型定义
 AGENT_TYPES = {
     'FUNCTION': 'function',    # 功能智能体
@@ -8,6 +16,91 @@ AGENT_TYPES = {
 
 # 工作流配置
 WORKFLOW_CONFIG = {
+    # 单个请求的端到端时间预算(秒)，可通过X-Request-Timeout请求头缩短
+    'request_timeout': 30,
+    # 同类型多个智能体之间的负载均衡策略: round_robin / least_outstanding / p2c_ewma
+    'load_balancer': 'round_robin',
+    # MISSION路由决策缓存，键为规范化的用户输入与FUNCTION智能体集合指纹
+    'routing_cache': {
+        'enabled': False,
+        'max_size': 1024,   # 最大缓存条目数
+        'ttl': 300          # 条目过期时间(秒)
+    },
+    # 请求耗时时间线：include_timings为True时所有响应附带system.timings，
+    # 否则仅在Message.metadata['timings']为True时附带
+    'tracing': {
+        'include_timings': False,
+        'buffer_size': 256      # 保留最近完成请求时间线的数量，用于查询最慢请求
+    },
+    # 会话历史存储：开启后按session_id在本地保留最近的对话，SESSION智能体只接收新一轮消息
+    # （请求体附带session_history='local'），历史消息由工作流拼接进后续步骤的上下文
+    # memory后端只在单个worker内有效，多个worker时必须使用sqlite（各worker共享同一数据库文件）
+    'session_store': {
+        'enabled': False,
+        'backend': 'sqlite' if WORKERS > 1 else 'memory',  # memory: 进程内LRU；sqlite: 本地SQLite文件
+        'max_sessions': 10000,      # memory后端最多保留的会话数
+        'ttl': 3600,                # 会话超过该时间(秒)未更新即过期
+        'max_messages': 50,         # 每个会话保留的最近消息数
+        'path': os.path.join(DATA_DIR, 'sessions.db')  # sqlite后端的数据库文件
+    },
+    # /message请求去重：single_flight为True时，相同用户、会话与内容的并发请求共享同一次执行；
+    # 带Idempotency-Key请求头的请求成功后结果缓存ttl秒，重试直接返回缓存结果
+    'dedup': {
+        'single_flight': True,
+        'idempotency_max_size': 10000,
+        'idempotency_ttl': 600
+    },
+    # FUNCTION推测执行：MISSION执行期间按预测提前调用FUNCTION智能体，MISSION确认且无前置依赖的
+    # 结果直接采用，其余取消或丢弃。推测调用基于MISSION之前的上下文（不含MISSION结果）
+    'speculation': {
+        'enabled': False,
+        'max_agents': 2,            # 每个请求最多推测调用的智能体数
+        'budget_ratio': 0.2,        # 被浪费的推测调用数不超过请求数的该比例
+        'max_burst': 10,            # 推测额度的最大积累量
+        'history_size': 4096,       # 按内容记录的最近路由结果数量
+        'history_ttl': 600,         # 路由历史过期时间(秒)
+        'hints': {}                 # 按命名工作流的静态预测，例: {'math': ['calculator']}
+    },
+    # policy为async/sampled的步骤在后台执行，结果按请求ID保存。memory后端只在处理该请求的worker内可见，
+    # 多个worker时必须使用sqlite后端，各worker通过同一数据库文件共享结果
+    'deferred': {
+        'backend': 'sqlite' if WORKERS > 1 else 'memory',
+        'path': os.path.join(DATA_DIR, 'deferred.db'),
+        'max_pending': 256,         # 后台执行中的步骤上限，超出时跳过该步骤
+        'max_results': 10000,       # 保存的请求结果数量上限
+        'result_ttl': 3600          # 结果保存时间(秒)
+    },
+    # 按租户加权公平调度：全局最多max_concurrency个工作流同时执行（None表示取ADMISSION_CONFIG['initial_limit']，
+    # 准入上限自适应增长超过该值时才在调度器中排队，排队时间受请求截止时间限制），
+    # 租户为Message.metadata[tenant_key]，未指定时为user_id；weights按租户配置权重
+    # API入口从请求体的tenant字段或tenant_header请求头（通常由网关设置）读取租户
+    'scheduler': {
+        'enabled': True,
+        'max_concurrency': None,
+        'tenant_key': 'tenant',
+        'tenant_header': 'X-Tenant',
+        'weights': {},              # 例: {'interactive': 4, 'batch_jobs': 1}
+        'default_weight': 1,
+        'default_cost': 1.0,        # 租户尚无耗时样本时预扣的服务量(秒)
+        'cost_ewma_alpha': 0.2
+    },
+    # 按智能体类型裁剪发送给智能体的上下文，可通过Agent.properties['projection']按智能体覆盖
+    # 例: 'CHECKER': {'workflow_data': ['FUNCTION'], 'max_messages': 4, 'max_bytes': 65536}
+    'projections': {},
+    # 工作流步骤在启动时编译为不可变执行计划（services/plan.py）。required为False的步骤在没有
+    # 可用智能体或调用失败时跳过，也可通过Message.metadata['skip_steps']按请求跳过；
+    # {'parallel': [步骤, ...]}声明并发执行的阶段
+    # 命名工作流，请求通过Message.metadata['workflow']（/message请求体的workflow字段）选择，
+    # 例: 'fast': [{'agent_type': 'SESSION', 'timeout': 2}, {'agent_type': 'MISSION', 'timeout': 5},
+    #              {'agent_type': 'FUNCTION', 'timeout': 10, 'dynamic_routing': True, 'execution': 'parallel'}]
+    'workflows': {},
+    # /workflow/reload保存的命名工作流配置。memory: 只在处理请求的worker内生效；sqlite: 各worker共享，
+    # 最多check_interval秒内同步到所有worker，且重启后保留。多个worker时必须使用sqlite
+    'workflow_store': {
+        'backend': 'sqlite' if WORKERS > 1 else 'memory',
+        'path': os.path.join(DATA_DIR, 'workflows.db'),
+        'check_interval': 1.0
+    },
     'default_workflow': [
         {
             'agent_type': 'SESSION',
@@ -23,20 +116,87 @@ WORKFLOW_CONFIG = {
             'agent_type': 'FUNCTION',  # 动态路由的实际执行步骤
             'required': True,
             'timeout': 15,
-            'dynamic_routing': True
+            'dynamic_routing': True,
+            'execution': 'parallel'  # parallel: 按MISSION声明的依赖分批并发执行；sequential: 逐个执行
         },
         {
             'agent_type': 'CHECKER',
             'required': False,
             'timeout': 5,
-            'is_final': True  # 新增标记表示最终输出
+            'is_final': True,  # 新增标记表示最终输出
+            # inline: 响应前检查；async: 先返回FUNCTION结果，后台检查，结果通过GET /message/{id}/deferred查询；
+            # sampled: 只检查sample_rate比例的请求，或目标FUNCTION智能体在sample_routes中的请求
+            'policy': 'inline'
         }
     ]
 }
 
+# 智能体注册表配置。memory: 每个worker独立的内存注册表；sqlite: 同一主机上各worker共享的
+# 持久化注册表（WAL模式），注册/注销对所有worker可见且重启后保留。多个worker时默认且必须使用sqlite
+REGISTRY_CONFIG = {
+    'backend': os.getenv('REGISTRY_BACKEND', 'sqlite' if WORKERS > 1 else 'memory'),
+    'path': os.getenv('REGISTRY_PATH', os.path.join(DATA_DIR, 'registry.db')),
+    'check_interval': 1.0       # 检查其他worker修改（版本计数器）的最短间隔(秒)
+}
+
+# 健康探测与熔断配置
+HEALTH_CONFIG = {
+    'enabled': True,            # 是否在worker启动时开启后台探测
+    'interval': 10,             # 探测间隔(秒)
+    'jitter': 0.2,              # 探测间隔的随机抖动比例
+    'timeout': 2,               # 单次探测超时(秒)
+    'failure_threshold': 3,     # 连续失败多少次后熔断
+    'recovery_timeout': 30      # 熔断多久后进入半开状态(秒)
+}
+
+# /message准入控制与过载保护配置
+ADMISSION_CONFIG = {
+    'enabled': True,
+    'initial_limit': 64,        # 初始并发工作流上限
+    'min_limit': 4,             # 自适应调整的下限
+    'max_limit': 256,           # 自适应调整的上限
+    'queue_size': 32,           # 达到上限后最多排队的请求数
+    'queue_timeout': 1.0,       # 排队等待超时(秒)，超时后拒绝
+    'reject_status': 503,       # 拒绝时的HTTP状态码(429或503)，附带Retry-After
+    'adaptive': True,           # 是否按AIMD根据工作流耗时调整并发上限
+    'target_latency': 10,       # 工作流耗时超过该值(秒)时下调上限
+    'increase': 1,              # 加性增长：每轮（约limit个请求）增加的上限
+    'decrease_factor': 0.9,     # 乘性下降系数
+    'latency_ewma_alpha': 0.2   # 工作流耗时EWMA平滑系数
+}
+
 # API配置
 API_CONFIG = {
     'default_timeout': 5,
-    'max_retries': 3,
-    'retry_delay': 1
+    'max_retries': 3,                   # 单次调用的最大尝试次数（含首次）
+    'retry_base_delay': 0.1,            # 指数退避的基础时间(秒)，实际等待时间带随机抖动
+    'retry_max_delay': 2,               # 单次退避时间上限(秒)
+    'retry_budget_ratio': 0.1,          # 全局重试预算：重试次数不超过调用次数的10%
+    'retry_budget_min_per_second': 1,   # 低流量时每秒保底的重试次数
+    'latency_ewma_alpha': 0.3,          # 智能体延迟EWMA的平滑系数
+    # 对冲请求配置，可通过Agent.properties['hedge']按智能体开关
+    'hedging': {
+        'enabled': False,           # 是否默认开启对冲
+        'percentile': 0.95,         # 主请求超过该延迟分位数后发送对冲副本
+        'min_samples': 20,          # 计算分位数所需的最少样本数
+        'max_ratio': 0.05           # 对冲请求数不超过调用数的比例
+    },
+    # 微批配置，Agent.properties['batch']为True或字典（覆盖以下字段）时，该智能体的并发调用
+    # 合并为一次批量请求，发送到endpoints['batch']（未配置时为服务接口）
+    'batching': {
+        'max_size': 16,             # 单批最多合并的调用数
+        'window_ms': 5              # 收集同一批调用的最长等待时间(毫秒)
+    },
+    # 允许通过local://模块:函数端点导入的模块前缀（如'my_agents'允许my_agents及其子模块）。
+    # /agent/register未鉴权，导入模块会在服务进程内执行其模块级代码，默认不允许任何模块
+    'local_agent_modules': [],
+    # 连接池默认配置，可通过Agent.properties['pool']按智能体覆盖（覆盖后该智能体使用独立连接池）
+    'pool': {
+        'limit': 100,               # 连接池总连接数上限
+        'limit_per_host': 20,       # 单个主机的连接数上限
+        'keepalive_timeout': 30,    # 空闲keep-alive连接保留时间(秒)
+        'ttl_dns_cache': 300,       # DNS缓存时间(秒)
+        'connect_timeout': None,    # 建立连接超时(秒)，None表示仅受总超时限制
+        'read_timeout': None        # 单次读取超时(秒)，None表示仅受总超时限制
+    }
 }
\ No newline at end of file
@@ -1,5 +1,49 @@
-from typing import Dict, Any
-from dataclasses import dataclass
+from typing import Dict, Any, Awaitable, Callable, Optional
+from dataclasses import dataclass, field
+import importlib
+import inspect
+from ..config import API_CONFIG
+
+LOCAL_SCHEME = 'local://'
+
+LocalHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+def resolve_local_handler(endpoint: str) -> LocalHandler:
+    """
+    解析进程内智能体端点 local://包路径.模块:可调用对象，返回其异步可调用对象。
+
+    只导入API_CONFIG['local_agent_modules']中列出的模块（及其子模块），
+    避免通过注册接口在服务进程内导入并执行任意模块。
+
+    Raises:
+        ValueError: 端点格式错误、模块不在允许列表中、无法导入或目标不是异步可调用对象
+    """
+    path = endpoint[len(LOCAL_SCHEME):]
+    module_name, _, attr_path = path.partition(':')
+    if not module_name or not attr_path:
+        raise ValueError(f"Invalid local endpoint {endpoint}, expected local://module:callable")
+    if not is_allowed_module(module_name):
+        raise ValueError(f"Local endpoint module {module_name} is not in local_agent_modules")
+    try:
+        target = importlib.import_module(module_name)
+        for attr in attr_path.split('.'):
+            target = getattr(target, attr)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"Cannot import local endpoint {endpoint}: {e}") from e
+    if not is_async_callable(target):
+        raise ValueError(f"Local endpoint {endpoint} is not an async callable")
+    return target
+
+def is_allowed_module(module_name: str) -> bool:
+    """模块是否为允许列表中的模块或其子模块"""
+    return any(
+        module_name == prefix or module_name.startswith(prefix + '.')
+        for prefix in API_CONFIG['local_agent_modules']
+    )
+
+def is_async_callable(target: Any) -> bool:
+    """判断是否为异步函数或定义了异步__call__的对象"""
+    return inspect.iscoroutinefunction(target) or inspect.iscoroutinefunction(getattr(target, '__call__', None))
 
 @dataclass
 class Agent:
@@ -7,13 +51,25 @@ class Agent:
     type: str                   # 智能体类型
     endpoints: Dict[str, str]   # 智能体接口地址
     properties: Dict[str, Any]  # 智能体属性
+    # 进程内智能体的异步处理函数，接收请求体字典并返回OpenAI格式响应字典
+    handler: Optional[LocalHandler] = field(default=None, compare=False, repr=False)
 
     def __post_init__(self):
+        if self.handler is not None:
+            # 直接传入处理函数时端点仅作标识
+            if not is_async_callable(self.handler):
+                raise ValueError("Agent handler must be an async callable")
+            for ep in ('health', 'service'):
+                self.endpoints.setdefault(ep, f"{LOCAL_SCHEME}{self.name}")
+
         # 验证必需的endpoints
         required_endpoints = {'health', 'service'}
         if not all(ep in self.endpoints for ep in required_endpoints):
             raise ValueError(f"Agent must have {required_endpoints} endpoints")
 
+        if self.handler is None and self.service_endpoint.startswith(LOCAL_SCHEME):
+            self.handler = resolve_local_handler(self.service_endpoint)
+
     @property
     def health_endpoint(self) -> str:
         """健康检查接口"""
@@ -24,6 +80,11 @@ class Agent:
         """服务接口"""
         return self.endpoints['service']
 
+    @property
+    def is_local(self) -> bool:
+        """是否为进程内智能体（直接调用处理函数，不经过HTTP）"""
+        return self.handler is not None
+
     def is_function_agent(self) -> bool:
         """判断是否为功能智能体"""
         return self.type == 'function'
\ No newline at end of file
@@ -0,0 +1,131 @@
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from ..config import ADMISSION_CONFIG
+from ..utils.exceptions import DeadlineExceededError, OverloadedError
+from ..utils.logger import logger
+
+class AdmissionController:
+    """
+    工作流准入控制：限制worker内同时执行的工作流数量，超出时在有界队列中短暂等待，
+    队列已满或等待超时立即拒绝（OverloadedError），避免过载时所有请求一起超时。
+
+    adaptive为True时按AIMD调整并发上限：请求耗时不超过target_latency时每完成一个请求
+    上限增加increase/limit（约每轮增加increase）；超过目标或截止时间已到时上限乘以
+    decrease_factor，同一冷却期（target_latency）内只下调一次。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**ADMISSION_CONFIG, **(config or {})}
+        self.limit = float(self.config['initial_limit'])
+        self.inflight = 0
+        self.latency_ewma: Optional[float] = None
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self.admitted = 0       # 准入的请求数（含排队后准入）
+        self.queued = 0         # 经过排队的请求数
+        self.rejected = 0       # 队列已满被拒绝的请求数
+        self.timed_out = 0      # 排队超时被拒绝的请求数
+        self.logger = logger.getChild('AdmissionController')
+
+    @property
+    def current_limit(self) -> int:
+        """当前生效的并发上限"""
+        return max(1, int(self.limit))
+
+    def retry_after(self) -> int:
+        """建议客户端重试的等待时间(秒)，取近期工作流耗时"""
+        return max(1, math.ceil(self.latency_ewma or 1))
+
+    async def acquire(self) -> None:
+        """
+        申请执行名额。
+
+        Raises:
+            OverloadedError: 等待队列已满或排队超过queue_timeout
+        """
+        if self.inflight < self.current_limit and not self._waiters:
+            self.inflight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.config['queue_size']:
+            self.rejected += 1
+            raise OverloadedError("Server overloaded, admission queue is full", self.retry_after())
+
+        self.queued += 1
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await asyncio.wait_for(future, self.config['queue_timeout'])
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise OverloadedError("Server overloaded, admission queue wait timed out", self.retry_after())
+        except BaseException:
+            # 已被分配名额后调用方取消，归还名额
+            if future.done() and not future.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            if future in self._waiters:
+                self._waiters.remove(future)
+        self.admitted += 1
+
+    def release(self, latency: float, overloaded: bool = False) -> None:
+        """归还执行名额并根据本次耗时调整并发上限"""
+        if self.config['adaptive']:
+            self._adjust(latency, overloaded)
+        self._release_slot()
+
+    def _release_slot(self) -> None:
+        self.inflight -= 1
+        while self._waiters and self.inflight < self.current_limit:
+            future = self._waiters.popleft()
+            if not future.done():
+                self.inflight += 1
+                future.set_result(None)
+
+    def _adjust(self, latency: float, overloaded: bool) -> None:
+        alpha = self.config['latency_ewma_alpha']
+        self.latency_ewma = latency if self.latency_ewma is None else self.latency_ewma + alpha * (latency - self.latency_ewma)
+
+        target = self.config['target_latency']
+        if overloaded or latency > target:
+            now = time.monotonic()
+            if now - self._last_decrease >= target:
+                self._last_decrease = now
+                previous = self.current_limit
+                self.limit = max(self.config['min_limit'], self.limit * self.config['decrease_factor'])
+                if self.current_limit != previous:
+                    self.logger.warning("降低并发上限 | %s -> %s | 耗时: %.3fs", previous, self.current_limit, latency)
+        else:
+            self.limit = min(self.config['max_limit'], self.limit + self.config['increase'] / self.limit)
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        """在准入名额内执行代码块，结束时按耗时调整上限"""
+        await self.acquire()
+        started = time.monotonic()
+        overloaded = False
+        try:
+            yield
+        except DeadlineExceededError:
+            overloaded = True
+            raise
+        finally:
+            self.release(time.monotonic() - started, overloaded)
+
+    def stats(self) -> Dict[str, Any]:
+        """准入控制统计"""
+        return {
+            'limit': self.current_limit,
+            'inflight': self.inflight,
+            'queue_depth': len(self._waiters),
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'latency_ewma': None if self.latency_ewma is None else round(self.latency_ewma, 4)
+        }
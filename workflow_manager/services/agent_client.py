@@ -1,39 +1,248 @@
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Mapping, Optional, Sequence, Set, Tuple
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
 import aiohttp
 import asyncio
+import logging
+import time
 from ..models.agent import Agent
 from ..config import API_CONFIG
 from ..utils.logger import logger
+from ..utils.deadline import Deadline
+from ..utils.exceptions import DeadlineExceededError
+from ..utils.retry import RetryBudget, backoff_delay
+from ..utils import codec, tracing
+from .batcher import BatchCoalescer
+
+def merge_stream_chunks(chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """将chat.completion.chunk序列合并为完整的chat.completion响应"""
+    choices: Dict[int, Dict[str, Any]] = {}
+    for chunk in chunks:
+        for choice in chunk.get('choices', []):
+            merged = choices.setdefault(choice.get('index', 0), {
+                "index": choice.get('index', 0),
+                "message": {"role": "assistant", "content": ""},
+                "finish_reason": None
+            })
+            delta = choice.get('delta', {})
+            if delta.get('role'):
+                merged['message']['role'] = delta['role']
+            merged['message']['content'] += delta.get('content') or ''
+            if choice.get('finish_reason'):
+                merged['finish_reason'] = choice['finish_reason']
+
+    result = {
+        "object": "chat.completion",
+        "created": chunks[0].get('created'),
+        "choices": [choices[index] for index in sorted(choices)]
+    }
+    usage = next((chunk['usage'] for chunk in reversed(chunks) if chunk.get('usage')), None)
+    if usage:
+        result['usage'] = usage
+    return result
+
+@dataclass
+class AgentStats:
+    """单个智能体的调用统计，供负载均衡使用"""
+    inflight: int = 0                       # 在途请求数
+    ewma_latency: Optional[float] = None    # 单次尝试延迟的指数加权移动平均(秒)
+    calls: int = 0                          # 尝试次数
+    failures: int = 0                       # 失败次数
+    hedges: int = 0                         # 作为对冲副本被调用的次数
+    latencies: deque = field(default_factory=lambda: deque(maxlen=200))  # 最近成功尝试的延迟样本
+
+    def latency_percentile(self, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """计算最近成功延迟的分位数，样本不足时返回None"""
+        if len(self.latencies) < max(min_samples, 1):
+            return None
+        samples = sorted(self.latencies)
+        return samples[min(len(samples) - 1, int(len(samples) * percentile))]
 
 class AgentClient:
     def __init__(self):
-        self.session = None
+        self.session = None                                 # 默认共享连接池
+        # 按智能体独立的连接池：智能体名称 -> (连接池配置, session)
+        self._agent_sessions: Dict[str, Tuple[Dict[str, Any], aiohttp.ClientSession]] = {}
+        self._in_use: Dict[aiohttp.ClientSession, int] = {}  # 各连接池的在途请求数
+        self._retiring: Set[aiohttp.ClientSession] = set()    # 已替换、等待在途请求结束后关闭的连接池
+        self._closing: Set[asyncio.Task] = set()
         self.config = {
             'default_timeout': 30,
-            'max_retries': 3,
-            'retry_delay': 1,
+            'max_retries': API_CONFIG['max_retries'],
+            'retry_base_delay': API_CONFIG['retry_base_delay'],
+            'retry_max_delay': API_CONFIG['retry_max_delay'],
             'api_key': 'test-key'  # 添加默认测试key
         }
+        self.pool_config = dict(API_CONFIG['pool'])
+        self.ewma_alpha = API_CONFIG['latency_ewma_alpha']
+        self._stats: Dict[str, AgentStats] = {}
+        self.retry_budget = RetryBudget(
+            API_CONFIG['retry_budget_ratio'],
+            API_CONFIG['retry_budget_min_per_second']
+        )
+        self.hedge_config = dict(API_CONFIG['hedging'])
+        # 对冲请求与重试共用同一种令牌桶限流：对冲次数不超过调用次数的max_ratio
+        self.hedge_budget = RetryBudget(self.hedge_config['max_ratio'], min_per_second=0)
+        self.batch_config = dict(API_CONFIG['batching'])
+        self._batchers: Dict[str, Tuple[Agent, BatchCoalescer]] = {}   # 智能体名称 -> (创建时的智能体, 合并器)
         self.logger = logger.getChild('AgentClient')
 
+    def _create_session(self, settings: Dict[str, Any]) -> aiohttp.ClientSession:
+        """按连接池配置创建aiohttp session"""
+        connector = aiohttp.TCPConnector(
+            limit=settings['limit'],
+            limit_per_host=settings['limit_per_host'],
+            keepalive_timeout=settings['keepalive_timeout'],
+            ttl_dns_cache=settings['ttl_dns_cache']
+        )
+        return aiohttp.ClientSession(connector=connector)
+
+    def _pool_settings(self, agent: Agent) -> Dict[str, Any]:
+        """合并默认连接池配置与智能体自定义配置"""
+        return {**self.pool_config, **(agent.properties.get('pool') or {})}
+
+    def get_stats(self, agent: Agent) -> AgentStats:
+        """获取智能体的调用统计"""
+        stats = self._stats.get(agent.name)
+        if stats is None:
+            stats = self._stats[agent.name] = AgentStats()
+        return stats
+
+    def _record_latency(self, stats: AgentStats, elapsed: float) -> None:
+        """记录一次尝试的耗时并更新EWMA"""
+        stats.calls += 1
+        if stats.ewma_latency is None:
+            stats.ewma_latency = elapsed
+        else:
+            stats.ewma_latency += self.ewma_alpha * (elapsed - stats.ewma_latency)
+
     async def ensure_session(self):
         """确保aiohttp session已创建"""
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
+        if self.session is None or self.session.closed:
+            self.session = self._create_session(self.pool_config)
+
+    async def get_session(self, agent: Agent) -> aiohttp.ClientSession:
+        """获取智能体对应的session，声明了pool属性的智能体使用独立连接池"""
+        if not agent.properties.get('pool'):
+            await self.ensure_session()
+            return self.session
+
+        settings = self._pool_settings(agent)
+        entry = self._agent_sessions.get(agent.name)
+        if entry is not None and entry[0] == settings and not entry[1].closed:
+            return entry[1]
+        if entry is not None:
+            self._retire(entry[1])  # 重新注册后连接池配置已变化
+        session = self._create_session(settings)
+        self._agent_sessions[agent.name] = (settings, session)
+        self.logger.debug("创建独立连接池 | 智能体: %s", agent.name)
+        return session
+
+    def sync_agents(self, agents: Mapping[str, Agent]) -> None:
+        """
+        注册表变化后调用：关闭已注销、不再声明pool或连接池配置已变化的智能体的独立连接池，
+        以及已注销或重新注册（端点、属性或处理函数变化）的智能体的微批合并器。
+
+        连接池在其在途请求全部结束后关闭，合并器发送剩余调用后关闭，不影响正在执行的调用。
+        """
+        for name, (registered, batcher) in list(self._batchers.items()):
+            if not self._same_agent(registered, agents.get(name)):
+                del self._batchers[name]
+                self._close_later(batcher.close())
+        for name, (settings, session) in list(self._agent_sessions.items()):
+            agent = agents.get(name)
+            if agent is None or not agent.properties.get('pool') or self._pool_settings(agent) != settings:
+                del self._agent_sessions[name]
+                self._retire(session)
+                self.logger.debug("回收独立连接池 | 智能体: %s", name)
+
+    def _retire(self, session: aiohttp.ClientSession) -> None:
+        """没有在途请求时立即关闭连接池，否则等待最后一个请求结束后关闭"""
+        if self._in_use.get(session):
+            self._retiring.add(session)
+            return
+        self._retiring.discard(session)
+        self._close_later(session.close())
+
+    def _close_later(self, closing: Awaitable[None]) -> None:
+        """在后台关闭资源，close()时等待其完成"""
+        task = asyncio.ensure_future(closing)
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @asynccontextmanager
+    async def _request(self, agent: Agent, method: str, url: str, **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        """通过智能体对应的连接池发送请求，并统计该连接池的在途请求数"""
+        session = await self.get_session(agent)
+        self._in_use[session] = self._in_use.get(session, 0) + 1
+        try:
+            async with session.request(method, url, **kwargs) as response:
+                yield response
+        finally:
+            self._in_use[session] -= 1
+            if not self._in_use[session]:
+                del self._in_use[session]
+                if session in self._retiring:
+                    self._retire(session)
+
+    def _request_timeout(self, agent: Agent, timeout: float) -> aiohttp.ClientTimeout:
+        """构建区分连接与读取阶段的超时配置"""
+        settings = self._pool_settings(agent)
+        return aiohttp.ClientTimeout(
+            total=timeout,
+            connect=settings.get('connect_timeout'),
+            sock_read=settings.get('read_timeout')
+        )
+
+    def get_pool_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        获取各连接池的实时统计。
+
+        in_use为本客户端统计的在途请求数（含等待连接的请求），limit与limit_per_host
+        为连接池配置，不读取aiohttp连接器的内部状态。
+
+        Returns:
+            Dict[str, Dict[str, int]]: 连接池名称（default或智能体名称）到
+                in_use/limit/limit_per_host统计的映射
+        """
+        pools = {'default': self.session, **{name: session for name, (_, session) in self._agent_sessions.items()}}
+        stats = {}
+        for name, session in pools.items():
+            if session is None or session.closed:
+                continue
+            connector = session.connector
+            stats[name] = {
+                'in_use': self._in_use.get(session, 0),
+                'limit': connector.limit,
+                'limit_per_host': connector.limit_per_host
+            }
+        return stats
 
     async def close(self):
         """关闭客户端session"""
-        if self.session and not self.session.closed:
-            await self.session.close()
-            self.logger.debug("AgentClient session已关闭")
+        for _, batcher in self._batchers.values():
+            await batcher.close()
+        self._batchers.clear()
+        await asyncio.gather(*self._closing, return_exceptions=True)
+        sessions = [self.session, *(session for _, session in self._agent_sessions.values()), *self._retiring]
+        for session in sessions:
+            if session and not session.closed:
+                await session.close()
+        self._agent_sessions.clear()
+        self._retiring.clear()
+        self.logger.debug("AgentClient session已关闭")
 
-    async def check_health(self, agent: Agent) -> bool:
-        """检查智能体健康状态"""
-        await self.ensure_session()
+    async def check_health(self, agent: Agent, timeout: float = None) -> bool:
+        """检查智能体健康状态，进程内智能体没有健康接口，始终返回True（HealthMonitor不探测进程内智能体）"""
+        if agent.is_local:
+            return True
         try:
-            async with self.session.get(
+            async with self._request(
+                agent,
+                'GET',
                 agent.health_endpoint,
-                timeout=self.config['default_timeout']
+                timeout=self._request_timeout(agent, timeout or self.config['default_timeout'])
             ) as response:
                 return response.status == 200
         except:
@@ -43,58 +252,417 @@ class AgentClient:
         self,
         agent: Agent,
         data: Dict[str, Any],
-        timeout: int = None
+        timeout: float = None,
+        deadline: Optional[Deadline] = None
     ) -> Dict[str, Any]:
-        """调用智能体服务"""
-        await self.ensure_session()
+        """
+        调用智能体服务。
 
-        self.logger.debug(
-            f"请求内容 | 用户: {data.get('message', {}).get('user_id', 'unknown')} "
-            f"| 内容摘要: {str(data.get('message', {}).get('content', ''))[:200]}..."
-        )
-        self.logger.debug(f"完整请求元数据: { {k: v for k, v in data.items() if k != 'message'} }")
+        timeout为本次调用（含重试与退避）的总时间预算，并受请求级deadline约束；
+        截止时间通过X-Request-Deadline请求头告知智能体。
+        进程内智能体直接调用其处理函数，超时、重试与响应校验与HTTP调用一致。
+        声明了batch属性的智能体由微批合并器与其他并发调用合并为一次批量请求发送。
+        """
 
-        self.logger.debug(
-            f"准备调用服务 | 智能体: {agent.name} "
-            f"| 端点: {agent.service_endpoint} "
-            f"| 超时: {timeout}s"
-        )
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                "请求内容 | 用户: %s | 内容摘要: %s...",
+                data.get('user_id', 'unknown'),
+                str(data.get('messages', [{}])[-1].get('content', ''))[:200]
+            )
+            self.logger.debug("完整请求元数据: %s", {k: v for k, v in data.items() if k != 'messages'})
+            self.logger.debug(
+                "准备调用服务 | 智能体: %s | 端点: %s | 超时: %ss",
+                agent.name, agent.service_endpoint, timeout
+            )
 
         if timeout is None:
             timeout = self.config['default_timeout']
+        call_deadline = deadline.child(timeout) if deadline else Deadline.after(timeout)
 
-        retries = self.config['max_retries']
-        while retries > 0:
+        if self.batch_settings(agent):
             try:
-                self.logger.debug(f"尝试调用 | 剩余重试次数: {retries}")
-                # 添加OpenAI格式头信息
-                headers = {
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {self.config['api_key']}",
-                    "OpenAI-Beta": "workflow-v1"
-                }
+                return await self._batcher(agent).submit(data, call_deadline)
+            except Exception as e:
+                self._raise_if_deadline_exceeded(e, deadline)
+                raise
+        return await self._call_with_retries(agent, data, call_deadline, self._validate_response, deadline=deadline)
+
+    @staticmethod
+    def _raise_if_deadline_exceeded(error: Exception, deadline: Optional[Deadline]) -> None:
+        """
+        请求级截止时间已过导致的超时转换为DeadlineExceededError：这类超时由调用方的
+        时间预算决定，不代表智能体故障，不应计入熔断。
+        """
+        if isinstance(error, (asyncio.TimeoutError, DeadlineExceededError)) and deadline is not None and deadline.expired:
+            raise DeadlineExceededError("Request deadline exceeded") from error
+
+    async def _call_with_retries(
+        self,
+        agent: Agent,
+        data: Dict[str, Any],
+        call_deadline: Deadline,
+        validate: Callable[[Any], Any],
+        endpoint: Optional[str] = None,
+        deadline: Optional[Deadline] = None
+    ) -> Any:
+        """
+        在call_deadline内按退避策略与重试预算重复尝试，返回validate校验后的响应。
+
+        Raises:
+            DeadlineExceededError: 请求级截止时间deadline已过
+        """
+        if agent.is_local:
+            send = lambda attempt: self._invoke_local(agent, data, call_deadline, attempt, validate)
+        else:
+            body = codec.dumps(data)  # 只编码一次，重试时复用
+            url = endpoint or agent.service_endpoint
+            send = lambda attempt: self._post_once(agent, body, call_deadline, attempt, validate, url)
+        self.retry_budget.record_call()
+        stats = self.get_stats(agent)
+        stats.inflight += 1
+        try:
+            attempt = 0
+            while True:
+                started = time.monotonic()
+                try:
+                    json_response = await send(attempt)
+                    elapsed = time.monotonic() - started
+                    self._record_latency(stats, elapsed)
+                    stats.latencies.append(elapsed)
+                    return json_response
+                except Exception as e:
+                    self._record_latency(stats, time.monotonic() - started)
+                    self._raise_if_deadline_exceeded(e, deadline)
+                    stats.failures += 1
+                    self.logger.debug("调用异常: %s", e)
+                    attempt += 1
+                    if attempt >= self.config['max_retries']:
+                        self.logger.error("所有重试次数已用尽")
+                        raise
+                    delay = backoff_delay(attempt - 1, self.config['retry_base_delay'], self.config['retry_max_delay'])
+                    if delay >= call_deadline.remaining():
+                        self.logger.error("剩余时间不足以重试")
+                        raise
+                    if not self.retry_budget.try_acquire():
+                        self.logger.warning("重试预算已耗尽，放弃重试")
+                        raise
+                    with tracing.span('agent.backoff', agent=agent.name, delay=round(delay, 3)):
+                        await asyncio.sleep(delay)
+        finally:
+            stats.inflight -= 1
+
+    def _headers(self, call_deadline: Deadline, span_id: Optional[str] = None) -> Dict[str, str]:
+        """构建调用智能体的请求头（OpenAI格式、截止时间与W3C traceparent）"""
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {self.config['api_key']}",
+            "OpenAI-Beta": "workflow-v1",
+            "X-Request-Deadline": call_deadline.to_header()
+        }
+        trace = tracing.current_trace()
+        if trace is not None:
+            headers["traceparent"] = trace.traceparent(span_id)
+        return headers
 
-                async with self.session.post(
-                    agent.service_endpoint,
-                    json=data,
-                    headers=headers,
-                    timeout=timeout
-                ) as response:
-                    self.logger.debug(f"收到响应 | 状态码: {response.status}")
-                    if response.status == 200:
-                        json_response = await response.json()
-                        # 验证响应格式
-                        if not all(k in json_response for k in ('object', 'choices')):
-                            raise ValueError("Invalid OpenAI format response")
-                        self.logger.debug(f"成功响应内容: {json_response}")
-                        return json_response
+    async def _post_once(
+        self,
+        agent: Agent,
+        body: bytes,
+        call_deadline: Deadline,
+        attempt: int,
+        validate: Callable[[Any], Any],
+        url: str
+    ) -> Any:
+        """发送一次服务请求并校验响应格式"""
+        with tracing.span('agent.attempt', agent=agent.name, attempt=attempt + 1) as attempt_span:
+            self.logger.debug("尝试调用 | 第%d次", attempt + 1)
+            headers = self._headers(call_deadline, attempt_span.span_id if attempt_span else None)
+            async with self._request(
+                agent,
+                'POST',
+                url,
+                data=body,
+                headers=headers,
+                timeout=self._request_timeout(agent, call_deadline.budget())
+            ) as response:
+                self.logger.debug("收到响应 | 状态码: %s", response.status)
+                if response.status != 200:
                     error_msg = f"服务调用失败，状态码: {response.status}"
                     self.logger.warning(error_msg)
                     raise Exception(error_msg)
+                raw = await response.read()
+
+        with tracing.span('agent.parse', agent=agent.name, bytes=len(raw)):
+            json_response = validate(codec.loads_raw(raw))
+        self.logger.debug("成功响应内容: %s", json_response)
+        return json_response
+
+    async def _invoke_local(
+        self,
+        agent: Agent,
+        data: Dict[str, Any],
+        call_deadline: Deadline,
+        attempt: int,
+        validate: Callable[[Any], Any]
+    ) -> Any:
+        """
+        直接调用进程内智能体的处理函数并校验响应格式。
+
+        请求体不经过JSON编码，处理函数不应修改传入的字典。
+        """
+        with tracing.span('agent.attempt', agent=agent.name, attempt=attempt + 1, transport='local'):
+            self.logger.debug("尝试调用进程内智能体 | 第%d次", attempt + 1)
+            json_response = await asyncio.wait_for(agent.handler(data), call_deadline.budget())
+        json_response = validate(json_response)
+        self.logger.debug("成功响应内容: %s", json_response)
+        return json_response
+
+    @staticmethod
+    def _validate_response(json_response: Any) -> Dict[str, Any]:
+        """验证响应为OpenAI格式"""
+        if not isinstance(json_response, dict) or not all(k in json_response for k in ('object', 'choices')):
+            raise ValueError("Invalid OpenAI format response")
+        return json_response
+
+    @classmethod
+    def _validate_batch_response(cls, json_response: Any) -> List[Any]:
+        """验证批量响应，无效的单条响应转换为对应位置的异常"""
+        if not isinstance(json_response, dict) or json_response.get('object') != 'batch' \
+                or not isinstance(json_response.get('responses'), list):
+            raise ValueError("Invalid batch response")
+        results = []
+        for item in json_response['responses']:
+            try:
+                results.append(cls._validate_response(item))
+            except ValueError as e:
+                results.append(e)
+        return results
+
+    def batch_settings(self, agent: Agent) -> Optional[Dict[str, Any]]:
+        """合并默认微批配置与Agent.properties['batch']，未声明批量支持时返回None"""
+        batch = agent.properties.get('batch')
+        if not batch:
+            return None
+        return {**self.batch_config, **(batch if isinstance(batch, dict) else {})}
+
+    @staticmethod
+    def _same_agent(registered: Agent, agent: Optional[Agent]) -> bool:
+        """是否为同一智能体注册：名称、类型、端点、属性与处理函数均未变化"""
+        return agent is not None and agent == registered and agent.handler is registered.handler
+
+    def _batcher(self, agent: Agent) -> BatchCoalescer:
+        """获取智能体的微批合并器，智能体重新注册（端点等变化）后重建，旧合并器发送剩余调用后关闭"""
+        entry = self._batchers.get(agent.name)
+        if entry is not None and self._same_agent(entry[0], agent):
+            return entry[1]
+        if entry is not None:
+            self._close_later(entry[1].close())
+        settings = self.batch_settings(agent)
+        batcher = BatchCoalescer(
+            lambda items, deadline: self._call_batch(agent, items, deadline),
+            settings['max_size'],
+            settings['window_ms'] / 1000
+        )
+        self._batchers[agent.name] = (agent, batcher)
+        return batcher
+
+    async def _call_batch(
+        self,
+        agent: Agent,
+        items: List[Dict[str, Any]],
+        call_deadline: Deadline
+    ) -> List[Any]:
+        """
+        发送一次批量请求：请求体为{"object": "batch", "requests": [...]}，
+        响应为{"object": "batch", "responses": [...]}且与请求一一对应。
+        发送到endpoints['batch']，未配置时发送到服务接口。
+        """
+        self.logger.debug("发送批量请求 | 智能体: %s | 数量: %d", agent.name, len(items))
+        with tracing.span('agent.batch', agent=agent.name, size=len(items)):
+            return await self._call_with_retries(
+                agent,
+                {"object": "batch", "requests": items},
+                call_deadline,
+                self._validate_batch_response,
+                agent.endpoints.get('batch')
+            )
+
+    def get_batch_stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各智能体的微批统计"""
+        return {name: batcher.stats() for name, (_, batcher) in self._batchers.items()}
+
+    async def stream_service(
+        self,
+        agent: Agent,
+        data: Dict[str, Any],
+        on_chunk: Callable[[Dict[str, Any]], Awaitable[None]],
+        timeout: float = None,
+        deadline: Optional[Deadline] = None
+    ) -> Dict[str, Any]:
+        """
+        以流式方式调用智能体服务（请求体附带stream=true，响应为SSE格式的chat.completion.chunk）。
+
+        每收到一个chunk即回调on_chunk，结束后将所有delta合并为完整的chat.completion响应返回。
+        流一旦开始便无法安全重放，因此流式调用不做重试。
+        进程内智能体调用一次处理函数，并将完整响应作为单个chunk回调。
+        """
+        if timeout is None:
+            timeout = self.config['default_timeout']
+        call_deadline = deadline.child(timeout) if deadline else Deadline.after(timeout)
+        if agent.is_local:
+            try:
+                return await self._stream_local(agent, data, on_chunk, call_deadline)
             except Exception as e:
-                self.logger.debug(f"调用异常: {str(e)}")
-                retries -= 1
-                if retries == 0:
-                    self.logger.error("所有重试次数已用尽")
-                    raise
-                await asyncio.sleep(self.config['retry_delay'])
\ No newline at end of file
+                self._raise_if_deadline_exceeded(e, deadline)
+                raise
+
+        headers = {**self._headers(call_deadline), "Accept": "text/event-stream"}
+
+        stats = self.get_stats(agent)
+        stats.inflight += 1
+        started = time.monotonic()
+        chunks = []
+        try:
+            async with self._request(
+                agent,
+                'POST',
+                agent.service_endpoint,
+                data=codec.dumps({**data, "stream": True}),
+                headers=headers,
+                timeout=self._request_timeout(agent, call_deadline.budget())
+            ) as response:
+                if response.status != 200:
+                    raise Exception(f"服务调用失败，状态码: {response.status}")
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    payload = line[len('data:'):].strip()
+                    if payload == '[DONE]':
+                        break
+                    chunk = codec.loads(payload)
+                    chunks.append(chunk)
+                    await on_chunk(chunk)
+            if not chunks:
+                raise ValueError("Empty stream response")
+        except Exception as e:
+            self._record_latency(stats, time.monotonic() - started)
+            self._raise_if_deadline_exceeded(e, deadline)
+            stats.failures += 1
+            raise
+        finally:
+            stats.inflight -= 1
+
+        elapsed = time.monotonic() - started
+        self._record_latency(stats, elapsed)
+        stats.latencies.append(elapsed)
+        return merge_stream_chunks(chunks)
+
+    async def _stream_local(
+        self,
+        agent: Agent,
+        data: Dict[str, Any],
+        on_chunk: Callable[[Dict[str, Any]], Awaitable[None]],
+        call_deadline: Deadline
+    ) -> Dict[str, Any]:
+        """进程内智能体的流式调用：单次调用，结果转换为一个chat.completion.chunk"""
+        stats = self.get_stats(agent)
+        stats.inflight += 1
+        started = time.monotonic()
+        try:
+            result = await self._invoke_local(agent, data, call_deadline, 0, self._validate_response)
+        except Exception:
+            stats.failures += 1
+            self._record_latency(stats, time.monotonic() - started)
+            raise
+        finally:
+            stats.inflight -= 1
+
+        elapsed = time.monotonic() - started
+        self._record_latency(stats, elapsed)
+        stats.latencies.append(elapsed)
+        await on_chunk({
+            "object": "chat.completion.chunk",
+            "created": result.get('created'),
+            "choices": [
+                {
+                    "index": choice.get('index', 0),
+                    "delta": choice.get('message', {}),
+                    "finish_reason": choice.get('finish_reason')
+                }
+                for choice in result['choices']
+            ]
+        })
+        return result
+
+    def hedge_delay(self, agent: Agent) -> Optional[float]:
+        """
+        计算对冲请求的触发延迟（该智能体的延迟分位数）。
+
+        Returns:
+            Optional[float]: 触发延迟(秒)；未开启对冲或样本不足时返回None
+        """
+        enabled = agent.properties.get('hedge', self.hedge_config['enabled'])
+        if not enabled:
+            return None
+        return self.get_stats(agent).latency_percentile(
+            self.hedge_config['percentile'],
+            self.hedge_config['min_samples']
+        )
+
+    async def call_hedged(
+        self,
+        agent: Agent,
+        backups: Sequence[Agent],
+        data: Dict[str, Any],
+        timeout: float = None,
+        deadline: Optional[Deadline] = None
+    ) -> Tuple[Agent, Dict[str, Any]]:
+        """
+        带对冲的服务调用：主请求超过agent的延迟分位数仍未返回时，向backups中
+        在途请求最少、延迟最低的副本发送同一请求，先成功者胜出并取消另一方。
+
+        Returns:
+            Tuple[Agent, Dict[str, Any]]: 实际返回结果的智能体及其响应
+        """
+        delay = self.hedge_delay(agent) if backups else None
+        if delay is None:
+            return agent, await self.call_service(agent, data, timeout=timeout, deadline=deadline)
+
+        if timeout is None:
+            timeout = self.config['default_timeout']
+        call_deadline = deadline.child(timeout) if deadline else Deadline.after(timeout)
+        self.hedge_budget.record_call()
+
+        tasks = {
+            asyncio.create_task(
+                self.call_service(agent, data, timeout=call_deadline.remaining(), deadline=deadline)
+            ): agent
+        }
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self.hedge_budget.try_acquire():
+                primary = next(iter(tasks))
+                return agent, await primary
+
+            backup = min(backups, key=lambda a: (self.get_stats(a).inflight, self.get_stats(a).ewma_latency or 0.0))
+            self.logger.debug("发送对冲请求 | 主: %s | 副本: %s | 触发延迟: %.3fs", agent.name, backup.name, delay)
+            self.get_stats(backup).hedges += 1
+            tasks[asyncio.create_task(
+                self.call_service(backup, data, timeout=call_deadline.remaining(), deadline=deadline)
+            )] = backup
+
+            pending = set(tasks)
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return tasks[task], task.result()
+                    first_error = first_error or task.exception()
+            raise first_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
@@ -0,0 +1,65 @@
+import itertools
+import random
+from typing import Dict, Sequence
+from ..models.agent import Agent
+from ..utils.exceptions import WorkflowConfigError, AgentCallError
+from .agent_client import AgentClient
+
+class LoadBalancer:
+    """负载均衡器基类，从同类型的候选智能体中选择一个"""
+
+    def select(self, agents: Sequence[Agent], client: AgentClient) -> Agent:
+        """需要子类实现的选择逻辑"""
+        raise NotImplementedError()
+
+    def choose(self, agents: Sequence[Agent], client: AgentClient) -> Agent:
+        """选择智能体，单个候选时直接返回"""
+        if not agents:
+            raise AgentCallError("No candidate agent to select")
+        if len(agents) == 1:
+            return agents[0]
+        return self.select(agents, client)
+
+class RoundRobinBalancer(LoadBalancer):
+    """按智能体类型轮询"""
+
+    def __init__(self):
+        self._counters: Dict[str, itertools.count] = {}
+
+    def select(self, agents: Sequence[Agent], client: AgentClient) -> Agent:
+        counter = self._counters.setdefault(agents[0].type, itertools.count())
+        return agents[next(counter) % len(agents)]
+
+class LeastOutstandingBalancer(LoadBalancer):
+    """选择在途请求数最少的智能体，并列时随机选择"""
+
+    def select(self, agents: Sequence[Agent], client: AgentClient) -> Agent:
+        inflight = [client.get_stats(agent).inflight for agent in agents]
+        least = min(inflight)
+        return random.choice([agent for agent, count in zip(agents, inflight) if count == least])
+
+class PowerOfTwoChoicesBalancer(LoadBalancer):
+    """随机抽取两个候选，选择EWMA延迟与在途请求数加权后代价更低者"""
+
+    @staticmethod
+    def _cost(agent: Agent, client: AgentClient) -> float:
+        stats = client.get_stats(agent)
+        if stats.ewma_latency is None:
+            return 0.0  # 尚无延迟样本的智能体优先探测
+        return stats.ewma_latency * (stats.inflight + 1)
+
+    def select(self, agents: Sequence[Agent], client: AgentClient) -> Agent:
+        first, second = random.sample(list(agents), 2)
+        return first if self._cost(first, client) <= self._cost(second, client) else second
+
+BALANCERS = {
+    'round_robin': RoundRobinBalancer,
+    'least_outstanding': LeastOutstandingBalancer,
+    'p2c_ewma': PowerOfTwoChoicesBalancer,
+}
+
+def create_balancer(name: str) -> LoadBalancer:
+    """按名称创建负载均衡器"""
+    if name not in BALANCERS:
+        raise WorkflowConfigError(f"Unknown load balancer: {name}")
+    return BALANCERS[name]()
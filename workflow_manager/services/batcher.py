@@ -0,0 +1,86 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+from ..utils.deadline import Deadline
+
+# 批量发送函数：(请求体列表, 批次截止时间) -> 与请求一一对应的响应或异常
+BatchSender = Callable[[List[Dict[str, Any]], Deadline], Awaitable[List[Union[Dict[str, Any], Exception]]]]
+
+class BatchCoalescer:
+    """
+    单个智能体的微批合并器：收集window秒内（或达到max_size个）的并发调用，
+    合并为一次批量请求发送，再把各自的响应分发回等待的协程。
+
+    批次截止时间取批内最早的截止时间；整批失败时所有调用方收到同一异常，
+    单条响应无效时仅对应的调用方收到异常。
+    """
+
+    def __init__(self, send: BatchSender, max_size: int, window: float):
+        self.send = send
+        self.max_size = max(1, max_size)
+        self.window = window
+        self._pending: List[Tuple[Dict[str, Any], Deadline, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self.batches = 0    # 已发送批次数
+        self.items = 0      # 已发送调用数
+
+    async def submit(self, data: Dict[str, Any], deadline: Deadline) -> Dict[str, Any]:
+        """提交一次调用并等待其所在批次返回"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((data, deadline, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """发送当前批次，已取消的调用不再发送"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = [item for item in self._pending if not item[2].done()]
+        self._pending = []
+        if not batch:
+            return
+        task = asyncio.create_task(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[Dict[str, Any], Deadline, asyncio.Future]]) -> None:
+        self.batches += 1
+        self.items += len(batch)
+        deadline = min((item[1] for item in batch), key=lambda d: d.expires_at)
+        try:
+            results = await self.send([item[0] for item in batch], deadline)
+            if len(results) != len(batch):
+                raise ValueError(f"Batch response size mismatch: expected {len(batch)}, got {len(results)}")
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """批次统计"""
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+            'pending': len(self._pending)
+        }
+
+    async def close(self) -> None:
+        """发送剩余调用并等待在途批次完成"""
+        self._flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,125 @@
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+from ..utils.cache import TTLCache
+from ..utils.exceptions import WorkflowConfigError
+from ..utils.sqlite import SQLiteExecutor, expired_before, prepare_path, require_shared_backend
+from ..utils import codec
+
+class DeferredResultStore:
+    """
+    后台执行步骤（policy为async/sampled）的结果存储，按请求ID与步骤类型保存状态与结果，
+    超过ttl秒的结果过期。条目格式为{'status': 'pending'|'completed'|'failed', 'result'|'error': ...}。
+    """
+
+    def __init__(self, ttl: Optional[float]):
+        self.ttl = ttl  # 结果保留时间(秒)，None表示不过期
+
+    async def put(self, request_id: str, step: str, entry: Dict[str, Any]) -> None:
+        """写入或覆盖请求中一个步骤的状态"""
+        raise NotImplementedError
+
+    async def get(self, request_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """按步骤类型返回请求中所有后台步骤的状态，未知或已过期时返回None"""
+        raise NotImplementedError
+
+    async def stats(self) -> Dict[str, Any]:
+        """保留期内各状态的步骤数量"""
+        return {}
+
+    async def close(self) -> None:
+        """释放存储资源"""
+
+class MemoryDeferredResultStore(DeferredResultStore):
+    """进程内存储，只适用于单个worker：多个worker时查询请求可能到达其他worker"""
+
+    def __init__(self, max_results: int, ttl: Optional[float]):
+        super().__init__(ttl)
+        self._cache = TTLCache(max_results, ttl)
+
+    async def put(self, request_id: str, step: str, entry: Dict[str, Any]) -> None:
+        results = self._cache.get(request_id) or {}
+        results[step] = entry
+        self._cache.set(request_id, results)
+
+    async def get(self, request_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        results = self._cache.get(request_id)
+        return dict(results) if results is not None else None
+
+    async def stats(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {}
+        for results in self._cache.values():
+            for entry in results.values():
+                counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return {'backend': 'memory', **counts}
+
+class SQLiteDeferredResultStore(DeferredResultStore):
+    """
+    同一主机上各worker共享的SQLite存储，每个步骤一行，写入为单条语句，无需读改写。
+
+    与进程内存储一样最多保留max_results个请求的结果：步骤结束时顺带删除过期结果，
+    以及超出上限的最久未更新的请求。
+    """
+
+    def __init__(self, path: str, max_results: int, ttl: Optional[float]):
+        super().__init__(ttl)
+        self.path = path
+        self.max_results = max_results
+        self._db = SQLiteExecutor(path, (
+            "CREATE TABLE IF NOT EXISTS deferred_results ("
+            "request_id TEXT NOT NULL, step TEXT NOT NULL, status TEXT NOT NULL, entry BLOB NOT NULL, "
+            "updated_at REAL NOT NULL, PRIMARY KEY (request_id, step))",
+        ), thread_name_prefix='deferred-store')
+
+    async def put(self, request_id: str, step: str, entry: Dict[str, Any]) -> None:
+        def write(conn: sqlite3.Connection) -> None:
+            conn.execute(
+                "INSERT OR REPLACE INTO deferred_results (request_id, step, status, entry, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (request_id, step, entry['status'], codec.dumps(entry), time.time())
+            )
+            if entry['status'] != 'pending':
+                # 顺带清理过期结果与超出max_results的最久未更新的请求
+                conn.execute("DELETE FROM deferred_results WHERE updated_at <= ?", (expired_before(self.ttl),))
+                conn.execute(
+                    "DELETE FROM deferred_results WHERE request_id NOT IN ("
+                    "SELECT request_id FROM deferred_results GROUP BY request_id "
+                    "ORDER BY MAX(updated_at) DESC LIMIT ?)",
+                    (self.max_results,)
+                )
+        await self._db.run(write)
+
+    async def get(self, request_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        def read(conn: sqlite3.Connection) -> Optional[Dict[str, Dict[str, Any]]]:
+            rows = conn.execute(
+                "SELECT step, entry FROM deferred_results WHERE request_id = ? AND updated_at > ?",
+                (request_id, expired_before(self.ttl))
+            ).fetchall()
+            return {step: codec.loads(entry) for step, entry in rows} if rows else None
+        return await self._db.run(read)
+
+    async def stats(self) -> Dict[str, Any]:
+        def count(conn: sqlite3.Connection) -> Dict[str, int]:
+            return dict(conn.execute(
+                "SELECT status, COUNT(*) FROM deferred_results WHERE updated_at > ? GROUP BY status",
+                (expired_before(self.ttl),)
+            ).fetchall())
+        return {'backend': 'sqlite', 'path': self.path, **await self._db.run(count)}
+
+    async def close(self) -> None:
+        await self._db.close()
+
+def create_deferred_store(config: Dict[str, Any]) -> DeferredResultStore:
+    """
+    按配置创建后台步骤结果存储。
+
+    Raises:
+        WorkflowConfigError: 未知后端，或多个worker时使用进程内存储
+    """
+    backend = config.get('backend', 'memory')
+    require_shared_backend('Deferred result', backend)
+    if backend == 'memory':
+        return MemoryDeferredResultStore(config['max_results'], config['result_ttl'])
+    if backend == 'sqlite':
+        return SQLiteDeferredResultStore(prepare_path(config['path']), config['max_results'], config['result_ttl'])
+    raise WorkflowConfigError(f"Unknown deferred result backend: {backend}")
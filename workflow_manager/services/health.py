@@ -0,0 +1,180 @@
+import asyncio
+import random
+import time
+from typing import Any, Dict, List, Optional, Sequence
+from ..models.agent import Agent
+from ..agent_registry import AgentRegistry
+from ..config import HEALTH_CONFIG
+from ..utils.logger import logger
+from .agent_client import AgentClient
+
+class CircuitBreaker:
+    """
+    单个智能体的熔断器：closed -> open -> half_open -> closed。
+
+    half_open时只放行一个试探请求：试探请求通过acquire()占用名额，结果记录后释放，
+    其余请求在试探结束前仍被拒绝。
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        """当前状态，open超过恢复时间后进入half_open允许试探流量"""
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def allow_request(self) -> bool:
+        """是否允许请求通过：closed时放行，half_open时仅在没有试探请求执行中时放行"""
+        state = self.state
+        return state == self.CLOSED or (state == self.HALF_OPEN and not self._trial_in_flight)
+
+    def acquire(self) -> bool:
+        """half_open时为即将发出的请求占用唯一的试探名额，返回是否占用成功"""
+        if self.state != self.HALF_OPEN or self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def release(self) -> None:
+        """试探请求未产生结果（如调用方截止时间耗尽）时归还试探名额"""
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        """记录成功，关闭熔断器"""
+        self.failures = 0
+        self._state = self.CLOSED
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """记录失败，达到阈值或试探失败时打开熔断器"""
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self._state = self.OPEN
+            self._opened_at = time.monotonic()
+
+class HealthMonitor:
+    """后台健康探测器，维护每个智能体的熔断器并据此过滤路由候选"""
+
+    def __init__(self, agent_registry: AgentRegistry, agent_client: AgentClient, config: Optional[Dict[str, Any]] = None):
+        self.agent_registry = agent_registry
+        self.agent_client = agent_client
+        self.config = {**HEALTH_CONFIG, **(config or {})}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.logger = logger.getChild('HealthMonitor')
+
+    def breaker(self, agent: Agent) -> CircuitBreaker:
+        """获取智能体的熔断器"""
+        breaker = self._breakers.get(agent.name)
+        if breaker is None:
+            breaker = self._breakers[agent.name] = CircuitBreaker(
+                self.config['failure_threshold'],
+                self.config['recovery_timeout']
+            )
+        return breaker
+
+    def is_available(self, agent: Agent) -> bool:
+        """智能体当前是否可参与路由"""
+        breaker = self._breakers.get(agent.name)
+        return breaker is None or breaker.allow_request()
+
+    def is_closed(self, agent: Agent) -> bool:
+        """智能体熔断器是否处于closed状态（可承接对冲等额外流量）"""
+        breaker = self._breakers.get(agent.name)
+        return breaker is None or breaker.state == CircuitBreaker.CLOSED
+
+    def filter_available(self, agents: Sequence[Agent]) -> List[Agent]:
+        """过滤掉熔断中的智能体"""
+        return [agent for agent in agents if self.is_available(agent)]
+
+    def acquire(self, agent: Agent) -> bool:
+        """智能体处于half_open时占用其唯一的试探名额，返回是否占用（closed时无需占用）"""
+        breaker = self._breakers.get(agent.name)
+        return breaker is not None and breaker.acquire()
+
+    def release(self, agent: Agent) -> None:
+        """归还未记录结果的试探名额"""
+        breaker = self._breakers.get(agent.name)
+        if breaker is not None:
+            breaker.release()
+
+    def record_success(self, agent: Agent) -> None:
+        """记录一次成功调用或探测"""
+        self.breaker(agent).record_success()
+
+    def record_failure(self, agent: Agent) -> None:
+        """记录一次失败调用或探测"""
+        breaker = self.breaker(agent)
+        previous = breaker.state
+        breaker.record_failure()
+        if previous != CircuitBreaker.OPEN and breaker.state == CircuitBreaker.OPEN:
+            self.logger.warning("智能体熔断 | 名称: %s | 连续失败: %d", agent.name, breaker.failures)
+
+    def get_states(self) -> Dict[str, str]:
+        """获取所有智能体的熔断器状态"""
+        return {name: breaker.state for name, breaker in self._breakers.items()}
+
+    async def probe_all(self) -> None:
+        """
+        并发探测所有已注册智能体的健康接口。
+
+        进程内智能体没有可探测的健康接口，不参与探测：其熔断器只由实际调用结果驱动，
+        熔断后经half_open状态的试探调用恢复。
+        """
+        snapshot = self.agent_registry.snapshot()
+        for name in set(self._breakers) - set(snapshot.agents):
+            del self._breakers[name]  # 清理已注销的智能体
+
+        agents = [agent for agent in snapshot.agents.values() if not agent.is_local]
+        results = await asyncio.gather(*[
+            self.agent_client.check_health(agent, timeout=self.config['timeout'])
+            for agent in agents
+        ])
+        for agent, healthy in zip(agents, results):
+            if healthy:
+                if self.breaker(agent).state != CircuitBreaker.CLOSED:
+                    self.logger.info("智能体恢复 | 名称: %s", agent.name)
+                self.record_success(agent)
+            else:
+                self.record_failure(agent)
+
+    def _next_interval(self) -> float:
+        """带抖动的探测间隔，避免多个worker同时探测"""
+        jitter = self.config['jitter']
+        return self.config['interval'] * random.uniform(1 - jitter, 1 + jitter)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._next_interval())
+            try:
+                await self.probe_all()
+            except Exception as e:
+                self.logger.error("健康探测异常: %s", e, exc_info=True)
+
+    def start(self) -> None:
+        """启动后台探测任务"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            self.logger.debug("健康探测任务已启动")
+
+    async def stop(self) -> None:
+        """停止后台探测任务"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
@@ -0,0 +1,133 @@
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+from ..utils.exceptions import WorkflowConfigError
+
+# 步骤执行方式：session/mission/function为内置的会话、分发与动态路由步骤，
+# agent为通用步骤（调用该类型的一个智能体并将结果记入workflow_data）
+STEP_KINDS = ('session', 'mission', 'function', 'agent')
+
+# 通用步骤的执行策略（options['policy']）：inline在响应前执行；async先返回响应，在后台执行并保存结果；
+# sampled只对抽中的请求执行（sample_rate比例，或目标FUNCTION智能体在sample_routes中），
+# 抽中的请求按sample_policy（默认async）执行
+STEP_POLICIES = ('inline', 'async', 'sampled')
+
+# 步骤配置中由编译器解析的字段，其余字段原样保留在StepPlan.options中
+_STEP_FIELDS = {'agent_type', 'required', 'timeout', 'dynamic_routing', 'is_final', 'execution'}
+
+@dataclass(frozen=True)
+class StepPlan:
+    """编译后的单个工作流步骤"""
+    agent_type: str
+    kind: str
+    timeout: float
+    required: bool = True
+    is_final: bool = False                  # 该步骤的响应作为工作流最终输出
+    execution: str = 'sequential'           # function步骤: parallel按依赖分批并发 / sequential逐个执行
+    options: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+
+@dataclass(frozen=True)
+class WorkflowPlan:
+    """编译后的不可变工作流：按顺序执行的阶段，同一阶段内的步骤并发执行"""
+    name: str
+    stages: Tuple[Tuple[StepPlan, ...], ...]
+
+    @property
+    def steps(self) -> Tuple[StepPlan, ...]:
+        """按声明顺序展开的所有步骤"""
+        return tuple(step for stage in self.stages for step in stage)
+
+    def step(self, agent_type: str) -> Optional[StepPlan]:
+        """按智能体类型查找步骤"""
+        return next((step for step in self.steps if step.agent_type == agent_type), None)
+
+    @property
+    def final_step(self) -> Optional[StepPlan]:
+        """标记为is_final的步骤"""
+        return next((step for step in self.steps if step.is_final), None)
+
+def _step_kind(config: Dict[str, Any]) -> str:
+    agent_type = config['agent_type']
+    if agent_type == 'SESSION':
+        return 'session'
+    if agent_type == 'MISSION':
+        return 'mission'
+    if agent_type == 'FUNCTION' and config.get('dynamic_routing'):
+        return 'function'
+    return 'agent'
+
+def _compile_step(name: str, config: Any, default_timeout: float) -> StepPlan:
+    if not isinstance(config, dict) or not config.get('agent_type'):
+        raise WorkflowConfigError(f"Workflow {name}: each step needs an agent_type")
+    timeout = config.get('timeout', default_timeout)
+    if not isinstance(timeout, (int, float)) or timeout <= 0:
+        raise WorkflowConfigError(f"Workflow {name}: invalid timeout for {config['agent_type']}")
+    execution = config.get('execution', 'sequential')
+    if execution not in ('parallel', 'sequential'):
+        raise WorkflowConfigError(f"Workflow {name}: unknown execution mode {execution}")
+    kind = _step_kind(config)
+    policy = config.get('policy', 'inline')
+    if policy not in STEP_POLICIES:
+        raise WorkflowConfigError(f"Workflow {name}: unknown policy {policy}")
+    if policy != 'inline' and kind != 'agent':
+        raise WorkflowConfigError(f"Workflow {name}: policy {policy} is only supported for generic steps")
+    if policy == 'sampled':
+        sample_rate = config.get('sample_rate', 0)
+        if not isinstance(sample_rate, (int, float)) or not 0 <= sample_rate <= 1:
+            raise WorkflowConfigError(f"Workflow {name}: sample_rate must be between 0 and 1")
+        if config.get('sample_policy', 'async') not in ('inline', 'async'):
+            raise WorkflowConfigError(f"Workflow {name}: unknown sample_policy {config['sample_policy']}")
+    return StepPlan(
+        agent_type=config['agent_type'],
+        kind=kind,
+        timeout=timeout,
+        required=bool(config.get('required', True)),
+        is_final=bool(config.get('is_final', False)),
+        execution=execution,
+        options=MappingProxyType({k: v for k, v in config.items() if k not in _STEP_FIELDS})
+    )
+
+def compile_workflow(name: str, steps: List[Any], default_timeout: float) -> WorkflowPlan:
+    """
+    将步骤配置列表编译为WorkflowPlan。
+
+    列表元素为步骤配置，或{'parallel': [步骤配置, ...]}表示并发执行的阶段；
+    并发阶段只能包含通用步骤，内置的会话、分发与动态路由步骤依赖执行顺序。
+
+    Raises:
+        WorkflowConfigError: 配置不合法
+    """
+    if not steps:
+        raise WorkflowConfigError(f"Workflow {name} has no steps")
+
+    stages = []
+    for entry in steps:
+        if isinstance(entry, dict) and 'parallel' in entry:
+            stage = tuple(_compile_step(name, config, default_timeout) for config in entry['parallel'])
+            if not stage:
+                raise WorkflowConfigError(f"Workflow {name}: empty parallel stage")
+            if len(stage) > 1 and any(step.kind != 'agent' for step in stage):
+                raise WorkflowConfigError(f"Workflow {name}: SESSION, MISSION and routed FUNCTION steps cannot run in parallel")
+        else:
+            stage = (_compile_step(name, entry, default_timeout),)
+        stages.append(stage)
+
+    plan = WorkflowPlan(name=name, stages=tuple(stages))
+    agent_types = [step.agent_type for step in plan.steps]
+    duplicates = sorted({t for t in agent_types if agent_types.count(t) > 1})
+    if duplicates:
+        raise WorkflowConfigError(f"Workflow {name}: duplicate steps {duplicates}")
+    if sum(step.is_final for step in plan.steps) > 1:
+        raise WorkflowConfigError(f"Workflow {name}: more than one final step")
+    kinds = [step.kind for step in plan.steps]
+    if 'function' in kinds and ('mission' not in kinds or kinds.index('mission') > kinds.index('function')):
+        raise WorkflowConfigError(f"Workflow {name}: routed FUNCTION step requires a preceding MISSION step")
+    return plan
+
+def compile_workflows(config: Dict[str, Any], default_timeout: float) -> Mapping[str, WorkflowPlan]:
+    """编译default_workflow（名称为default）与workflows中的命名工作流"""
+    workflows = {'default': config['default_workflow'], **config.get('workflows', {})}
+    return MappingProxyType({
+        name: compile_workflow(name, steps, default_timeout)
+        for name, steps in workflows.items()
+    })
@@ -0,0 +1,65 @@
+from typing import Any, Dict, Optional
+from ..models.agent import Agent
+from ..utils.logger import logger
+from ..utils import codec
+
+def resolve_projection(agent: Agent, projections: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    解析智能体的上下文裁剪规则。
+
+    按智能体类型读取WORKFLOW_CONFIG['projections']，再用Agent.properties['projection']覆盖。
+
+    Returns:
+        Optional[Dict[str, Any]]: 裁剪规则，未配置时返回None表示发送完整上下文
+    """
+    type_projection = projections.get(agent.type)
+    agent_projection = agent.properties.get('projection')
+    if not type_projection and not agent_projection:
+        return None
+    return {**(type_projection or {}), **(agent_projection or {})}
+
+def _payload_size(payload: Dict[str, Any]) -> int:
+    """按发送时的编码（codec.dumps，紧凑分隔符）计算请求体字节数"""
+    return len(codec.dumps(payload))
+
+def project_payload(payload: Dict[str, Any], projection: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    按裁剪规则生成发送给智能体的请求体，不修改原始payload。
+
+    规则字段：
+        workflow_data: 需要保留的workflow_data键列表，None表示全部保留
+        max_messages: 仅保留最近的N条消息，None表示全部保留
+        max_bytes: 请求体按codec编码后的字节上限，超出时依次丢弃最早的消息
+            （至少保留最后一条）和最早写入的workflow_data键
+    """
+    if not projection:
+        return payload
+
+    projected = dict(payload)
+    keys = projection.get('workflow_data')
+    if keys is not None:
+        projected['workflow_data'] = {k: v for k, v in payload['workflow_data'].items() if k in keys}
+
+    max_messages = projection.get('max_messages')
+    if max_messages is not None:
+        projected['messages'] = payload['messages'][-max_messages:] if max_messages > 0 else []
+
+    max_bytes = projection.get('max_bytes')
+    if max_bytes is not None:
+        size = _payload_size(projected)
+        if size > max_bytes:
+            # 只编码一次整体请求体，之后每丢弃一项减去该项的编码长度（含分隔逗号）
+            messages = list(projected['messages'])
+            workflow_data = dict(projected['workflow_data'])
+            while size > max_bytes and (len(messages) > 1 or workflow_data):
+                if len(messages) > 1:
+                    size -= len(codec.dumps(messages.pop(0))) + 1
+                else:
+                    key = next(iter(workflow_data))
+                    value = workflow_data.pop(key)
+                    size -= len(codec.dumps(str(key))) + 1 + len(codec.dumps(value)) + (1 if workflow_data else 0)
+            projected['messages'] = messages
+            projected['workflow_data'] = workflow_data
+            if size > max_bytes:
+                logger.warning("请求体裁剪后仍超过上限 | 大小: %d | 上限: %d", size, max_bytes)
+    return projected
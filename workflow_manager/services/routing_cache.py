@@ -0,0 +1,40 @@
+import unicodedata
+from typing import Any, Dict, Optional
+from ..utils.cache import TTLCache
+
+class RoutingCache:
+    """
+    MISSION路由决策缓存。
+
+    键为规范化后的用户输入与当前FUNCTION智能体集合指纹，FUNCTION智能体的注册、
+    注销或能力变化会改变指纹，从而使旧的决策自动失效。
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float]):
+        self._cache = TTLCache(max_size, ttl)
+        self._fingerprint: Optional[str] = None
+
+    @staticmethod
+    def normalize(content: str) -> str:
+        """规范化用户输入：全半角统一、小写、合并空白"""
+        return ' '.join(unicodedata.normalize('NFKC', content).lower().split())
+
+    def _check_fingerprint(self, fingerprint: str) -> None:
+        # FUNCTION智能体集合变化后旧条目不会再命中，直接清空释放内存
+        if fingerprint != self._fingerprint:
+            self._cache.clear()
+            self._fingerprint = fingerprint
+
+    def get(self, content: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """查找缓存的MISSION响应"""
+        self._check_fingerprint(fingerprint)
+        return self._cache.get((self.normalize(content), fingerprint))
+
+    def put(self, content: str, fingerprint: str, mission_result: Dict[str, Any]) -> None:
+        """缓存MISSION响应"""
+        self._check_fingerprint(fingerprint)
+        self._cache.set((self.normalize(content), fingerprint), mission_result)
+
+    def stats(self) -> Dict[str, int]:
+        """命中统计"""
+        return self._cache.stats()
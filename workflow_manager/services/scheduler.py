@@ -0,0 +1,138 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+from ..config import WORKFLOW_CONFIG, ADMISSION_CONFIG
+from ..models.message import Message
+from ..utils.exceptions import DeadlineExceededError
+
+@dataclass
+class TenantState:
+    """单个租户的调度状态"""
+    weight: float
+    vtime: float = 0.0                      # 虚拟时间：已获得服务量/权重
+    cost_ewma: Optional[float] = None       # 单个工作流耗时的EWMA，用于派发时预扣
+    running: int = 0
+    dispatched: int = 0
+    waiters: Deque[asyncio.Future] = field(default_factory=deque)
+
+class FairScheduler:
+    """
+    按租户加权公平调度工作流（虚拟时间加权公平队列）。
+
+    全局最多max_concurrency个工作流同时执行；有空闲名额时派发虚拟时间最小的租户的
+    最早请求。派发时按该租户工作流耗时的EWMA预扣服务量，完成时按实际耗时修正，
+    因此长工作流多的租户获得的派发机会相应减少。租户空闲（无执行中与排队请求）时
+    立即删除其状态，重新活跃时虚拟时间从当前虚拟时钟开始，不能积攒空闲期的份额，
+    租户状态数量也不会随历史用户数增长。
+
+    max_concurrency未配置时取ADMISSION_CONFIG['initial_limit']：准入控制已限制每个worker
+    同时处理的请求数，调度器只在准入上限自适应增长超过该值时排队，避免被准入的请求再次排队等待。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**WORKFLOW_CONFIG['scheduler'], **(config or {})}
+        self.max_concurrency = self.config['max_concurrency'] or ADMISSION_CONFIG['initial_limit']
+        self.running = 0
+        self._tenants: Dict[str, TenantState] = {}
+        self._clock = 0.0   # 最近一次派发时的虚拟时间
+
+    def tenant_of(self, message: Message) -> str:
+        """租户键：Message.metadata[tenant_key]，未指定时为user_id"""
+        return str(message.metadata.get(self.config['tenant_key']) or message.user_id)
+
+    def _tenant(self, tenant: str) -> TenantState:
+        state = self._tenants.get(tenant)
+        if state is None:
+            weight = self.config['weights'].get(tenant, self.config['default_weight'])
+            state = self._tenants[tenant] = TenantState(weight=weight, vtime=self._clock)
+        return state
+
+    def _drop_if_idle(self, tenant: str, state: TenantState) -> None:
+        if not state.running and not state.waiters and self._tenants.get(tenant) is state:
+            del self._tenants[tenant]
+
+    def _estimate(self, state: TenantState) -> float:
+        return state.cost_ewma if state.cost_ewma is not None else self.config['default_cost']
+
+    def _start(self, state: TenantState) -> None:
+        """派发：占用名额并预扣预计服务量"""
+        self._clock = max(self._clock, state.vtime)
+        state.vtime += self._estimate(state) / state.weight
+        state.running += 1
+        state.dispatched += 1
+        self.running += 1
+
+    async def acquire(self, tenant: str, timeout: Optional[float] = None) -> None:
+        """
+        为租户申请执行名额。
+
+        Raises:
+            DeadlineExceededError: timeout秒内未被派发
+        """
+        state = self._tenant(tenant)
+        if self.running < self.max_concurrency and not any(s.waiters for s in self._tenants.values()):
+            self._start(state)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        state.waiters.append(future)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError("Request deadline exceeded while waiting for scheduling")
+        except BaseException:
+            # 已被派发后调用方取消：退还预扣的服务量并归还名额，不计入耗时EWMA
+            if future.done() and not future.cancelled():
+                state.vtime -= self._estimate(state) / state.weight
+                self._free(tenant, state)
+            raise
+        finally:
+            if future in state.waiters:
+                state.waiters.remove(future)
+            self._drop_if_idle(tenant, state)
+
+    def release(self, tenant: str, cost: float) -> None:
+        """归还名额，按实际耗时修正该租户的虚拟时间并派发下一个请求"""
+        state = self._tenants[tenant]
+        state.vtime += (cost - self._estimate(state)) / state.weight
+        alpha = self.config['cost_ewma_alpha']
+        state.cost_ewma = cost if state.cost_ewma is None else state.cost_ewma + alpha * (cost - state.cost_ewma)
+        self._free(tenant, state)
+
+    def _free(self, tenant: str, state: TenantState) -> None:
+        """归还名额、派发下一个请求，并删除空闲租户的状态"""
+        state.running -= 1
+        self.running -= 1
+        self._dispatch()
+        self._drop_if_idle(tenant, state)
+
+    def _dispatch(self) -> None:
+        while self.running < self.max_concurrency:
+            waiting = [state for state in self._tenants.values() if state.waiters]
+            if not waiting:
+                return
+            state = min(waiting, key=lambda s: s.vtime)
+            future = state.waiters.popleft()
+            if future.done():
+                continue
+            self._start(state)
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """全局及各租户的并发与排队统计"""
+        return {
+            'max_concurrency': self.max_concurrency,
+            'running': self.running,
+            'queue_depth': sum(len(s.waiters) for s in self._tenants.values()),
+            'tenants': {
+                name: {
+                    'weight': state.weight,
+                    'running': state.running,
+                    'queued': len(state.waiters),
+                    'dispatched': state.dispatched,
+                    'vtime': round(state.vtime, 4)
+                }
+                for name, state in self._tenants.items()
+            }
+        }
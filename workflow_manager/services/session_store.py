@@ -0,0 +1,121 @@
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional
+from ..utils.cache import TTLCache
+from ..utils.exceptions import WorkflowConfigError
+from ..utils.sqlite import SQLiteExecutor, expired_before, prepare_path, require_shared_backend
+from ..utils import codec
+
+class SessionStore:
+    """会话历史存储：按session_id保存最近的对话轮次，超过ttl未更新的会话过期"""
+
+    def __init__(self, ttl: Optional[float], max_messages: int):
+        self.ttl = ttl                      # 会话过期时间(秒)，None表示不过期
+        self.max_messages = max_messages    # 每个会话保留的最近消息数
+
+    async def get(self, session_id: str) -> List[Dict[str, Any]]:
+        """获取会话历史，不存在或已过期时返回空列表"""
+        raise NotImplementedError
+
+    async def append(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        """追加消息到会话历史并刷新过期时间"""
+        raise NotImplementedError
+
+    async def clear(self, session_id: str) -> None:
+        """删除会话历史"""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """存储统计"""
+        return {}
+
+    async def close(self) -> None:
+        """释放存储资源"""
+
+    def _trim(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return messages[-self.max_messages:] if self.max_messages else messages
+
+class MemorySessionStore(SessionStore):
+    """进程内LRU会话存储，超过max_sessions时淘汰最久未使用的会话"""
+
+    def __init__(self, max_sessions: int, ttl: Optional[float], max_messages: int):
+        super().__init__(ttl, max_messages)
+        self._cache = TTLCache(max_sessions, ttl)
+
+    async def get(self, session_id: str) -> List[Dict[str, Any]]:
+        return list(self._cache.get(session_id, ()))
+
+    async def append(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        history = self._cache.get(session_id, [])
+        self._cache.set(session_id, self._trim(history + list(messages)))
+
+    async def clear(self, session_id: str) -> None:
+        self._cache.pop(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'memory', **self._cache.stats()}
+
+class SQLiteSessionStore(SessionStore):
+    """
+    本地SQLite会话存储，worker重启后历史仍可用，同一主机上的多个worker可共享同一数据库文件。
+
+    所有数据库操作在单个后台线程中串行执行，不阻塞事件循环；追加在BEGIN IMMEDIATE
+    写事务内完成读改写，多个worker并发追加同一会话时不会丢失更新。
+    """
+
+    def __init__(self, path: str, ttl: Optional[float], max_messages: int):
+        super().__init__(ttl, max_messages)
+        self.path = path
+        self._db = SQLiteExecutor(path, (
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, messages BLOB NOT NULL, updated_at REAL NOT NULL)",
+        ), thread_name_prefix='session-store')
+
+    def _load(self, conn: sqlite3.Connection, session_id: str) -> List[Dict[str, Any]]:
+        row = conn.execute(
+            "SELECT messages FROM sessions WHERE session_id = ? AND updated_at > ?",
+            (session_id, expired_before(self.ttl))
+        ).fetchone()
+        return codec.loads(row[0]) if row else []
+
+    async def get(self, session_id: str) -> List[Dict[str, Any]]:
+        return await self._db.run(lambda conn: self._load(conn, session_id))
+
+    async def append(self, session_id: str, messages: List[Dict[str, Any]]) -> None:
+        def write(conn: sqlite3.Connection) -> None:
+            with SQLiteExecutor.transaction(conn):
+                history = self._trim(self._load(conn, session_id) + list(messages))
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, messages, updated_at) VALUES (?, ?, ?)",
+                    (session_id, codec.dumps(history), time.time())
+                )
+                # 顺带清理过期会话
+                conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (expired_before(self.ttl),))
+        await self._db.run(write)
+
+    async def clear(self, session_id: str) -> None:
+        await self._db.run(lambda conn: conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'sqlite', 'path': self.path}
+
+    async def close(self) -> None:
+        await self._db.close()
+
+def create_session_store(config: Dict[str, Any]) -> Optional[SessionStore]:
+    """
+    按配置创建会话存储，未开启时返回None。
+
+    Raises:
+        WorkflowConfigError: 未知后端，或多个worker时使用进程内存储（SESSION智能体不再重建历史，
+            请求落到其他worker时历史会丢失）
+    """
+    if not config.get('enabled'):
+        return None
+    backend = config.get('backend', 'memory')
+    require_shared_backend('Session store', backend)
+    if backend == 'memory':
+        return MemorySessionStore(config['max_sessions'], config['ttl'], config['max_messages'])
+    if backend == 'sqlite':
+        return SQLiteSessionStore(prepare_path(config['path']), config['ttl'], config['max_messages'])
+    raise WorkflowConfigError(f"Unknown session store backend: {backend}")
@@ -0,0 +1,63 @@
+from typing import Any, Dict, List, Optional, Sequence
+from ..config import WORKFLOW_CONFIG
+from ..models.message import Message
+from ..utils.cache import TTLCache
+from ..utils.retry import RetryBudget
+from .routing_cache import RoutingCache
+
+class Speculator:
+    """
+    预测MISSION将选择的FUNCTION智能体，供工作流在MISSION执行期间提前调用。
+
+    预测来源依次为：Message.metadata['predicted_agents']、按命名工作流配置的静态提示、
+    相同（规范化后）内容最近一次的MISSION路由结果。推测调用按令牌桶限制花费：
+    每个请求存入budget_ratio个令牌，每个推测调用消耗1个，结果被采用时归还，
+    因此被浪费的推测调用数不超过请求数的budget_ratio。
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        self.config = {**WORKFLOW_CONFIG['speculation'], **(config or {})}
+        self._history = TTLCache(self.config['history_size'], self.config['history_ttl'])
+        self.budget = RetryBudget(self.config['budget_ratio'], min_per_second=0, max_tokens=self.config['max_burst'])
+        self.launched = 0       # 发起的推测调用数
+        self.confirmed = 0      # 被MISSION确认并采用的推测调用数
+        self.wasted = 0         # 被取消或丢弃的推测调用数
+
+    def predict(self, message: Message, workflow: str) -> List[str]:
+        """预测目标FUNCTION智能体，无可用预测时返回空列表"""
+        self.budget.record_call()
+        predicted = message.metadata.get('predicted_agents') or self.config['hints'].get(workflow)
+        if not predicted:
+            predicted = self._history.get(RoutingCache.normalize(message.content)) or ()
+        return list(dict.fromkeys(predicted))[:self.config['max_agents']]
+
+    def record(self, message: Message, target_agents: Sequence[str]) -> None:
+        """记录MISSION的实际路由结果，供相同内容的后续请求预测"""
+        if target_agents:
+            self._history.set(RoutingCache.normalize(message.content), tuple(target_agents))
+
+    def try_acquire(self) -> bool:
+        """为一次推测调用获取花费额度"""
+        if self.budget.try_acquire():
+            self.launched += 1
+            return True
+        return False
+
+    def confirm(self) -> None:
+        """推测调用的结果被采用，归还额度"""
+        self.confirmed += 1
+        self.budget.refund()
+
+    def discard(self) -> None:
+        """推测调用被取消或其结果被丢弃"""
+        self.wasted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """推测执行统计"""
+        return {
+            'launched': self.launched,
+            'confirmed': self.confirmed,
+            'wasted': self.wasted,
+            'budget_rejected': self.budget.rejected,
+            'history': self._history.stats()
+        }
@@ -1,35 +1,90 @@
-import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator, Awaitable, Callable, Mapping, Optional, Sequence, Set, Tuple
 from ..models.message import Message
 from ..models.agent import Agent
-from ..agent_registry import AgentRegistry
-from ..config import WORKFLOW_CONFIG
+from ..agent_registry import AgentRegistry, RegistrySnapshot
+from ..config import WORKFLOW_CONFIG, HEALTH_CONFIG, API_CONFIG
 from .agent_client import AgentClient
-from ..utils.exceptions import WorkflowConfigError, AgentCallError
+from .balancer import LoadBalancer, create_balancer
+from .health import HealthMonitor
+from .routing_cache import RoutingCache
+from .projection import project_payload, resolve_projection
+from .session_store import SessionStore, create_session_store
+from .scheduler import FairScheduler
+from .plan import StepPlan, WorkflowPlan, compile_workflows
+from .speculation import Speculator
+from .deferred_store import DeferredResultStore, create_deferred_store
+from .workflow_store import create_workflow_store
+from ..utils.exceptions import WorkflowConfigError, AgentCallError, DeadlineExceededError, IdempotencyConflictError
 from ..utils.logger import logger  # 新增导入
+from ..utils.deadline import Deadline
+from ..utils.tracing import TraceBuffer
+from ..utils.cache import TTLCache
+from ..utils.singleflight import SingleFlight
+from ..utils import codec, tracing
 import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
 import uuid
 
+# 进度事件回调：(事件类型, 事件数据)
+EventCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
 class WorkflowService:
-    def __init__(self, agent_registry: AgentRegistry):
+    def __init__(
+        self,
+        agent_registry: AgentRegistry,
+        balancer: Optional[LoadBalancer] = None,
+        session_store: Optional[SessionStore] = None
+    ):
         self.agent_registry = agent_registry
         self.agent_client = AgentClient()
-        self.workflow_config = WORKFLOW_CONFIG['default_workflow']
+        # 工作流配置在启动时编译为不可变的执行计划，reload_plans可整体替换
+        self.plans = compile_workflows(WORKFLOW_CONFIG, API_CONFIG['default_timeout'])
+        self.workflow_store = create_workflow_store(WORKFLOW_CONFIG['workflow_store'])
+        self._plans_refresh: Optional[asyncio.Task] = None
+        self._registry_version: Optional[int] = None   # 最近一次同步客户端资源时的注册表版本
+        self._step_handlers = {
+            'session': self._session_step,
+            'mission': self._mission_step,
+            'function': self._function_step,
+            'agent': self._agent_step,
+        }
+        self.balancer = balancer or create_balancer(WORKFLOW_CONFIG['load_balancer'])
+        self.health_monitor = HealthMonitor(agent_registry, self.agent_client)
+        cache_config = WORKFLOW_CONFIG['routing_cache']
+        self.trace_buffer = TraceBuffer(WORKFLOW_CONFIG['tracing']['buffer_size'])
+        self.routing_cache = (
+            RoutingCache(cache_config['max_size'], cache_config['ttl'])
+            if cache_config['enabled'] else None
+        )
+        self.session_store = session_store or create_session_store(WORKFLOW_CONFIG['session_store'])
+        dedup_config = WORKFLOW_CONFIG['dedup']
+        self.single_flight = SingleFlight() if dedup_config['single_flight'] else None
+        self.idempotency_cache = TTLCache(dedup_config['idempotency_max_size'], dedup_config['idempotency_ttl'])
+        self._idempotency_inflight: Dict[Tuple[str, str], str] = {}    # 执行中的(用户, 幂等键) -> 请求指纹
+        self.scheduler = FairScheduler() if WORKFLOW_CONFIG['scheduler']['enabled'] else None
+        self.speculator = Speculator() if WORKFLOW_CONFIG['speculation']['enabled'] else None
+        self.deferred_store: DeferredResultStore = create_deferred_store(WORKFLOW_CONFIG['deferred'])
+        self._deferred_tasks: Set[asyncio.Task] = set()
+        self.deferred_stats = {'completed': 0, 'failed': 0, 'dropped': 0, 'sampled_out': 0}
         self.logger = logger.getChild('WorkflowService')  # 新增子logger
 
-        # 初始化网络连接
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            loop.create_task(self.agent_client.ensure_session())
-        else:
-            loop.run_until_complete(self.agent_client.ensure_session())
+    async def start(self):
+        """在事件循环内初始化网络连接，由ASGI lifespan在worker启动时调用"""
+        await self.agent_client.ensure_session()
+        await self.refresh_plans()
+        if HEALTH_CONFIG['enabled']:
+            self.health_monitor.start()
 
     def _get_response_content(self, response: Dict[str, Any]) -> str:
         """获取响应内容"""
         try:
             return self._get_response_messages(response)['content']
         except Exception as e:
-            self.logger.error(f"获取响应内容失败: {response}\n{str(e)}")
+            self.logger.error("获取响应内容失败: %s\n%s", response, e)
             raise e
 
     def _get_response_messages(self, response: Dict[str, Any]) -> List[Dict[str, Any]]:
@@ -37,15 +92,191 @@ class WorkflowService:
         try:
             return response['choices'][0]['message']
         except Exception as e:
-            self.logger.error(f"获取响应消息失败: {response}\n{str(e)}")
+            self.logger.error("获取响应消息失败: %s\n%s", response, e)
             raise e
 
-    async def process_message(self, message: Message) -> Dict[str, Any]:
-        """处理用户消息"""
-        self.logger.debug(f"开始处理消息 | 用户: {message.user_id} | 内容: {message.content}")
+    async def process_message(
+        self,
+        message: Message,
+        deadline: Optional[Deadline] = None,
+        on_event: Optional[EventCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        处理用户消息。
+
+        Args:
+            message: 用户消息
+            deadline: 请求级截止时间，未指定时使用request_timeout配置
+            on_event: 进度回调，每完成一个步骤回调一次step事件；
+                CHECKER智能体声明stream属性时逐个回调chunk事件
+
+        开启调度器时先按租户公平排队获得执行名额，排队时间计入deadline。
+        """
+        self.logger.debug("开始处理消息 | 用户: %s | 内容: %s", message.user_id, message.content)
+        if deadline is None:
+            deadline = Deadline.after(WORKFLOW_CONFIG['request_timeout'])
+
+        with tracing.start_trace('process_message', user_id=message.user_id) as trace:
+            try:
+                if self.scheduler is not None:
+                    tenant = self.scheduler.tenant_of(message)
+                    with tracing.span('scheduler.wait', tenant=tenant):
+                        await self.scheduler.acquire(tenant, deadline.remaining())
+                    started = time.monotonic()
+                    try:
+                        result = await self._execute_workflow(message, deadline, on_event)
+                    finally:
+                        self.scheduler.release(tenant, time.monotonic() - started)
+                else:
+                    result = await self._execute_workflow(message, deadline, on_event)
+            finally:
+                trace.finish()
+                self.trace_buffer.add(trace)
+
+        # 按需在结果中附带本次请求的耗时时间线
+        if message.metadata.get('timings', WORKFLOW_CONFIG['tracing']['include_timings']):
+            result['system']['timings'] = trace.to_dict()
+        return result
+
+    @staticmethod
+    def _message_fingerprint(message: Message) -> str:
+        """
+        用户、会话、内容与元数据都相同的请求视为同一请求。
+
+        元数据决定工作流选择（workflow、skip_steps）、租户与推测预测等执行方式，
+        按键排序后整体计入指纹，选择不同工作流的请求不会被合并。
+        """
+        metadata = json.dumps(message.metadata, sort_keys=True, ensure_ascii=False, default=str)
+        raw = '\0'.join((message.user_id, message.session_id or '', message.content, metadata))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    async def submit_message(
+        self,
+        message: Message,
+        deadline: Optional[Deadline] = None,
+        idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        带去重的消息处理入口。
+
+        相同请求并发到达时共享同一次process_message执行；指定idempotency_key时，
+        成功结果按(用户, 幂等键)缓存，重试直接返回缓存结果而不再调用智能体。
+
+        Raises:
+            IdempotencyConflictError: 幂等键已用于内容不同的请求
+            DeadlineExceededError: 等待共享执行超过本请求的截止时间
+        """
+        fingerprint = self._message_fingerprint(message)
+        if idempotency_key is not None:
+            cache_key = (message.user_id, idempotency_key)
+            cached = self.idempotency_cache.get(cache_key)
+            if cached is not None:
+                cached_fingerprint, result = cached
+                if cached_fingerprint != fingerprint:
+                    raise IdempotencyConflictError(f"Idempotency key {idempotency_key} was used for a different request")
+                self.logger.debug("命中幂等缓存 | 用户: %s | 幂等键: %s", message.user_id, idempotency_key)
+                return result
+            # 同一幂等键的请求仍在执行时，内容不同的并发请求同样视为冲突
+            inflight = self._idempotency_inflight.setdefault(cache_key, fingerprint)
+            if inflight != fingerprint:
+                raise IdempotencyConflictError(f"Idempotency key {idempotency_key} was used for a different request")
+
+        async def run() -> Dict[str, Any]:
+            try:
+                result = await self.process_message(message, deadline=deadline)
+                if idempotency_key is not None:
+                    self.idempotency_cache.set(cache_key, (fingerprint, result))
+                return result
+            finally:
+                if idempotency_key is not None:
+                    self._idempotency_inflight.pop(cache_key, None)
+
+        if self.single_flight is None:
+            return await run()
+        key = ('idempotency', message.user_id, idempotency_key) if idempotency_key is not None else fingerprint
+        try:
+            return await self.single_flight.do(key, run, timeout=deadline.remaining() if deadline else None)
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError("Request deadline exceeded")
+
+    def get_dedup_stats(self) -> Dict[str, Any]:
+        """请求去重统计"""
+        return {
+            'single_flight': self.single_flight.stats() if self.single_flight is not None else None,
+            'idempotency_cache': self.idempotency_cache.stats()
+        }
+
+    def _plan_for(self, message: Message) -> WorkflowPlan:
+        """按Message.metadata['workflow']选择工作流，未指定时使用default"""
+        name = message.metadata.get('workflow') or 'default'
+        plan = self.get_plans().get(name)
+        if plan is None:
+            raise WorkflowConfigError(f"Unknown workflow: {name}")
+        return plan
+
+    async def reload_plans(self, workflows: Optional[Dict[str, Any]] = None) -> None:
+        """
+        重新编译工作流配置并整体替换，编译失败时保留原有工作流。
+
+        Args:
+            workflows: 命名工作流配置，替换WORKFLOW_CONFIG['workflows']；None表示按当前配置重新编译
+        """
+        config = dict(WORKFLOW_CONFIG)
+        if workflows is not None:
+            config['workflows'] = workflows
+        plans = compile_workflows(config, API_CONFIG['default_timeout'])
+        if self.workflow_store is not None:
+            # 保存到共享存储，其他worker在下次检查版本时重新编译
+            version = await self.workflow_store.save(config['workflows'])
+            self.logger.info("工作流配置已保存 | 版本: %s", version)
+        self.plans = plans
+        self.logger.info("工作流已编译 | 名称: %s", list(self.plans))
+
+    def get_plans(self) -> Mapping[str, WorkflowPlan]:
+        """
+        当前生效的工作流。
+
+        使用共享存储时最多每check_interval秒在后台检查一次其他worker保存的新配置，
+        不在请求路径上等待数据库读取，新配置在检查完成后的请求中生效。
+        """
+        store = self.workflow_store
+        if store is not None and self._plans_refresh is None and store.due():
+            try:
+                self._plans_refresh = asyncio.get_running_loop().create_task(self.refresh_plans())
+            except RuntimeError:
+                pass    # 不在事件循环内（如启动前），下次检查时再刷新
+        return self.plans
+
+    async def refresh_plans(self) -> None:
+        """应用其他worker保存到共享存储的新配置，编译失败时保留原有工作流"""
+        if self.workflow_store is None:
+            return
+        try:
+            workflows = await self.workflow_store.poll()
+            if workflows is not None:
+                self.plans = compile_workflows(
+                    {**WORKFLOW_CONFIG, 'workflows': workflows}, API_CONFIG['default_timeout']
+                )
+                self.logger.info("已应用共享工作流配置 | 版本: %s", self.workflow_store.version)
+        except WorkflowConfigError as e:
+            self.logger.error("共享工作流配置编译失败，保留原有工作流 | 错误: %s", e)
+        except Exception as e:
+            self.logger.error("读取共享工作流配置失败 | 错误: %s", e)
+        finally:
+            if self._plans_refresh is asyncio.current_task():
+                self._plans_refresh = None
 
+    async def _execute_workflow(
+        self,
+        message: Message,
+        deadline: Deadline,
+        on_event: Optional[EventCallback]
+    ) -> Dict[str, Any]:
+        """按编译后的工作流依次执行各阶段，同一阶段内的步骤并发执行"""
+        plan = self._plan_for(message)
         # 构建OpenAI兼容请求格式
         context = {
+            'request_id': f"chatcmpl-{uuid.uuid4()}",
             'model': "workflow-1.0",
             'messages': [{
                 'role': "user",
@@ -56,135 +287,639 @@ class WorkflowService:
             'temperature': 0.7,
             'workflow_data': {},
             'current_step': 0,
+            'deadline': deadline,
+            'on_event': on_event,
+            'plan': plan,
         }
 
+        # 会话历史拼接在用户消息之前，与SESSION步骤是否执行无关
+        context['history'] = await self._load_history(message, context)
+        context['messages'] = context['history'] + context['messages']
+
+        # 请求开始时读取一次注册表快照，期间的注册/注销不影响本次工作流
+        with tracing.span('registry.snapshot'):
+            registry = self.agent_registry.snapshot()
+        if registry.version != self._registry_version:
+            # 注册表变化后回收已注销或配置已变化的智能体的客户端资源
+            self._registry_version = registry.version
+            self.agent_client.sync_agents(registry.agents)
+
+        skip_steps = set(message.metadata.get('skip_steps') or ())
         try:
-            # 1. 调用会话管理智能体
-            self.logger.debug("正在获取SESSION智能体...")
-            session_agents = self.agent_registry.get_agents_by_type("SESSION")
-            if not session_agents:
-                self.logger.error("没有可用的SESSION智能体")
-                raise AgentCallError("No available SESSION agent")
-
-            self.logger.debug(f"调用SESSION智能体: {session_agents[0].name}")
-            session_result = await self._process_step(session_agents[0], context, timeout=5)
-            self.logger.debug(f"SESSION智能体返回结果: {session_result}")
-            context['workflow_data']['SESSION'] = session_result
-            context['messages'] = session_result.get('choices', []) + context['messages']
-
-            # 2. 获取可用的功能智能体描述
-            function_agents = self.agent_registry.get_agents_by_type("FUNCTION")
-            agent_descriptions = [
+            for index, stage in enumerate(plan.stages):
+                context['current_step'] = index
+                steps = [step for step in stage if step.required or step.agent_type not in skip_steps]
+                if len(steps) == 1:
+                    await self._run_step(steps[0], message, registry, context)
+                elif steps:
+                    with tracing.span('stage.parallel', steps=[step.agent_type for step in steps]):
+                        tasks = [
+                            asyncio.create_task(self._run_step(step, message, registry, context))
+                            for step in steps
+                        ]
+                        try:
+                            await asyncio.gather(*tasks)
+                        except BaseException:
+                            for task in tasks:
+                                task.cancel()
+                            raise
+
+            final_response = self._final_response(plan, context)
+            await self._save_history(message, final_response)
+
+            # 最终返回结果处理
+            final_result = {
+                "id": context['request_id'],
+                **final_response,  # 包含OpenAI标准字段
+                "system": {
+                    **context['workflow_data'],
+                }
+            }
+            if context.get('deferred'):
+                final_result["deferred"] = context['deferred']  # 后台执行中的步骤
+            return final_result
+
+        except Exception as e:
+            self.logger.error("Workflow error: %s", e, exc_info=True)
+            raise
+        finally:
+            self._discard_speculation(context.pop('speculative', None))
+
+    async def _run_step(
+        self,
+        step: StepPlan,
+        message: Message,
+        registry: RegistrySnapshot,
+        context: Dict[str, Any]
+    ) -> None:
+        """执行单个步骤；可选步骤没有可用智能体时直接跳过，失败时记录日志后继续"""
+        if step.kind != 'function' and not registry.get_agents_by_type(step.agent_type):
+            if step.required:
+                self.logger.error("没有可用的%s智能体", step.agent_type)
+                raise AgentCallError(f"No available {step.agent_type} agent")
+            self.logger.debug("跳过可选步骤 | 步骤: %s | 原因: 没有可用智能体", step.agent_type)
+            return
+
+        policy = self._step_policy(step, context)
+        if policy is None:
+            self.deferred_stats['sampled_out'] += 1
+            self.logger.debug("跳过步骤 | 步骤: %s | 原因: 未被抽样", step.agent_type)
+            return
+        if policy == 'async':
+            await self._defer_step(step, message, registry, context)
+            return
+
+        handler = self._step_handlers[step.kind]
+        try:
+            await handler(step, message, registry, context)
+        except DeadlineExceededError:
+            raise
+        except Exception as e:
+            if step.required:
+                raise
+            self.logger.warning("可选步骤失败，跳过 | 步骤: %s | 错误: %s", step.agent_type, e)
+
+    def _step_policy(self, step: StepPlan, context: Dict[str, Any]) -> Optional[str]:
+        """本次请求中步骤的实际执行方式：inline或async，sampled策略未被抽中时返回None"""
+        policy = step.options.get('policy', 'inline')
+        if policy != 'sampled':
+            return policy
+        routes = step.options.get('sample_routes') or ()
+        target_agents = context.get('mission_plan', {}).get('target_agents', ())
+        if any(name in routes for name in target_agents) or random.random() < step.options.get('sample_rate', 0):
+            return step.options.get('sample_policy', 'async')
+        return None
+
+    async def _defer_step(
+        self,
+        step: StepPlan,
+        message: Message,
+        registry: RegistrySnapshot,
+        context: Dict[str, Any]
+    ) -> None:
+        """在后台执行步骤，不阻塞响应；状态与结果按请求ID保存到deferred_store"""
+        if len(self._deferred_tasks) >= WORKFLOW_CONFIG['deferred']['max_pending']:
+            self.deferred_stats['dropped'] += 1
+            self.logger.warning("后台步骤过多，跳过 | 步骤: %s", step.agent_type)
+            return
+
+        # 后台步骤使用当前上下文的副本与独立的截止时间，请求返回后不再推送进度事件
+        deferred_context = {
+            **context,
+            'messages': list(context['messages']),
+            'workflow_data': dict(context['workflow_data']),
+            'deadline': Deadline.after(step.timeout),
+            'on_event': None
+        }
+        await self.deferred_store.put(context['request_id'], step.agent_type, {'status': 'pending'})
+        context.setdefault('deferred', []).append(step.agent_type)
+
+        task = asyncio.create_task(self._run_deferred(step, message, registry, deferred_context))
+        self._deferred_tasks.add(task)
+        task.add_done_callback(self._deferred_tasks.discard)
+
+    async def _run_deferred(
+        self,
+        step: StepPlan,
+        message: Message,
+        registry: RegistrySnapshot,
+        context: Dict[str, Any]
+    ) -> None:
+        try:
+            await self._step_handlers[step.kind](step, message, registry, context)
+            entry = {'status': 'completed', 'result': context['workflow_data'][step.agent_type]}
+            self.deferred_stats['completed'] += 1
+        except Exception as e:
+            self.logger.warning("后台步骤失败 | 步骤: %s | 错误: %s", step.agent_type, e)
+            entry = {'status': 'failed', 'error': str(e)}
+            self.deferred_stats['failed'] += 1
+        try:
+            await self.deferred_store.put(context['request_id'], step.agent_type, entry)
+        except Exception as e:
+            self.logger.error("保存后台步骤结果失败 | 步骤: %s | 错误: %s", step.agent_type, e)
+
+    async def get_deferred_results(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """查询请求中后台步骤的状态与结果，未知或已过期时返回None"""
+        return await self.deferred_store.get(request_id)
+
+    async def get_deferred_stats(self) -> Dict[str, Any]:
+        """后台步骤统计：store为存储中（sqlite后端时为所有worker）各状态的步骤数，worker为本worker的计数"""
+        return {
+            'store': await self.deferred_store.stats(),
+            'worker': {'pending': len(self._deferred_tasks), **self.deferred_stats}
+        }
+
+    def _final_response(self, plan: WorkflowPlan, context: Dict[str, Any]) -> Dict[str, Any]:
+        """最终输出取is_final步骤的响应，该步骤被跳过时取最近完成步骤的响应"""
+        final_step = plan.final_step
+        response = context['workflow_data'].get(final_step.agent_type) if final_step else None
+        if response is None:
+            response = context.get('last_response')
+        if response is None:
+            raise AgentCallError("Workflow produced no response")
+        return response
+
+    async def _session_step(
+        self,
+        step: StepPlan,
+        message: Message,
+        registry: RegistrySnapshot,
+        context: Dict[str, Any]
+    ) -> None:
+        """调用会话管理智能体，其响应拼接在会话历史与用户消息之前"""
+        session_agents = registry.get_agents_by_type(step.agent_type)
+        self.logger.debug("调用SESSION智能体 | 候选数: %d", len(session_agents))
+        # 本地保存了会话历史时SESSION智能体只接收新一轮消息
+        session_context = {**context, 'messages': context['messages'][len(context['history']):]}
+        session_result = await self._process_step(session_agents, session_context, timeout=step.timeout)
+        self.logger.debug("SESSION智能体返回结果: %s", session_result)
+        context['workflow_data'][step.agent_type] = session_result
+        context['messages'] = session_result.get('choices', []) + context['messages']
+        context['last_response'] = session_result
+        await self._emit(context, 'step', {'step': step.agent_type, 'result': session_result})
+
+    async def _mission_step(
+        self,
+        step: StepPlan,
+        message: Message,
+        registry: RegistrySnapshot,
+        context: Dict[str, Any]
+    ) -> None:
+        """获取任务分发结果（优先命中路由缓存），未命中且开启推测执行时同时提前调用预测的FUNCTION智能体"""
+        cached = self._cached_mission(message, registry)
+        # 命中路由缓存时无需等待MISSION，推测调用没有可节省的时间
+        speculative = {} if cached else self._start_speculation(message, registry, context)
+        try:
+            mission_result, mission_plan = cached or await self._dispatch_mission(message, registry, context, step)
+        except BaseException:
+            self._discard_speculation(speculative)
+            raise
+        target_agents = mission_plan.get('target_agents', [])
+        if speculative:
+            self._discard_speculation({n: t for n, t in speculative.items() if n not in target_agents})
+            context['speculative'] = {n: t for n, t in speculative.items() if n in target_agents}
+        if self.speculator is not None:
+            self.speculator.record(message, target_agents)
+        context['workflow_data'][step.agent_type] = mission_result
+        context['mission_plan'] = mission_plan
+        context['last_response'] = mission_result
+        await self._emit(context, 'step', {'step': step.agent_type, 'result': mission_result})
+
+    def _start_speculation(
+        self,
+        message: Message,
+        registry: RegistrySnapshot,
+        context: Dict[str, Any]
+    ) -> Dict[str, asyncio.Task]:
+        """按预测提前调用FUNCTION智能体，返回智能体名称到推测调用任务的映射"""
+        function_step = context['plan'].step('FUNCTION')
+        if self.speculator is None or function_step is None or function_step.kind != 'function':
+            return {}
+
+        # 推测调用使用MISSION之前的上下文副本，不受后续步骤修改影响
+        spec_context = {
+            **context,
+            'messages': list(context['messages']),
+            'workflow_data': dict(context['workflow_data'])
+        }
+        tasks = {}
+        for name in self.speculator.predict(message, context['plan'].name):
+            agent = registry.find_agent(name, "FUNCTION")
+            if agent is None or not self.health_monitor.is_available(agent):
+                continue
+            if not self.speculator.try_acquire():
+                self.logger.debug("推测额度已耗尽，停止推测调用")
+                break
+            tasks[name] = asyncio.create_task(
+                self._process_step((agent,), spec_context, timeout=function_step.timeout)
+            )
+        if tasks:
+            self.logger.debug("推测调用FUNCTION智能体 | 名称: %s", list(tasks))
+        return tasks
+
+    def _discard_speculation(self, tasks: Optional[Dict[str, asyncio.Task]]) -> None:
+        """取消未被采用的推测调用"""
+        for task in (tasks or {}).values():
+            self.speculator.discard()
+            task.cancel()
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _adopt_speculation(
+        self,
+        task: asyncio.Task,
+        agent: Agent,
+        context: Dict[str, Any],
+        timeout: float
+    ) -> Dict[str, Any]:
+        """采用推测调用的结果，推测调用失败时按常规方式重新调用"""
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            task.cancel()
+            raise
+        except Exception as e:
+            self.speculator.discard()
+            self.logger.debug("推测调用失败，重新调用 | 智能体: %s | 错误: %s", agent.name, e)
+            return await self._process_step((agent,), context, timeout=timeout)
+        self.speculator.confirm()
+        return result
+
+    async def _function_step(
+        self,
+        step: StepPlan,
+        message: Message,
+        registry: RegistrySnapshot,
+        context: Dict[str, Any]
+    ) -> None:
+        """调用MISSION选出的功能智能体（按依赖关系分批，同批次并发执行）"""
+        mission_plan = context.get('mission_plan') or {}
+        target_agents = mission_plan.get('target_agents', [])
+        dependencies = mission_plan.get('dependencies') or {}
+
+        context['workflow_data'][step.agent_type] = {}  # 改为字典存储结果
+        await self._run_function_agents(target_agents, dependencies, registry, context, step)
+
+        if not target_agents:
+            self.logger.error("没有可用的功能智能体")
+            context['messages'].append(
                 {
-                    'name': agent.name,
-                    'type': agent.type,
-                    'capabilities': agent.properties.get('capability', '')
+                    "role": "assistant",
+                    "content": "没有可用的功能智能体"
                 }
-                for agent in function_agents
-            ]
+            )
 
-            # 3. 调用任务分发智能体
-            mission_agents = self.agent_registry.get_agents_by_type("MISSION")
-            if not mission_agents:
-                raise AgentCallError("No available MISSION agent")
+    async def _agent_step(
+        self,
+        step: StepPlan,
+        message: Message,
+        registry: RegistrySnapshot,
+        context: Dict[str, Any]
+    ) -> None:
+        """通用步骤：调用该类型的一个智能体，最终步骤在流式请求下逐个回调chunk"""
+        result = await self._process_step(
+            registry.get_agents_by_type(step.agent_type),
+            context,
+            timeout=step.timeout,
+            stream=step.is_final and context.get('on_event') is not None
+        )
+        context['workflow_data'][step.agent_type] = result
+        context['last_response'] = result
+        await self._emit(context, 'step', {'step': step.agent_type, 'result': result})
 
-            # 准备任务分发上下文
-            mission_context = {
-                **context,
-                "dynamic_prompt": "以下是当前活跃的功能智能体的名称和描述：\n" + "\n".join([f"{agent['name']}: {agent['capabilities']}" for agent in agent_descriptions])
+    async def _load_history(self, message: Message, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """从会话存储读取历史，SESSION智能体据session_history='local'跳过历史重建"""
+        if self.session_store is None or not message.session_id:
+            return []
+        with tracing.span('session.load'):
+            history = await self.session_store.get(message.session_id)
+        context['session_history'] = 'local'
+        return history
+
+    async def _save_history(self, message: Message, final_response: Dict[str, Any]) -> None:
+        """将本轮用户消息与最终回复追加到会话存储，存储失败不影响本次请求"""
+        if self.session_store is None or not message.session_id:
+            return
+        turn = [{'role': 'user', 'content': message.content}]
+        try:
+            turn.append(dict(self._get_response_messages(final_response)))
+        except Exception:
+            pass
+        try:
+            with tracing.span('session.save'):
+                await self.session_store.append(message.session_id, turn)
+        except Exception as e:
+            self.logger.warning("会话历史保存失败 | 会话: %s | 错误: %s", message.session_id, e)
+
+    def _cached_mission(
+        self,
+        message: Message,
+        registry: RegistrySnapshot
+    ) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """查询路由缓存，命中时返回MISSION原始响应及解析后的分发计划"""
+        if not self.routing_cache:
+            return None
+        cached = self.routing_cache.get(message.content, registry.fingerprint("FUNCTION"))
+        if cached is not None:
+            self.logger.debug("命中路由缓存，跳过MISSION调用")
+        return cached
+
+    async def _dispatch_mission(
+        self,
+        message: Message,
+        registry: RegistrySnapshot,
+        context: Dict[str, Any],
+        step: StepPlan
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        调用任务分发智能体获取目标功能智能体。
+
+        Returns:
+            Tuple[Dict[str, Any], Dict[str, Any]]: MISSION原始响应及解析后的分发计划
+        """
+        mission_agents = registry.get_agents_by_type(step.agent_type)
+        if not mission_agents:
+            raise AgentCallError("No available MISSION agent")
+
+        # 获取可用的功能智能体描述
+        agent_descriptions = [
+            {
+                'name': agent.name,
+                'type': agent.type,
+                'capabilities': agent.properties.get('capability', '')
             }
-            mission_result = await self._process_step(mission_agents[0], mission_context, timeout=10)
-            context['workflow_data']['MISSION'] = mission_result
-            try:
-                target_agents = json.loads(self._get_response_content(mission_result)).get('target_agents', [])
-            except Exception as e:
-                self.logger.error(f"任务分发结果解析失败: {mission_result}\n{str(e)}")
-                raise e
+            for agent in registry.get_agents_by_type("FUNCTION")
+        ]
+
+        # 准备任务分发上下文
+        mission_context = {
+            **context,
+            "dynamic_prompt": "以下是当前活跃的功能智能体的名称和描述：\n" + "\n".join([f"{agent['name']}: {agent['capabilities']}" for agent in agent_descriptions])
+        }
+        mission_result = await self._process_step(mission_agents, mission_context, timeout=step.timeout)
+        try:
+            mission_plan = codec.loads(self._get_response_content(mission_result))
+        except Exception as e:
+            self.logger.error("任务分发结果解析失败: %s\n%s", mission_result, e)
+            raise e
+
+        if self.routing_cache:
+            self.routing_cache.put(message.content, registry.fingerprint("FUNCTION"), (mission_result, mission_plan))
+        return mission_result, mission_plan
+
+    def _plan_function_waves(self, target_agents: List[str], dependencies: Dict[str, List[str]]) -> List[List[str]]:
+        """
+        根据MISSION给出的依赖关系将目标智能体划分为可并发执行的批次。
+
+        Args:
+            target_agents: MISSION返回的目标智能体列表
+            dependencies: 智能体名称到其前置智能体列表的映射，不在target_agents中的依赖会被忽略
+
+        Returns:
+            List[List[str]]: 按执行顺序排列的批次，批次内保持target_agents中的顺序
+        """
+        targets = list(dict.fromkeys(target_agents))  # 去重并保持顺序
+        pending = {
+            name: {dep for dep in dependencies.get(name, []) if dep in targets and dep != name}
+            for name in targets
+        }
+        waves = []
+        done = set()
+        while pending:
+            wave = [name for name in targets if name in pending and pending[name] <= done]
+            if not wave:
+                raise WorkflowConfigError(f"Circular FUNCTION dependencies: {sorted(pending)}")
+            waves.append(wave)
+            done.update(wave)
+            for name in wave:
+                del pending[name]
+        return waves
+
+    async def _run_function_agents(
+        self,
+        target_agents: List[str],
+        dependencies: Dict[str, List[str]],
+        registry: RegistrySnapshot,
+        context: Dict[str, Any],
+        step: StepPlan
+    ) -> None:
+        """执行功能智能体，结果按批次及批次内target_agents顺序写入workflow_data与messages"""
+        timeout = step.timeout
 
-            # 4. 按顺序调用功能智能体
-            function_agents = self.agent_registry.get_agents_by_type("FUNCTION")
-            context['workflow_data']['FUNCTION'] = {}  # 改为字典存储结果
+        if step.execution == 'parallel':
+            waves = self._plan_function_waves(target_agents, dependencies)
+        else:
+            waves = [[name] for name in target_agents]
 
-            for agent_name in target_agents:
-                agent = next((a for a in function_agents if a.name == agent_name), None)
+        for index, wave in enumerate(waves):
+            # 只有第一批（无前置依赖）的智能体可以采用推测调用的结果
+            speculative = (context.pop('speculative', None) or {}) if index == 0 else {}
+            agents = []
+            for agent_name in wave:
+                agent = registry.find_agent(agent_name, "FUNCTION")
                 if not agent:
-                    self.logger.error(f"没有找到功能智能体: {agent_name}")
+                    self.logger.error("没有找到功能智能体: %s", agent_name)
+                    continue
+                if not self.health_monitor.is_available(agent):
+                    self.logger.error("功能智能体熔断中，跳过: %s", agent_name)
                     continue
+                agents.append(agent)
+            selected = {agent.name for agent in agents}
+            self._discard_speculation({n: t for n, t in speculative.items() if n not in selected})
+            if not agents:
+                continue
 
-                function_result = await self._process_step(agent, context, timeout=15)
-                context['workflow_data']['FUNCTION'][agent_name] = function_result  # 按名称存储
-                logger.debug("function_result: %s", self._get_response_messages(function_result))
-                context['messages'].append(self._get_response_messages(function_result))
-
-            if not target_agents:
-                self.logger.error("没有可用的功能智能体")
-                context['messages'].append(
-                    {
-                        "role": "assistant",
-                        "content": "没有可用的功能智能体"
-                    }
+            # 同一批次内的智能体共享批次开始时的上下文，批次结束后再统一合并结果
+            tasks = [
+                asyncio.create_task(
+                    self._adopt_speculation(speculative[agent.name], agent, context, timeout)
+                    if agent.name in speculative
+                    else self._process_step((agent,), context, timeout=timeout)
                 )
+                for agent in agents
+            ]
+            try:
+                results = await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                raise
 
-            # 5. 最后调用检查智能体
-            checker_agents = self.agent_registry.get_agents_by_type("CHECKER")
-            if not checker_agents:
-                raise AgentCallError("No available CHECKER agent")
-
-            checker_result = await self._process_step(checker_agents[0], context, timeout=5)
+            for agent, function_result in zip(agents, results):
+                context['workflow_data']['FUNCTION'][agent.name] = function_result  # 按名称存储
+                context['last_response'] = function_result
+                function_message = self._get_response_messages(function_result)
+                self.logger.debug("function_result: %s", function_message)
+                context['messages'].append(function_message)
+                await self._emit(context, 'step', {'step': 'FUNCTION', 'agent': agent.name, 'result': function_result})
 
-            # 新增CHECKER结果存储
-            context['workflow_data']['CHECKER'] = checker_result  # 关键修复点
+    async def _emit(self, context: Dict[str, Any], event: str, data: Dict[str, Any]) -> None:
+        """向调用方回调工作流进度事件"""
+        on_event = context.get('on_event')
+        if on_event is not None:
+            await on_event(event, data)
 
-            # 最终返回结果处理
-            final_result = {
-                "id": f"chatcmpl-{uuid.uuid4()}",
-                **checker_result,  # 包含OpenAI标准字段
-                "system": {
-                    **context['workflow_data'],
-                }
-            }
-            return final_result
+    def _build_payload(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """构建发送给智能体的请求体"""
+        return {
+            "model": context.get('model', 'workflow-1.0'),
+            "dynamic_prompt": context.get('dynamic_prompt', ''),
+            "messages": context['messages'],
+            "user_id": context.get('user_id'),
+            "session_id": context.get('session_id'),
+            **({"session_history": context['session_history']} if 'session_history' in context else {}),
+            "workflow_data": context['workflow_data'],
+            "current_step": context['current_step']
+        }
 
-        except Exception as e:
-            self.logger.error(f"Workflow error: {str(e)}", exc_info=True)
-            raise
+    async def _process_step(
+        self,
+        agents: Sequence[Agent],
+        context: Dict[str, Any],
+        timeout: int,
+        stream: bool = False
+    ) -> Dict[str, Any]:
+        """
+        处理单个工作流步骤，由负载均衡器从健康的候选智能体中选择实际调用的智能体。
 
-    async def _process_step(self, agent: Agent, context: Dict[str, Any], timeout: int) -> Dict[str, Any]:
-        """处理单个工作流步骤"""
-        self.logger.debug(
-            f"调用上下文 | 用户: {context.get('user_id', 'unknown')} "
-            f"| 当前步骤: {context['current_step']} "
-            f"| 工作流数据键: {list(context['workflow_data'].keys())}"
-        )
-        self.logger.debug(
-            f"调用智能体服务 | 名称: {agent.name} "
-            f"| 类型: {agent.type} "
-            f"| 端点: {agent.service_endpoint}"
+        stream为True且选中的智能体声明了stream属性时，走流式读取路径并将chunk作为事件回调。
+        """
+        candidates = self.health_monitor.filter_available(agents)
+        if not candidates:
+            raise AgentCallError(f"No healthy agent among: {[a.name for a in agents]}")
+        agent = self.balancer.choose(candidates, self.agent_client)
+        # 半开状态的智能体只放行这一个试探请求；对冲副本只发往熔断器关闭的智能体
+        trial = self.health_monitor.acquire(agent)
+        candidates = [a for a in candidates if a is agent or self.health_monitor.is_closed(a)]
+        chosen = agent
+        deadline: Deadline = context['deadline']
+        timeout = deadline.budget(timeout)  # 步骤超时不超过请求剩余时间
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(
+                "调用上下文 | 用户: %s | 当前步骤: %s | 工作流数据键: %s",
+                context.get('user_id', 'unknown'), context['current_step'], list(context['workflow_data'])
+            )
+            self.logger.debug(
+                "调用智能体服务 | 名称: %s | 类型: %s | 端点: %s",
+                agent.name, agent.type, agent.service_endpoint
+            )
+        payload = project_payload(
+            self._build_payload(context),
+            resolve_projection(agent, WORKFLOW_CONFIG['projections'])
         )
         try:
-            result = await self.agent_client.call_service(
-                agent,
-                {
-                    "model": context.get('model', 'workflow-1.0'),
-                    "dynamic_prompt": context.get('dynamic_prompt', ''),
-                    "messages": context['messages'],
-                    "user_id": context.get('user_id'),
-                    "session_id": context.get('session_id'),
-                    "workflow_data": context['workflow_data'],
-                    "current_step": context['current_step']
-                },
-                timeout=timeout
-            )
-            self.logger.debug(f"智能体调用成功 | 名称: {agent.name} | 响应: {result}")
+            with tracing.span(f'step.{agent.type}', agent=agent.name):
+                agent, result = await self._call_agent(agent, candidates, payload, context, timeout, deadline, stream)
+            self.health_monitor.record_success(agent)
+            self.logger.debug("智能体调用成功 | 名称: %s | 响应: %s", agent.name, result)
             return result
+        except DeadlineExceededError:
+            # 请求自身的时间预算耗尽不代表智能体故障，不计入熔断
+            self.logger.warning("请求截止时间已到 | 智能体: %s", agent.name)
+            raise
         except Exception as e:
-            self.logger.error(
-                f"智能体调用失败 | 名称: {agent.name} "
-                f"| 错误: {str(e)}",
-                exc_info=True
-            )
+            self.health_monitor.record_failure(agent)
+            self.logger.error("智能体调用失败 | 名称: %s | 错误: %s", agent.name, e, exc_info=True)
             raise
+        finally:
+            if trial:
+                # 试探请求未记录结果（截止时间耗尽、被取消或由对冲副本应答）时归还试探名额
+                self.health_monitor.release(chosen)
+
+    async def _call_agent(
+        self,
+        agent: Agent,
+        candidates: Sequence[Agent],
+        payload: Dict[str, Any],
+        context: Dict[str, Any],
+        timeout: float,
+        deadline: Deadline,
+        stream: bool
+    ) -> Tuple[Agent, Dict[str, Any]]:
+        """按流式或对冲方式调用智能体，返回实际应答的智能体及其响应"""
+        if stream and agent.properties.get('stream'):
+            result = await self.agent_client.stream_service(
+                agent,
+                payload,
+                lambda chunk: self._emit(context, 'chunk', chunk),
+                timeout=timeout,
+                deadline=deadline
+            )
+            return agent, result
+        return await self.agent_client.call_hedged(
+            agent,
+            [a for a in candidates if a is not agent],
+            payload,
+            timeout=timeout,
+            deadline=deadline
+        )
+
+    async def stream_message(
+        self,
+        message: Message,
+        deadline: Optional[Deadline] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        以事件流形式处理用户消息。
+
+        依次产出(step, ...)、(chunk, ...)事件，最后产出(completion, 最终结果)；
+        工作流失败时产出(error, {'message': ...})。
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def on_event(event: str, data: Dict[str, Any]) -> None:
+            await queue.put((event, data))
+
+        async def run() -> None:
+            try:
+                result = await self.process_message(message, deadline=deadline, on_event=on_event)
+                await queue.put(('completion', result))
+            except Exception as e:
+                await queue.put(('error', {'message': str(e), 'error_type': type(e).__name__}))
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await queue.get()
+                yield event, data
+                if event in ('completion', 'error'):
+                    break
+        finally:
+            if not task.done():
+                task.cancel()
 
     async def close(self):
         """关闭所有网络资源"""
-        await self.agent_client.close()
\ No newline at end of file
+        await self.health_monitor.stop()
+        for task in list(self._deferred_tasks):
+            task.cancel()
+        await asyncio.gather(*self._deferred_tasks, return_exceptions=True)
+        await self.deferred_store.close()
+        refresh = self._plans_refresh
+        if refresh is not None:
+            refresh.cancel()
+            await asyncio.gather(refresh, return_exceptions=True)
+        if self.workflow_store is not None:
+            await self.workflow_store.close()
+        await self.agent_client.close()
+        if self.session_store is not None:
+            await self.session_store.close()
\ No newline at end of file
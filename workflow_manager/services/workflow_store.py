@@ -0,0 +1,77 @@
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+from ..utils.exceptions import WorkflowConfigError
+from ..utils.sqlite import SQLiteExecutor, prepare_path, require_shared_backend
+from ..utils import codec
+
+class WorkflowStore:
+    """
+    同一主机上各worker共享的命名工作流配置（SQLite，WAL模式），重启后仍然可用。
+
+    /workflow/reload保存新配置并递增版本计数器；各worker最多每check_interval秒读取一次
+    版本计数器，版本变化时才读取配置并重新编译工作流。数据库操作在后台线程中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.version = 0        # 本worker已应用的配置版本，0表示尚未保存过配置
+        self._checked_at = float('-inf')
+        self._db = SQLiteExecutor(path, (
+            "CREATE TABLE IF NOT EXISTS workflow_config ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL, workflows BLOB NOT NULL)",
+        ), thread_name_prefix='workflow-store')
+
+    def due(self) -> bool:
+        """距上次检查已超过check_interval秒时返回True，并将本次记为最近一次检查"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return False
+        self._checked_at = now
+        return True
+
+    async def poll(self) -> Optional[Dict[str, Any]]:
+        """其他worker保存了新配置时返回该配置，否则返回None"""
+        def read(conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+            row = conn.execute("SELECT version FROM workflow_config WHERE id = 1").fetchone()
+            if row is None or row[0] == self.version:
+                return None
+            version, workflows = conn.execute(
+                "SELECT version, workflows FROM workflow_config WHERE id = 1"
+            ).fetchone()
+            self.version = version
+            return codec.loads(workflows)
+        return await self._db.run(read)
+
+    async def save(self, workflows: Dict[str, Any]) -> int:
+        """保存命名工作流配置并返回新版本号"""
+        def write(conn: sqlite3.Connection) -> int:
+            with SQLiteExecutor.transaction(conn):
+                conn.execute(
+                    "INSERT INTO workflow_config (id, version, workflows) VALUES (1, 1, ?) "
+                    "ON CONFLICT (id) DO UPDATE SET version = version + 1, workflows = excluded.workflows",
+                    (codec.dumps(workflows),)
+                )
+                self.version = conn.execute("SELECT version FROM workflow_config WHERE id = 1").fetchone()[0]
+            return self.version
+        return await self._db.run(write)
+
+    async def close(self) -> None:
+        """关闭数据库连接"""
+        await self._db.close()
+
+def create_workflow_store(config: Dict[str, Any]) -> Optional[WorkflowStore]:
+    """
+    按配置创建命名工作流的共享存储，memory后端返回None（工作流只保存在本worker内）。
+
+    Raises:
+        WorkflowConfigError: 未知后端，或多个worker时使用memory后端
+    """
+    backend = config.get('backend', 'memory')
+    require_shared_backend('Workflow store', backend)
+    if backend == 'memory':
+        return None
+    if backend == 'sqlite':
+        return WorkflowStore(prepare_path(config['path']), config['check_interval'])
+    raise WorkflowConfigError(f"Unknown workflow store backend: {backend}")
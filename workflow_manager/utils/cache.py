@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+class TTLCache:
+    """带过期时间的LRU缓存，非线程安全，仅在事件循环线程内使用"""
+
+    def __init__(self, max_size: int, ttl: Optional[float]):
+        self.max_size = max_size
+        self.ttl = ttl  # 过期时间(秒)，None表示不过期
+        self._data: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取缓存，命中时刷新LRU顺序"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        value, expires_at = item
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """写入缓存，超过容量时淘汰最久未使用的条目"""
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """删除并返回缓存条目"""
+        item = self._data.pop(key, None)
+        return default if item is None else item[0]
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        item = self._data.get(key)
+        return item is not None and (item[1] is None or item[1] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def values(self) -> List[Any]:
+        """所有未过期条目的值"""
+        now = time.monotonic()
+        return [value for value, expires_at in self._data.values() if expires_at is None or expires_at > now]
+
+    def stats(self) -> Dict[str, int]:
+        """命中统计"""
+        return {'size': len(self._data), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,120 @@
+import json
+from typing import Any, Optional, Union
+
+try:
+    import orjson  # 可选依赖，安装后自动启用更快的编解码
+except ImportError:  # pragma: no cover - 取决于运行环境
+    orjson = None
+
+CODEC_NAME = 'orjson' if orjson is not None else 'json'
+
+def dumps(obj: Any) -> bytes:
+    """编码为UTF-8 JSON字节串"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def loads(data: Union[bytes, str]) -> Any:
+    """解码JSON"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+_MUTABLE = (dict, list)
+
+class RawJSON(dict):
+    """
+    保留原始响应字节的字典。
+
+    智能体响应解析后以RawJSON形式在工作流中传递，最终编码时直接拼接raw字节，
+    避免重复编码；任何修改操作都会丢弃raw，保证输出与字典内容一致。
+    嵌套的dict/list被取出后可能被原地修改，取出时同样丢弃raw。
+    """
+
+    def __init__(self, data: dict, raw: Optional[bytes] = None):
+        super().__init__(data)
+        self.raw = raw
+
+    def _invalidate(self) -> None:
+        self.raw = None
+
+    def _hand_out(self, value):
+        """取出嵌套容器时丢弃raw"""
+        if isinstance(value, _MUTABLE):
+            self.raw = None
+        return value
+
+    def _hand_out_all(self) -> None:
+        if self.raw is not None and any(isinstance(value, _MUTABLE) for value in super().values()):
+            self.raw = None
+
+    def __getitem__(self, key):
+        return self._hand_out(super().__getitem__(key))
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self._hand_out(super().__getitem__(key))
+
+    def values(self):
+        self._hand_out_all()
+        return super().values()
+
+    def items(self):
+        self._hand_out_all()
+        return super().items()
+
+    def __setitem__(self, key, value):
+        self._invalidate()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._invalidate()
+        super().__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        self._invalidate()
+        super().update(*args, **kwargs)
+
+    def __ior__(self, other):
+        self._invalidate()
+        return super().__ior__(other)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._invalidate()
+        return self._hand_out(super().setdefault(key, default))
+
+    def pop(self, *args):
+        self._invalidate()
+        return super().pop(*args)
+
+    def popitem(self):
+        self._invalidate()
+        return super().popitem()
+
+    def clear(self):
+        self._invalidate()
+        super().clear()
+
+def loads_raw(data: bytes) -> Any:
+    """解码JSON，顶层为对象时返回携带原始字节的RawJSON"""
+    parsed = loads(data)
+    if isinstance(parsed, dict):
+        return RawJSON(parsed, data)
+    return parsed
+
+def encode(obj: Any) -> bytes:
+    """
+    编码为JSON字节串，RawJSON直接拼接原始字节。
+
+    仅在普通dict中向下查找RawJSON（工作流结果的system块均为dict嵌套），
+    列表与其他值整体交给dumps编码。
+    """
+    if isinstance(obj, RawJSON) and obj.raw is not None:
+        return obj.raw
+    if type(obj) is dict or isinstance(obj, RawJSON):
+        return b'{' + b','.join(
+            dumps(str(key)) + b':' + encode(value) for key, value in obj.items()
+        ) + b'}'
+    return dumps(obj)
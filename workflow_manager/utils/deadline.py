@@ -0,0 +1,40 @@
+import time
+from typing import Optional
+from .exceptions import DeadlineExceededError
+
+class Deadline:
+    """请求截止时间，在API入口创建并沿工作流各步骤传递"""
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at  # 基于time.monotonic()的截止时刻
+
+    @classmethod
+    def after(cls, seconds: float) -> 'Deadline':
+        """创建距当前seconds秒后的截止时间"""
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        """剩余时间(秒)，已过期时返回0"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        """是否已过期"""
+        return self.remaining() <= 0
+
+    def child(self, timeout: Optional[float]) -> 'Deadline':
+        """派生一个不晚于当前截止时间、且最多timeout秒的子截止时间"""
+        if timeout is None:
+            return self
+        return Deadline(min(self.expires_at, time.monotonic() + timeout))
+
+    def budget(self, timeout: Optional[float] = None) -> float:
+        """计算下一步可用的时间预算，已无剩余时间时抛出DeadlineExceededError"""
+        remaining = self.child(timeout).remaining()
+        if remaining <= 0:
+            raise DeadlineExceededError("Request deadline exceeded")
+        return remaining
+
+    def to_header(self) -> str:
+        """转换为通知智能体的绝对截止时间（Unix毫秒时间戳）"""
+        return str(int((time.time() + self.remaining()) * 1000))
@@ -16,4 +16,19 @@ class AgentCallError(WorkflowException):
 
 class WorkflowConfigError(WorkflowException):
     """工作流配置错误"""
-    pass
\ No newline at end of file
+    pass
+
+class DeadlineExceededError(WorkflowException):
+    """请求截止时间已到异常"""
+    pass
+
+class IdempotencyConflictError(WorkflowException):
+    """幂等键已用于内容不同的请求异常"""
+    pass
+
+class OverloadedError(WorkflowException):
+    """服务过载拒绝请求异常"""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after  # 建议客户端重试的等待时间(秒)
@@ -1,12 +1,17 @@
+import atexit
+import copy
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from datetime import datetime
 
 LOG_LEVEL_DEFAULT = 'INFO'
 LOG_DIR_DEFAULT = 'logs'
 LOG_FILE_SIZE_DEFAULT = '50M'
 LOG_BACKUP_COUNT_DEFAULT = 5
+LOG_DEBUG_SAMPLE_RATE_DEFAULT = 1.0
 
 # 缓冲区，用于存储在logger实例创建前需要记录的日志消息
 _log_buffer_for_setup_logger = []
@@ -40,6 +45,55 @@ def parse_log_file_size(size_str: str) -> int:
         })
         return parse_log_file_size(LOG_FILE_SIZE_DEFAULT)  # 默认返回50MB
 
+class DebugSamplingFilter(logging.Filter):
+    """按比例采样DEBUG日志，INFO及以上级别全部保留"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    只负责将日志记录放入队列的handler。
+
+    调用线程中只将参数合并进消息（日志参数可能是之后仍会被修改的对象，必须在此时取值），
+    按格式模板排版、异常堆栈格式化、文件写入与轮转全部交给QueueListener的后台线程完成。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+# 后台日志线程，进程退出时刷新剩余日志
+_queue_listener = None
+
+def _stop_queue_listener():
+    if _queue_listener is not None:
+        _queue_listener.stop()
+
+atexit.register(_stop_queue_listener)
+
+def parse_debug_sample_rate(rate_str: str) -> float:
+    """解析DEBUG日志采样率，取值范围[0, 1]"""
+    try:
+        rate = float(rate_str)
+        if not 0 <= rate <= 1:
+            raise ValueError("采样率必须在0到1之间")
+        return rate
+    except ValueError as e:
+        _log_buffer_for_setup_logger.append({
+            'level': 'warning',
+            'message': f"LOG_DEBUG_SAMPLE_RATE无效，使用默认值{LOG_DEBUG_SAMPLE_RATE_DEFAULT}。错误信息: {e}"
+        })
+        return LOG_DEBUG_SAMPLE_RATE_DEFAULT
+
 def setup_logger(name='workflow'):
     """
     配置logger
@@ -131,9 +185,23 @@ def setup_logger(name='workflow'):
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
 
+    # 文件与控制台处理器运行在后台线程，事件循环线程只负责入队
+    global _queue_listener
+    log_queue = queue.SimpleQueue()
+    _queue_listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _queue_listener.start()
+
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.setLevel(log_level)
+    sample_rate = parse_debug_sample_rate(os.getenv('LOG_DEBUG_SAMPLE_RATE', str(LOG_DEBUG_SAMPLE_RATE_DEFAULT)))
+    queue_handler.addFilter(DebugSamplingFilter(sample_rate))
+    _log_buffer_for_setup_logger.append({
+        'level': 'info',
+        'message': f"LOG_DEBUG_SAMPLE_RATE: {sample_rate}"
+    })
+
     # 添加处理器
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    logger.addHandler(queue_handler)
 
     return logger
 
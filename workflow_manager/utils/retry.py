@@ -0,0 +1,59 @@
+import random
+import time
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    计算第attempt次重试前的退避时间（指数退避 + full jitter）。
+
+    Args:
+        attempt: 重试序号，从0开始
+        base_delay: 基础退避时间(秒)
+        max_delay: 退避时间上限(秒)
+
+    Returns:
+        float: 本次需要等待的秒数
+    """
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+class RetryBudget:
+    """
+    全局重试预算，限制重试量占调用量的比例，避免重试在故障期间放大流量。
+
+    每次调用存入ratio个令牌，每次重试消耗1个令牌；另按min_per_second
+    随时间补充令牌，保证低流量时也能进行少量重试。
+    """
+
+    def __init__(self, ratio: float, min_per_second: float = 1.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self.tokens = min_per_second
+        self._last_refill = time.monotonic()
+        self.calls = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.max_tokens, self.tokens + (now - self._last_refill) * self.min_per_second)
+        self._last_refill = now
+
+    def record_call(self) -> None:
+        """记录一次新调用（不含重试）"""
+        self.calls += 1
+        self._refill()
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """尝试为一次重试获取令牌"""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.retries += 1
+            return True
+        self.rejected += 1
+        return False
+
+    def refund(self) -> None:
+        """归还一个已获取的令牌（如推测调用的结果最终被采用，未造成浪费）"""
+        self.tokens = min(self.max_tokens, self.tokens + 1)
@@ -0,0 +1,45 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+class SingleFlight:
+    """
+    相同键的并发调用共享同一次执行：首个调用方发起执行，之后到达的调用方等待同一结果。
+
+    执行在独立任务中进行，单个调用方超时或取消不会中断其他调用方正在等待的执行。
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.executions = 0     # 实际执行次数
+        self.shared = 0         # 复用在途执行的调用次数
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        执行或加入键为key的在途执行。
+
+        Raises:
+            asyncio.TimeoutError: 在timeout秒内未完成（执行本身继续进行）
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.create_task(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+            # 所有调用方都已放弃时避免"exception was never retrieved"警告
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            self.shared += 1
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, int]:
+        """执行与复用统计"""
+        return {'inflight': len(self._inflight), 'executions': self.executions, 'shared': self.shared}
@@ -0,0 +1,83 @@
+import asyncio
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Sequence
+from ..config import WORKERS
+from .exceptions import WorkflowConfigError
+
+def require_shared_backend(name: str, backend: str) -> None:
+    """
+    多个worker时拒绝进程内（memory）后端：请求可能落到任意worker，各worker的数据互不可见。
+
+    Raises:
+        WorkflowConfigError: WEB_CONCURRENCY > 1且backend为memory
+    """
+    if backend == 'memory' and WORKERS > 1:
+        raise WorkflowConfigError(
+            f"{name} backend 'memory' is per-process and cannot be used with {WORKERS} workers, use 'sqlite'"
+        )
+
+def prepare_path(path: str) -> str:
+    """创建数据库文件所在目录并返回路径"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    return path
+
+def expired_before(ttl: Optional[float]) -> float:
+    """更新时间早于（含）该时间戳的记录已过期，ttl为None时永不过期"""
+    return time.time() - ttl if ttl is not None else float('-inf')
+
+class SQLiteExecutor:
+    """
+    在单个后台线程中串行执行SQLite操作，不阻塞事件循环。
+
+    数据库使用WAL模式，同一主机上的多个worker进程可以共享同一个数据库文件；
+    连接为自动提交模式，需要原子读改写的操作使用transaction()开启写事务。
+    """
+
+    def __init__(self, path: str, schema: Sequence[str], thread_name_prefix: str = 'sqlite'):
+        self.path = path
+        self._schema = schema
+        self._thread_name_prefix = thread_name_prefix
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            for statement in self._schema:
+                self._conn.execute(statement)
+        return self._conn
+
+    async def run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        """在后台线程中以数据库连接调用fn并返回其结果"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self._thread_name_prefix)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: fn(self._connect()))
+
+    @staticmethod
+    @contextmanager
+    def transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+        """BEGIN IMMEDIATE写事务：进入时取得跨进程写锁，正常退出提交，异常时回滚"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    async def close(self) -> None:
+        """关闭连接与后台线程"""
+        def shutdown(conn: sqlite3.Connection) -> None:
+            conn.close()
+        if self._conn is not None:
+            await self.run(shutdown)
+            self._conn = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,120 @@
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+def _new_id(num_bytes: int) -> str:
+    return os.urandom(num_bytes).hex()
+
+@dataclass
+class Span:
+    """时间线上的一段耗时记录"""
+    name: str
+    start: float                    # 相对请求开始的偏移(秒)
+    span_id: str = field(default_factory=lambda: _new_id(8))
+    duration: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'start_ms': round(self.start * 1000, 3),
+            'duration_ms': None if self.duration is None else round(self.duration * 1000, 3),
+            **({'attributes': self.attributes} if self.attributes else {})
+        }
+
+class Trace:
+    """单个请求的耗时时间线，trace_id同时用于W3C traceparent请求头"""
+
+    def __init__(self, name: str = 'process_message', attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.trace_id = _new_id(16)
+        self.root_span_id = _new_id(8)
+        self.attributes = attributes or {}
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self.duration: Optional[float] = None
+        self.spans: List[Span] = []
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """记录一段耗时，异常时记录错误类型后继续抛出"""
+        span = Span(name=name, start=self.elapsed(), attributes=attributes)
+        self.spans.append(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.attributes['error'] = type(e).__name__
+            raise
+        finally:
+            span.duration = self.elapsed() - span.start
+
+    def traceparent(self, span_id: Optional[str] = None) -> str:
+        """生成W3C traceparent请求头"""
+        return f"00-{self.trace_id}-{span_id or self.root_span_id}-01"
+
+    def finish(self) -> None:
+        """结束时间线"""
+        if self.duration is None:
+            self.duration = self.elapsed()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': None if self.duration is None else round(self.duration * 1000, 3),
+            **({'attributes': self.attributes} if self.attributes else {}),
+            'spans': [span.to_dict() for span in self.spans]
+        }
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('workflow_trace', default=None)
+
+def current_trace() -> Optional[Trace]:
+    """获取当前上下文的时间线，asyncio任务会继承创建时的上下文"""
+    return _current_trace.get()
+
+@contextmanager
+def start_trace(name: str = 'process_message', **attributes) -> Iterator[Trace]:
+    """开始一个新的请求时间线并设为当前上下文"""
+    trace = Trace(name, attributes)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.finish()
+        _current_trace.reset(token)
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Span]]:
+    """在当前时间线上记录一段耗时，没有时间线时不做任何事"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name, **attributes) as current:
+        yield current
+
+class TraceBuffer:
+    """最近完成请求的时间线环形缓冲区"""
+
+    def __init__(self, max_size: int):
+        self._traces: deque = deque(maxlen=max_size)
+
+    def add(self, trace: Trace) -> None:
+        self._traces.append(trace)
+
+    def slowest(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """按耗时倒序返回最慢的limit个请求"""
+        traces = sorted(self._traces, key=lambda t: t.duration or 0, reverse=True)
+        return [trace.to_dict() for trace in traces[:limit]]
+
+    def __len__(self) -> int:
+        return len(self._traces)